@@ -1,7 +1,15 @@
 from django.contrib import admin
-from .models import Job, Metric, Measurement, VersionedPackage
+from .models import Job, Metric, Measurement, PackageVersion, Manifest
+
+
+class ManifestAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'size')
+    # a manifest has hundreds of versions out of a large catalog
+    raw_id_fields = ('versions',)
+
 
 admin.site.register(Job)
 admin.site.register(Metric)
 admin.site.register(Measurement)
-admin.site.register(VersionedPackage)
+admin.site.register(PackageVersion)
+admin.site.register(Manifest, ManifestAdmin)
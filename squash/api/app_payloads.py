@@ -0,0 +1,102 @@
+"""Pre-rendered payloads of the apps endpoint.
+
+The data of the squash-bokeh apps for a (ci_id, ci_dataset, metric) is the
+metadata of the measurement and the data blobs it references. It does not
+change once the job is written, so it is rendered to JSON and compressed
+once, on first access or by the `warm_app_cache` command, and stored in the
+shared cache under a key that does not depend on the data generation: the
+ingestion of other jobs does not invalidate it. The payloads of a job are
+deleted when the job or its measurements are saved or deleted, see
+api/signals.py.
+
+A warm request is a single cache lookup, the compressed payload is returned
+as is to the clients accepting gzip.
+"""
+import gzip
+import hashlib
+import json
+
+from rest_framework.renderers import JSONRenderer
+
+from .blobstore import load_blob_data
+from .cache import get_cache
+from .models import Job, Measurement
+from .utils import load_json
+
+PAYLOAD_KEY = 'squash:app-payload:{}'
+
+# blobs referenced by the metadata of the measurements
+BLOB_NAMES = ('matchedDataset', 'photomModel', 'astromModel')
+
+
+def get_payload_key(ci_id, ci_dataset, metric):
+    # the values come from the query string, the digest is a valid key for
+    # every cache backend
+    values = json.dumps([ci_id, ci_dataset, metric]).encode('utf-8')
+    return PAYLOAD_KEY.format(hashlib.sha256(values).hexdigest())
+
+
+def get_app_data(ci_id, ci_dataset, metric):
+    """Return the data of the apps, empty if the measurement does not exist
+    or has no metadata"""
+
+    data = {}
+
+    # sliced rather than fetched with first(), which would sort by id
+    metadata = Measurement.objects.\
+        filter(metric=metric, job__ci_id=ci_id, job__ci_dataset=ci_dataset).\
+        values_list('metadata', flat=True)[:1]
+
+    if not metadata or not metadata[0]:
+        return data
+
+    metadata = load_json(metadata[0])
+    blob_ids = metadata.pop('blobs')
+    data['metadata'] = metadata
+
+    blobs = Job.objects.filter(ci_id=ci_id, ci_dataset=ci_dataset).\
+        values_list('blobs', flat=True)[:1]
+
+    if blobs and blobs[0]:
+        for blob in load_json(blobs[0]):
+            # blob data is read from the blob store
+            for name in BLOB_NAMES:
+                if blob['identifier'] == blob_ids[name]:
+                    data[name] = load_blob_data(blob)
+                    break
+
+    return data
+
+
+def render_payload(data):
+    """Return the JSON of the app data compressed with gzip"""
+    return gzip.compress(JSONRenderer().render(data))
+
+
+def get_payload(ci_id, ci_dataset, metric):
+    """Return the compressed payload of the apps, built and cached on first
+    access, or None if there is no data"""
+
+    cache = get_cache()
+    key = get_payload_key(ci_id, ci_dataset, metric)
+
+    payload = cache.get(key)
+
+    if payload is None:
+        data = get_app_data(ci_id, ci_dataset, metric)
+
+        # not cached, the job may not be ingested yet
+        if not data:
+            return None
+
+        payload = render_payload(data)
+        cache.set(key, payload)
+
+    return payload
+
+
+def delete_payloads(ci_id, ci_dataset, metrics):
+    """Delete the cached payloads of the measurements of a job"""
+
+    get_cache().delete_many([get_payload_key(ci_id, ci_dataset, metric)
+                             for metric in metrics])
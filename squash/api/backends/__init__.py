@@ -0,0 +1,2 @@
+"""Database backends with health-checked persistent connections, see
+api/db_pool.py"""
@@ -0,0 +1,7 @@
+from django.db.backends.mysql import base
+
+from api.db_pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,199 @@
+"""Content-addressed store for the data blobs produced by the jobs.
+
+Blobs are stored on the local filesystem under ``SQUASH_BLOB_ROOT`` and
+keyed by the SHA-256 hash of their content, so identical blobs are stored
+only once. Blobs are written in chunks, the content is never held in memory
+as a whole.
+
+The store replaces the data inline in `Job.blobs` only if it is durable,
+``SQUASH_BLOB_STORE_DURABLE`` declares that ``SQUASH_BLOB_ROOT`` is on a
+persistent volume, see kubernetes/blobs-volume.yaml. Otherwise the jobs
+keep the data inline, a store inside the container is lost on redeploys.
+
+Blobs are written before the job that references them is committed, the
+blobs of jobs that fail are deleted by the `collect_blobs` command.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+
+class BlobWriter(object):
+    """Write a blob to the store in chunks.
+
+    The content is written to a temporary file and hashed as it is written,
+    `commit` moves it to its final location and returns its key.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(dir=store.tmp_dir,
+                                                 delete=False)
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def commit(self):
+        self._file.close()
+        key = self._hash.hexdigest()
+        path = self.store.path(key)
+
+        if os.path.exists(path):
+            # identical content is already stored
+            os.remove(self._file.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.rename(self._file.name, path)
+
+        return key
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._file.name):
+            os.remove(self._file.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+
+
+class BlobStore(object):
+    """Content-addressed blob store on the local filesystem"""
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def open_writer(self):
+        return BlobWriter(self)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def load(self, key):
+        """Return the blob data, blobs are stored as JSON documents"""
+
+        with self.open(key) as f:
+            return json.loads(f.read().decode('utf-8'))
+
+    def iter_keys(self, min_age=0):
+        """Yield the keys of the blobs stored more than `min_age` seconds
+        ago"""
+
+        max_mtime = time.time() - min_age
+
+        for prefix in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, prefix)
+            if len(prefix) != 2 or not os.path.isdir(directory):
+                continue
+
+            for key in sorted(os.listdir(directory)):
+                if is_blob_key(key) and \
+                        os.path.getmtime(self.path(key)) < max_mtime:
+                    yield key
+
+    def delete(self, key):
+        os.remove(self.path(key))
+
+    def delete_stale_tmp_files(self, min_age):
+        """Delete the temporary files of the writers that did not finish,
+        e.g. killed workers, return their number"""
+
+        max_mtime = time.time() - min_age
+        count = 0
+
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            if os.path.getmtime(path) < max_mtime:
+                os.remove(path)
+                count += 1
+
+        return count
+
+
+def get_blob_store():
+    return BlobStore(settings.SQUASH_BLOB_ROOT)
+
+
+def is_durable():
+    """Whether blob data may be moved from the jobs to the store"""
+    return settings.SQUASH_BLOB_STORE_DURABLE
+
+
+def is_blob_key(key):
+    return isinstance(key, str) and len(key) == 64 and \
+        all(c in '0123456789abcdef' for c in key)
+
+
+def store_blobs(blobs, store=None):
+    """Move the data of job blobs to the blob store.
+
+    Parameters
+    ----------
+    blobs : list
+        Job blobs, dicts with ``identifier``, ``name`` and ``data``. Blobs
+        already referencing the store are left unchanged.
+
+    Returns
+    -------
+    list
+        References to the blobs: the blob without ``data``, plus the
+        ``sha256`` key and ``size`` of the stored content.
+    """
+    if store is None:
+        store = get_blob_store()
+
+    refs = []
+    for blob in blobs:
+        if 'data' not in blob:
+            refs.append(blob)
+            continue
+
+        ref = {key: value for key, value in blob.items() if key != 'data'}
+
+        with store.open_writer() as writer:
+            writer.write(json.dumps(blob['data']))
+            ref['sha256'] = writer.commit()
+            ref['size'] = writer.size
+
+        refs.append(ref)
+
+    return refs
+
+
+def get_blob_keys(blobs):
+    """Return the keys of the blobs of a job referencing the store"""
+
+    return {blob['sha256'] for blob in blobs or []
+            if isinstance(blob, dict) and 'data' not in blob and
+            is_blob_key(blob.get('sha256'))}
+
+
+def load_blob_data(blob):
+    """Return the data of a job blob, either stored inline in `Job.blobs` or
+    referenced by its key in the blob store"""
+
+    if 'data' in blob:
+        return blob['data']
+
+    return get_blob_store().load(blob['sha256'])
@@ -0,0 +1,116 @@
+"""Cache keys versioned by the data generation.
+
+The data generation is a token stored in the shared cache and replaced
+every time jobs, metrics, measurements or packages are written. Cached
+responses are keyed by the current generation, so a write makes every
+cached response unreachable at once, in every uWSGI worker, and responses
+can be cached for a long time while reads are always fresh.
+
+The time of the last write is stored along with the generation, reads go
+to the primary database for a while after a write, see api/db_router.py.
+"""
+import time
+import uuid
+
+from django.core.cache import caches
+
+from rest_framework_extensions.key_constructor import bits
+from rest_framework_extensions.key_constructor.constructors import \
+    DefaultKeyConstructor, DefaultListKeyConstructor, \
+    DefaultObjectKeyConstructor
+from rest_framework_extensions.settings import extensions_api_settings
+
+from .utils import accepts_gzip
+
+GENERATION_KEY = 'squash:data-generation'
+LAST_WRITE_KEY = 'squash:last-write'
+
+
+def get_cache():
+    return caches[extensions_api_settings.DEFAULT_USE_CACHE]
+
+
+def get_generation():
+    """Return the current data generation"""
+
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+
+    if generation is None:
+        # never set or evicted, starting a new generation is always safe
+        generation = uuid.uuid4().hex
+        if not cache.add(GENERATION_KEY, generation, timeout=None):
+            generation = cache.get(GENERATION_KEY, generation)
+
+    return generation
+
+
+def bump_generation():
+    """Start a new data generation, call it after writes are committed.
+
+    A new random token is used rather than incrementing a counter, so that
+    concurrent writes never end up with the same generation even with cache
+    backends that do not increment atomically.
+    """
+    generation = uuid.uuid4().hex
+    get_cache().set_many({GENERATION_KEY: generation,
+                          LAST_WRITE_KEY: time.time()}, timeout=None)
+    return generation
+
+
+def get_last_write():
+    """Return the timestamp of the last write, or None if unknown"""
+    return get_cache().get(LAST_WRITE_KEY)
+
+
+class DataGenerationKeyBit(bits.KeyBitBase):
+    """Return the current data generation"""
+
+    def get_data(self, params, view_instance, view_method, request, args,
+                 kwargs):
+        return get_generation()
+
+
+class ListKeyConstructor(DefaultListKeyConstructor):
+    generation = DataGenerationKeyBit()
+    # prefetched relations are not part of the SQL query
+    query_params = bits.QueryParamsKeyBit()
+
+
+class ObjectKeyConstructor(DefaultObjectKeyConstructor):
+    generation = DataGenerationKeyBit()
+    query_params = bits.QueryParamsKeyBit()
+
+
+class ViewKeyConstructor(DefaultKeyConstructor):
+    """Key for the views that are not backed by a queryset, the response
+    depends only on the query parameters"""
+
+    generation = DataGenerationKeyBit()
+    query_params = bits.QueryParamsKeyBit()
+
+
+class AcceptsGzipKeyBit(bits.KeyBitBase):
+    """Return whether the client accepts gzip"""
+
+    def get_data(self, params, view_instance, view_method, request, args,
+                 kwargs):
+        return accepts_gzip(request)
+
+
+class AppKeyConstructor(ViewKeyConstructor):
+    """Key of the apps endpoint, the payloads are returned compressed to the
+    clients accepting gzip: the two representations have different ETags"""
+
+    accepts_gzip = AcceptsGzipKeyBit()
+
+
+def blob_etag_func(view_instance, view_method, request, args, kwargs):
+    """Blobs are content addressed, the sha256 never goes stale"""
+    return kwargs.get('pk')
+
+
+list_cache_key_func = ListKeyConstructor()
+object_cache_key_func = ObjectKeyConstructor()
+view_cache_key_func = ViewKeyConstructor()
+app_etag_func = AppKeyConstructor()
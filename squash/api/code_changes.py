@@ -0,0 +1,49 @@
+"""Package diffs of the code changes table.
+
+`Manifest.objects.diff` reads the package versions that differ between the
+manifests of two jobs and compares them with `diff_manifests`, the deltas
+are stored in the `CodeChange` table and formatted by `code_change_entry`
+for the code changes endpoint.
+"""
+
+
+def diff_manifests(prev, curr):
+    """Compare two job manifests.
+
+    Returns
+    -------
+    tuple
+        ``(added, removed, changed)`` lists of ``(name, git_commit,
+        git_url)`` tuples sorted by package name. Removed packages carry
+        the version used by the previous job, added and changed packages
+        carry the version used by the current job.
+    """
+    added = []
+    changed = []
+
+    for name, version in curr.items():
+        prev_version = prev.get(name)
+        if prev_version is None:
+            added.append((name,) + version)
+        elif prev_version != version:
+            changed.append((name,) + version)
+
+    removed = [(name,) + version for name, version in prev.items()
+               if name not in curr]
+
+    return sorted(added), sorted(removed), sorted(changed)
+
+
+def code_change_entry(ci_id, added, removed, changed):
+    """Format a package delta as returned by the code changes endpoint.
+
+    ``packages`` holds the new or updated packages, ``added``, ``removed``
+    and ``changed`` break down the difference and ``count`` is the total
+    number of differences.
+    """
+    return {'ci_id': ci_id,
+            'packages': sorted(added + changed),
+            'added': added,
+            'removed': removed,
+            'changed': changed,
+            'count': len(added) + len(removed) + len(changed)}
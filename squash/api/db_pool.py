@@ -0,0 +1,155 @@
+"""Persistent, health-checked database connections.
+
+With `CONN_MAX_AGE` Django keeps the connection of every worker thread open
+between requests instead of opening a new connection, and running the
+MySQL `init_command`, for every request. The uWSGI workers thus hold a pool
+of ``processes * threads`` connections per database, and a connection is
+recycled, closed and opened again by the next request, once it is older than
+`CONN_MAX_AGE` seconds.
+
+The database backends in `api.backends` add to Django persistent
+connections:
+
+- a health check before reuse: a connection idle for more than
+  `SQUASH_DB_HEALTH_CHECK_INTERVAL` seconds is pinged when a request starts
+  and replaced if the server closed it, e.g. after its ``wait_timeout`` or a
+  failover, rather than failing the request;
+- pool statistics, the number of open and idle connections, the time
+  requests wait for a usable connection and the connections opened, reused
+  and closed, exported to Prometheus at `/prometheus`.
+"""
+import time
+
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db import connections
+from prometheus_client import Counter, Gauge, Histogram
+
+WAIT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+
+CONNECTIONS_OPEN = Gauge(
+    'squash_db_connections_open', 'Open database connections',
+    ['alias'], multiprocess_mode='livesum')
+CONNECTIONS_IDLE = Gauge(
+    'squash_db_connections_idle',
+    'Open database connections waiting for a request',
+    ['alias'], multiprocess_mode='livesum')
+CONNECTION_WAIT = Histogram(
+    'squash_db_connection_wait_seconds',
+    'Time to get a usable connection, opening it or checking its health',
+    ['alias'], buckets=WAIT_BUCKETS)
+CONNECTIONS_OPENED = Counter(
+    'squash_db_connections_opened_total', 'Database connections opened',
+    ['alias'])
+CONNECTIONS_REUSED = Counter(
+    'squash_db_connections_reused_total',
+    'Requests reusing an open database connection', ['alias'])
+CONNECTIONS_CLOSED = Counter(
+    'squash_db_connections_closed_total',
+    'Database connections closed, by reason', ['alias', 'reason'])
+
+
+class PooledDatabaseWrapperMixin(object):
+    """Health checks and statistics for the `DatabaseWrapper` of a
+    backend, see the module documentation"""
+
+    idle = False
+    idle_since = None
+    close_reason = 'closed'
+
+    def connect(self):
+        start = time.perf_counter()
+        super(PooledDatabaseWrapperMixin, self).connect()
+
+        CONNECTION_WAIT.labels(self.alias).observe(
+            time.perf_counter() - start)
+        CONNECTIONS_OPENED.labels(self.alias).inc()
+        CONNECTIONS_OPEN.labels(self.alias).inc()
+
+    def close(self):
+        was_open = self.connection is not None and \
+            not self.closed_in_transaction
+
+        super(PooledDatabaseWrapperMixin, self).close()
+
+        # in a transaction the connection is unset when the transaction ends
+        if was_open and (self.connection is None or
+                         self.closed_in_transaction):
+            self.set_idle(False)
+            CONNECTIONS_OPEN.labels(self.alias).dec()
+            CONNECTIONS_CLOSED.labels(self.alias, self.close_reason).inc()
+
+    def close_if_unusable_or_obsolete(self):
+        if self.connection is not None:
+            if self.close_at is not None and time.time() >= self.close_at:
+                self.close_reason = 'recycled'
+            elif self.errors_occurred:
+                self.close_reason = 'error'
+
+        try:
+            super(PooledDatabaseWrapperMixin, self).\
+                close_if_unusable_or_obsolete()
+        finally:
+            self.close_reason = 'closed'
+
+    def set_idle(self, idle):
+        if idle != self.idle:
+            self.idle = idle
+            CONNECTIONS_IDLE.labels(self.alias).inc(1 if idle else -1)
+        if idle:
+            self.idle_since = time.time()
+
+    def acquire(self):
+        """Check the health of the idle connection when a request starts,
+        close it if it is unusable"""
+
+        if self.connection is None or not self.idle:
+            return
+
+        self.set_idle(False)
+
+        interval = settings.SQUASH_DB_HEALTH_CHECK_INTERVAL
+        if interval is not None and time.time() - self.idle_since >= interval:
+            start = time.perf_counter()
+            usable = self.is_usable()
+            CONNECTION_WAIT.labels(self.alias).observe(
+                time.perf_counter() - start)
+
+            if not usable:
+                self.close_reason = 'unhealthy'
+                try:
+                    self.close()
+                finally:
+                    self.close_reason = 'closed'
+                return
+
+        CONNECTIONS_REUSED.labels(self.alias).inc()
+
+    def release(self):
+        """Mark the connection idle when a request finishes"""
+
+        if self.connection is not None:
+            self.set_idle(True)
+
+
+def get_pooled_connections():
+    return [connection for connection in connections.all()
+            if isinstance(connection, PooledDatabaseWrapperMixin)]
+
+
+# connected after Django closes the obsolete connections in the same
+# signals, see django.db.close_old_connections
+def acquire_connections(**kwargs):
+    for connection in get_pooled_connections():
+        connection.acquire()
+
+
+def release_connections(**kwargs):
+    for connection in get_pooled_connections():
+        connection.release()
+
+
+request_started.connect(acquire_connections,
+                        dispatch_uid='squash_acquire_connections')
+request_finished.connect(release_connections,
+                         dispatch_uid='squash_release_connections')
@@ -0,0 +1,98 @@
+"""Route the reads of safe requests to the read replicas.
+
+Writes always go to the primary, the ``default`` database, and so do the
+reads of the requests with an unsafe method, of management commands and of
+any code running outside a request. Each GET, HEAD or OPTIONS request reads
+from a single replica, chosen at random in `SQUASH_DB_REPLICAS`, so that
+its queries see a consistent state.
+
+Replicas lag behind the primary. After a successful write a client gets a
+cookie that sends its reads to the primary for `SQUASH_DB_PIN_SECONDS`, so
+that it reads its own writes. The reads of every client also go to the
+primary for that long after any write: responses are cached by data
+generation, see api/cache.py, and a response computed from a replica that
+has not caught up yet would be cached as the state of the new generation.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .cache import get_last_write
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+PIN_COOKIE = 'squash_db_pin'
+
+_local = threading.local()
+
+
+def get_replica():
+    """Return the replica used by the current request, or None"""
+    return getattr(_local, 'replica', None)
+
+
+def set_replica(alias):
+    _local.replica = alias
+
+
+def is_pinned(request):
+    """Whether the reads of a request must go to the primary"""
+
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+
+    last_write = get_last_write()
+    return last_write is not None and \
+        time.time() - last_write < settings.SQUASH_DB_PIN_SECONDS
+
+
+class ReplicaRouter(object):
+    """Database router sending the reads of safe requests to a replica"""
+
+    def db_for_read(self, model, **hints):
+        replica = get_replica()
+
+        # reads in a transaction must see its writes
+        if replica is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model=None, **hints):
+        # replicas get the schema from the primary
+        return db not in settings.SQUASH_DB_REPLICAS
+
+
+class ReplicaRoutingMiddleware(object):
+    """Select the database of the reads of every request, and pin the
+    clients to the primary after their writes"""
+
+    def process_request(self, request):
+        replicas = settings.SQUASH_DB_REPLICAS
+
+        if replicas and request.method in SAFE_METHODS and \
+                not is_pinned(request):
+            set_replica(random.choice(replicas))
+        else:
+            set_replica(None)
+
+    def process_response(self, request, response):
+        set_replica(None)
+
+        if settings.SQUASH_DB_REPLICAS and \
+                request.method not in SAFE_METHODS and \
+                response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.SQUASH_DB_PIN_SECONDS)
+
+        return response
@@ -0,0 +1,145 @@
+"""Downsampling of measurement time series.
+
+A series can not be displayed with more points than the width of the plot,
+so long series are reduced on the server before they are serialized. Both
+methods keep the first and last points of the series.
+
+``lttb``
+    Largest-Triangle-Three-Buckets, keeps the visual shape of the series.
+``minmax``
+    Keeps the minimum and the maximum of each bucket, so that outliers are
+    always preserved.
+"""
+import numpy as np
+import pandas as pd
+
+METHODS = ('lttb', 'minmax')
+
+
+def _bucket_edges(n, n_buckets):
+    """Edges of `n_buckets` buckets over the points 1..n-2, the first and
+    last points are kept separately"""
+
+    return np.linspace(1, n - 1, n_buckets + 1).astype(int)
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the points selected by the Largest-Triangle-Three-Buckets
+    algorithm.
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+        Coordinates of the series, sorted by `x`.
+    n_out : int
+        Number of points to keep, at least 3.
+    """
+    n = len(x)
+
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = _bucket_edges(n, n_out - 2)
+
+    # average point of each bucket, computed at once
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+
+    # the average of the next bucket for the last bucket is the last point
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # area of the triangles formed with the selected point of the
+        # previous bucket and the average point of the next bucket
+        area = np.abs((x[a] - avg_x[i]) * (y[start:end] - y[a]) -
+                      (x[a] - x[start:end]) * (avg_y[i] - y[a]))
+
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def minmax_indices(x, y, n_out):
+    """Indices of the minimum and maximum points of each bucket.
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+        Coordinates of the series, sorted by `x`.
+    n_out : int
+        Maximum number of points to keep, at least 4.
+    """
+    n = len(x)
+
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    edges = _bucket_edges(n, (n_out - 2) // 2)
+
+    inner = np.arange(1, n - 1)
+    buckets = np.searchsorted(edges, inner, side='right') - 1
+
+    # sort by bucket then value, the first and last point of each bucket
+    # are its minimum and maximum
+    order = np.lexsort((y[1:n - 1], buckets))
+    sorted_buckets = buckets[order]
+    first = np.searchsorted(sorted_buckets, sorted_buckets, side='left')
+    last = np.searchsorted(sorted_buckets, sorted_buckets, side='right') - 1
+
+    keep = np.unique(np.concatenate([order[np.unique(first)],
+                                     order[np.unique(last)]])) + 1
+
+    return np.concatenate([[0], keep, [n - 1]])
+
+
+def downsample_frame(df, max_points, method='lttb', x='date', y='value',
+                     by=None):
+    """Downsample each series of a data frame to at most `max_points`.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        Measurements sorted by `x`.
+    max_points : int
+        Maximum number of points per series.
+    method : str
+        One of `METHODS`.
+    x, y : str
+        Columns holding the time and the value of the measurements.
+    by : list
+        Columns identifying a series, e.g. the metric and the dataset.
+    """
+    if method not in METHODS:
+        raise ValueError('Unknown downsampling method {}'.format(method))
+
+    if df.empty:
+        return df
+
+    select = lttb_indices if method == 'lttb' else minmax_indices
+
+    if by:
+        groups = df.groupby(by, sort=False).indices.values()
+    else:
+        groups = [np.arange(len(df))]
+
+    x_values = pd.to_datetime(df[x]).values.astype('int64').astype(float)
+    y_values = df[y].values.astype(float)
+
+    keep = []
+    for positions in groups:
+        positions = np.asarray(positions)
+        indices = select(x_values[positions], y_values[positions],
+                         max_points)
+        keep.append(positions[indices])
+
+    return df.iloc[np.sort(np.concatenate(keep))].reset_index(drop=True)
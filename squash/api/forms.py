@@ -1,8 +1,24 @@
 import django_filters
-from .models import Job
+from .models import Job, SpecVerdict
+
+
+def filter_failing(queryset, value):
+    """Select the jobs failing the `value` specification of a metric, or
+    any specification if `value` is `any`"""
+
+    if not value:
+        return queryset
+
+    spec = None if value == 'any' else value
+    return queryset.filter(pk__in=SpecVerdict.objects.get_failing_jobs(spec))
 
 
 class JobFilter(django_filters.FilterSet):
+    # jobs using a package version, by id
+    packages = django_filters.NumberFilter(name='manifest__versions')
+    # jobs failing a specification, from the stored verdicts
+    failing = django_filters.CharFilter(action=filter_failing)
+
     class Meta:
         model = Job
-        fields = ('ci_id', 'ci_dataset', 'ci_label', 'packages')
+        fields = ('ci_id', 'ci_dataset', 'ci_label', 'packages', 'failing')
@@ -0,0 +1,89 @@
+"""Asynchronous ingestion of jobs.
+
+In asynchronous mode a posted job is validated, its blobs are moved to the
+blob store and the job data is queued as an `IngestTask`. The request
+returns immediately and the `process_ingest_queue` command creates the
+queued jobs in batches with `JobSerializer`, retrying the tasks that fail,
+e.g. because of database errors, until they have been attempted
+`max_attempts` times. A task is marked as done in the transaction creating
+its job.
+"""
+import json
+import logging
+
+from django.db import DatabaseError, transaction
+
+from .blobstore import is_durable, store_blobs
+from .cache import bump_generation
+from .models import IngestTask
+from .serializers import JobSerializer
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(serializer):
+    """Queue a validated job, return the `IngestTask`"""
+
+    payload = dict(serializer.initial_data)
+
+    # the queue holds references to the blobs, not their data
+    if payload.get('blobs') and is_durable():
+        payload['blobs'] = store_blobs(payload['blobs'])
+
+    return IngestTask.objects.create(payload=payload)
+
+
+def process(task, max_attempts, retry_delay):
+    """Create the job of a claimed task.
+
+    Invalid jobs fail at once, other errors are retried with an exponential
+    backoff starting at `retry_delay` seconds, until the task has been
+    attempted `max_attempts` times.
+    """
+
+    try:
+        serializer = JobSerializer(data=task.payload)
+
+        if not serializer.is_valid():
+            # e.g. a metric deleted since the job was queued
+            task.fail(json.dumps(serializer.errors))
+            return
+
+        # a worker stopped between the creation of the job and the end of
+        # the task would create the job again
+        with transaction.atomic():
+            job = serializer.save()
+            task.finish(job)
+
+    except Exception as e:
+        # the error is readable by anyone at /ingest/{id}/, the details of
+        # database errors are only logged
+        logger.exception('Failed to process ingest task %d', task.pk)
+
+        if isinstance(e, DatabaseError):
+            error = 'The job could not be saved.'
+        else:
+            # e.g. a payload the serializer does not handle, the other
+            # tasks are processed
+            error = 'The job could not be ingested.'
+
+        if task.attempts >= max_attempts:
+            task.fail(error)
+        else:
+            task.retry(error, retry_delay * 2 ** (task.attempts - 1))
+        return
+
+    # the generation bumped by the serializer may have been read before
+    # the job was committed
+    bump_generation()
+
+
+def process_batch(batch_size, max_attempts, retry_delay):
+    """Claim and process the next tasks, return the number of tasks"""
+
+    tasks = IngestTask.objects.claim(batch_size)
+
+    for task in tasks:
+        process(task, max_attempts, retry_delay)
+
+    return len(tasks)
@@ -0,0 +1,306 @@
+"""Per-request performance instrumentation.
+
+`InstrumentationMiddleware` measures for every request the number of SQL
+queries, the time spent running them, serializing objects and in pandas,
+and the size of the response. The measurements are returned in the
+`Server-Timing` response header and recorded in Prometheus histograms
+labelled by view, exported by the `/prometheus` endpoint.
+
+Every uWSGI worker process has its own metrics. Set the
+`prometheus_multiproc_dir` environment variable to a directory shared by
+the workers and emptied at startup, as done in uwsgi.ini, so that the
+endpoint exports the metrics of all the workers. The gauges of the live
+workers only, e.g. the open database connections, are summed: the files of
+a worker are removed when it exits, and by the next worker started if it
+was killed, see `setup_worker_metrics`.
+
+Queries are counted by wrapping the cursors of the connections of the
+thread processing the request, the query log of the connections is not
+used: the queries of production requests are not logged.
+
+Read-only views declare the maximum number of queries of a request with a
+`query_budget` class attribute. The number of queries of a view must not
+depend on the page size or on the amount of data, requests over the budget
+are counted and, with `SQUASH_QUERY_BUDGET_WARNINGS`, logged.
+"""
+import contextlib
+import glob
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.utils import CursorWrapper
+from prometheus_client import CollectorRegistry, Counter, Histogram, \
+    REGISTRY, generate_latest, multiprocess
+
+logger = logging.getLogger(__name__)
+
+# timers of the code sections measured with `timer`
+TIMERS = ('serializer', 'pandas')
+
+DURATION_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+REQUEST_DURATION = Histogram(
+    'squash_request_duration_seconds', 'Time to process a request',
+    ['view', 'method', 'status'], buckets=DURATION_BUCKETS)
+REQUEST_QUERIES = Histogram(
+    'squash_request_queries', 'Number of SQL queries run by a request',
+    ['view'], buckets=QUERY_BUCKETS)
+REQUEST_SQL_DURATION = Histogram(
+    'squash_request_sql_seconds', 'Time spent running SQL queries',
+    ['view'], buckets=DURATION_BUCKETS)
+REQUEST_TIMER_DURATION = Histogram(
+    'squash_request_timer_seconds', 'Time spent serializing or in pandas',
+    ['view', 'timer'], buckets=DURATION_BUCKETS)
+RESPONSE_SIZE = Histogram(
+    'squash_response_bytes', 'Size of the response body',
+    ['view'], buckets=SIZE_BUCKETS)
+QUERY_BUDGET_EXCEEDED = Counter(
+    'squash_query_budget_exceeded_total',
+    'Requests running more queries than the budget of their view',
+    ['view'])
+
+# files of the gauges of the live processes in multiprocess mode, see
+# prometheus_client.multiprocess.mark_process_dead
+LIVE_GAUGE_FILE = re.compile(r'^gauge_live(?:sum|all)_(\d+)\.db$')
+
+# methods of the database connections returning a cursor wrapper
+CURSOR_FACTORIES = ('make_cursor', 'make_debug_cursor')
+
+_local = threading.local()
+
+
+class QueryCountingCursorWrapper(CursorWrapper):
+    """Count the queries run through a cursor, and the time spent running
+    them, in the metrics of a request"""
+
+    def __init__(self, cursor, db, metrics):
+        super().__init__(cursor, db)
+        self.metrics = metrics
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.metrics.add_query(time.perf_counter() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.perf_counter()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self.metrics.add_query(time.perf_counter() - start)
+
+
+class RequestMetrics(object):
+    """Measurements of the request being processed by a thread"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timers = dict.fromkeys(TIMERS, 0.0)
+        self.active = set()
+        self.query_budget = None
+        self.queries = 0
+        self.sql_duration = 0.0
+
+        # the cursors of the connections of the thread are wrapped until
+        # the request finishes, the queries are not logged
+        for connection in connections.all():
+            for name in CURSOR_FACTORIES:
+                # left by a request that did not finish
+                connection.__dict__.pop(name, None)
+                setattr(connection, name, self.wrap_cursor_factory(
+                    connection, getattr(connection, name)))
+
+    def wrap_cursor_factory(self, connection, make_cursor):
+
+        def wrapper(cursor):
+            return QueryCountingCursorWrapper(make_cursor(cursor),
+                                              connection, self)
+
+        return wrapper
+
+    def add_query(self, duration):
+        self.queries += 1
+        self.sql_duration += duration
+
+    def finish(self):
+        """Stop counting the queries, return their number and duration"""
+
+        for connection in connections.all():
+            for name in CURSOR_FACTORIES:
+                connection.__dict__.pop(name, None)
+
+        return self.queries, self.sql_duration
+
+
+def get_request_metrics():
+    return getattr(_local, 'metrics', None)
+
+
+@contextlib.contextmanager
+def timer(name):
+    """Add the time spent in the block to the `name` timer of the current
+    request, nested blocks of the same timer are counted once"""
+
+    metrics = get_request_metrics()
+
+    if metrics is None or name in metrics.active:
+        yield
+        return
+
+    metrics.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.timers[name] += time.perf_counter() - start
+        metrics.active.discard(name)
+
+
+def get_query_budget(view_func, method):
+    """Return the query budget of a request to a view, or None if the view
+    has no budget for this method"""
+
+    if method not in ('GET', 'HEAD'):
+        return None
+
+    return getattr(getattr(view_func, 'cls', None), 'query_budget', None)
+
+
+def get_view_name(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None or not resolver_match.url_name:
+        return 'unresolved'
+    return resolver_match.url_name
+
+
+def format_server_timing(queries, sql_duration, timers, total):
+    """Return the `Server-Timing` header value, durations in ms"""
+
+    entries = ['db;dur={:.1f};desc="{} queries"'.format(1e3 * sql_duration,
+                                                        queries)]
+    entries += ['{};dur={:.1f}'.format(name, 1e3 * timers[name])
+                for name in TIMERS]
+    entries.append('total;dur={:.1f}'.format(1e3 * total))
+
+    return ', '.join(entries)
+
+
+class InstrumentationMiddleware(object):
+    """Measure every request, see the module documentation"""
+
+    def process_request(self, request):
+        _local.metrics = RequestMetrics()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = get_request_metrics()
+        if metrics is not None:
+            metrics.query_budget = get_query_budget(view_func,
+                                                    request.method)
+
+    def process_response(self, request, response):
+
+        metrics = get_request_metrics()
+        if metrics is None:
+            # the request was answered by a previous middleware
+            return response
+
+        _local.metrics = None
+
+        queries, sql_duration = metrics.finish()
+        total = time.perf_counter() - metrics.start
+
+        view = get_view_name(request)
+
+        REQUEST_DURATION.labels(view, request.method,
+                                str(response.status_code)).observe(total)
+        REQUEST_QUERIES.labels(view).observe(queries)
+        REQUEST_SQL_DURATION.labels(view).observe(sql_duration)
+        for name in TIMERS:
+            REQUEST_TIMER_DURATION.labels(view, name).observe(
+                metrics.timers[name])
+
+        budget = metrics.query_budget
+        if budget is not None and queries > budget:
+            QUERY_BUDGET_EXCEEDED.labels(view).inc()
+            if settings.SQUASH_QUERY_BUDGET_WARNINGS:
+                logger.warning('%s ran %d queries, over its budget of %d',
+                               request.get_full_path(), queries, budget)
+
+        # the size of streaming responses is unknown
+        if not response.streaming:
+            RESPONSE_SIZE.labels(view).observe(len(response.content))
+
+        response['Server-Timing'] = format_server_timing(
+            queries, sql_duration, metrics.timers, total)
+
+        return response
+
+
+def generate_metrics():
+    """Return the metrics in the Prometheus text format, aggregated over
+    the worker processes in multiprocess mode"""
+
+    if 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+
+    return generate_latest(registry)
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_dead_processes(path):
+    """Remove the gauges of the processes that exited without cleaning up,
+    return their pids"""
+
+    pids = set()
+
+    for name in glob.glob(os.path.join(path, 'gauge_live*.db')):
+        match = LIVE_GAUGE_FILE.match(os.path.basename(name))
+        if match is not None:
+            pids.add(int(match.group(1)))
+
+    dead = sorted(pid for pid in pids if not is_process_alive(pid))
+    for pid in dead:
+        multiprocess.mark_process_dead(pid, path)
+
+    return dead
+
+
+def setup_worker_metrics():
+    """Keep the gauges of the worker processes of uWSGI, call it when a
+    worker loads the application"""
+
+    path = os.environ.get('prometheus_multiproc_dir')
+    if path is None:
+        return
+
+    # workers killed, e.g. by the OOM killer, do not run the exit hook
+    remove_dead_processes(path)
+
+    try:
+        import uwsgi
+    except ImportError:
+        return
+
+    pid = os.getpid()
+    uwsgi.atexit = lambda: multiprocess.mark_process_dead(pid, path)
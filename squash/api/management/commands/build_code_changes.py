@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import bump_generation
+from api.models import Job, CodeChange, Manifest
+
+
+class Command(BaseCommand):
+    help = ('Backfill or rebuild the code changes table from the '
+            'manifests of every job.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ci-dataset', action='append',
+                            dest='ci_datasets', default=None,
+                            help='Rebuild only this dataset, can be '
+                                 'repeated. Default is all datasets.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows per INSERT.')
+
+    def handle(self, *args, **options):
+
+        ci_datasets = options['ci_datasets']
+
+        if ci_datasets is None:
+            ci_datasets = Job.objects.values_list('ci_dataset', flat=True).\
+                distinct().order_by('ci_dataset')
+
+        for ci_dataset in ci_datasets:
+            count = self.build(ci_dataset, options['batch_size'])
+            self.stdout.write('{}: {} jobs processed'.format(ci_dataset,
+                                                             count))
+
+        bump_generation()
+
+    def build(self, ci_dataset, batch_size):
+        """Recompute the package deltas of a dataset in a single pass over
+        its jobs, consecutive jobs sharing a manifest are not compared"""
+
+        jobs = Job.objects.filter(ci_dataset=ci_dataset).\
+            order_by('date', 'id').values_list('id', 'manifest', 'date')
+
+        count = 0
+
+        with transaction.atomic():
+            CodeChange.objects.filter(ci_dataset=ci_dataset).delete()
+
+            batch = []
+            prev_job_id = None
+            prev_manifest_id = None
+
+            for job_id, manifest_id, date in jobs.iterator():
+
+                if prev_job_id is None:
+                    added, removed, changed = [], [], []
+                else:
+                    added, removed, changed = Manifest.objects.diff(
+                        prev_manifest_id, manifest_id)
+
+                batch.append(CodeChange.objects.make(
+                    added, removed, changed, job_id=job_id,
+                    previous_job_id=prev_job_id, ci_dataset=ci_dataset,
+                    date=date))
+
+                prev_job_id = job_id
+                prev_manifest_id = manifest_id
+
+                if len(batch) >= batch_size:
+                    CodeChange.objects.bulk_create(batch)
+                    count += len(batch)
+                    batch = []
+
+            CodeChange.objects.bulk_create(batch)
+            count += len(batch)
+
+        return count
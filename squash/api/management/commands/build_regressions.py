@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import bump_generation
+from api.models import Measurement, Metric, Regression
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the regressions from the measurements of every job, '
+            'e.g. after the detection window or threshold changed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metric', action='append', dest='metrics',
+                            default=None,
+                            help='Rebuild only this metric, can be '
+                                 'repeated. Default is all metrics.')
+        parser.add_argument('--window', type=int,
+                            default=settings.SQUASH_REGRESSION_WINDOW,
+                            help='Number of previous measurements of the '
+                                 'baseline.')
+        parser.add_argument('--threshold', type=float,
+                            default=settings.SQUASH_REGRESSION_THRESHOLD,
+                            help='Number of standard deviations of a '
+                                 'jump.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows per INSERT.')
+
+    def handle(self, *args, **options):
+
+        metrics = Metric.objects.all()
+        if options['metrics'] is not None:
+            metrics = metrics.filter(metric__in=options['metrics'])
+        operators = dict(metrics.values_list('metric', 'operator'))
+
+        rows = Measurement.objects.filter(metric__in=list(operators)).\
+            values_list('job', 'job__date', 'metric', 'job__ci_dataset',
+                        'value').iterator()
+
+        regressions = Regression.objects.detect(
+            rows, operators, options['window'], options['threshold'])
+
+        with transaction.atomic():
+            Regression.objects.filter(
+                metric__in=list(operators)).delete()
+            Regression.objects.bulk_create(
+                regressions, batch_size=options['batch_size'])
+
+        bump_generation()
+
+        self.stdout.write('{} regressions created'.format(len(regressions)))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import bump_generation
+from api.models import Measurement, MeasurementRollup, get_period_start
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the daily and weekly measurement rollups from the '
+            'measurements of every job.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows per INSERT.')
+
+    def handle(self, *args, **options):
+
+        rows = Measurement.objects.order_by('job__date', 'job__id').\
+            values_list('metric_id', 'job__ci_dataset', 'job__ci_label',
+                        'job__date', 'value').iterator()
+
+        rollups = {}
+
+        for metric_id, ci_dataset, ci_label, date, value in rows:
+            for resolution, _ in MeasurementRollup.RESOLUTION_CHOICES:
+                key = (metric_id, ci_dataset, ci_label, resolution,
+                       get_period_start(date, resolution))
+
+                rollup = rollups.get(key)
+
+                if rollup is None:
+                    rollups[key] = MeasurementRollup(
+                        metric_id=metric_id, ci_dataset=ci_dataset,
+                        ci_label=ci_label, resolution=resolution,
+                        period_start=key[-1], count=1, min=value,
+                        max=value, total=value, mean=value, last=value,
+                        last_date=date)
+                else:
+                    rollup.add(1, value, value, value, value, date)
+
+        with transaction.atomic():
+            MeasurementRollup.objects.all().delete()
+            MeasurementRollup.objects.bulk_create(
+                list(rollups.values()), batch_size=options['batch_size'])
+
+        bump_generation()
+
+        self.stdout.write('{} rollups created'.format(len(rollups)))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.cache import bump_generation
+from api.models import Measurement, Metric, SpecVerdict
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the verdicts of the measurements of every job against '
+            'the specifications of their metric, e.g. after specifications '
+            'changed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--metric', action='append', dest='metrics',
+                            default=None,
+                            help='Rebuild only this metric, can be '
+                                 'repeated. Default is all metrics.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of measurements evaluated at '
+                                 'once.')
+
+    def handle(self, *args, **options):
+
+        metrics = Metric.objects.all()
+        if options['metrics'] is not None:
+            metrics = metrics.filter(metric__in=options['metrics'])
+        metrics = list(metrics)
+
+        rows = Measurement.objects.filter(metric__in=metrics).\
+            order_by('id').values_list('job', 'metric', 'value').iterator()
+
+        batch_size = options['batch_size']
+        count = 0
+
+        with transaction.atomic():
+            SpecVerdict.objects.filter(metric__in=metrics).delete()
+
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    count += self.create(batch, metrics)
+                    batch = []
+
+            count += self.create(batch, metrics)
+
+        bump_generation()
+
+        self.stdout.write('{} verdicts created'.format(count))
+
+    def create(self, rows, metrics):
+        verdicts = SpecVerdict.objects.evaluate(rows, metrics)
+        SpecVerdict.objects.bulk_create(verdicts)
+        return len(verdicts)
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+
+from api.blobstore import get_blob_keys, get_blob_store
+from api.models import IngestTask, Job
+from api.utils import load_json
+
+
+class Command(BaseCommand):
+    help = ('Delete the blobs of the blob store that no job or queued job '
+            'references, e.g. the blobs of jobs whose creation failed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=int, default=24 * 60 * 60,
+                            help='Keep the blobs stored less than this '
+                                 'number of seconds ago, they may belong '
+                                 'to jobs being created. Default is one '
+                                 'day.')
+        parser.add_argument('--dry-run', action='store_true',
+                            default=False,
+                            help='Report the blobs without deleting them.')
+
+    def handle(self, *args, **options):
+
+        store = get_blob_store()
+
+        # listed before the references are read, blobs stored meanwhile
+        # are not candidates
+        candidates = list(store.iter_keys(options['min_age']))
+
+        referenced = set()
+
+        jobs = Job.objects.filter(blobs__isnull=False).\
+            values_list('id', flat=True).order_by('id')
+
+        # rows are read one at a time, jobs may still hold inline blobs
+        for job_id in list(jobs):
+            raw = Job.objects.filter(id=job_id).\
+                values_list('blobs', flat=True)[0]
+            referenced |= get_blob_keys(load_json(raw))
+
+        # failed tasks may be retried
+        for raw in IngestTask.objects.exclude(status=IngestTask.DONE).\
+                values_list('payload', flat=True).iterator():
+            referenced |= get_blob_keys(load_json(raw).get('blobs'))
+
+        unreferenced = [key for key in candidates if key not in referenced]
+
+        if not options['dry_run']:
+            for key in unreferenced:
+                store.delete(key)
+            store.delete_stale_tmp_files(options['min_age'])
+
+        self.stdout.write('{} unreferenced blobs {}'.format(
+            len(unreferenced),
+            'found' if options['dry_run'] else 'deleted'))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_generation
+from api.models import Job, Measurement, Metric
+from api.utils import is_legacy_json, load_json
+
+# JSONField columns that may hold the Python repr of the data
+JSON_FIELDS = (
+    (Job, 'blobs'),
+    (Measurement, 'metadata'),
+    (Metric, 'parameters'),
+    (Metric, 'specs'),
+    (Metric, 'reference'),
+)
+
+
+class Command(BaseCommand):
+    help = ('Convert the JSON fields stored as the Python repr of the data '
+            'to native JSON, so that reading them does not require '
+            'ast.literal_eval.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100,
+                            help='Number of rows read per query.')
+
+    def handle(self, *args, **options):
+
+        for model, field in JSON_FIELDS:
+            count = self.convert(model, field, options['batch_size'])
+            self.stdout.write('{}.{}: {} rows converted'.format(
+                model.__name__, field, count))
+
+        bump_generation()
+
+    def convert(self, model, field, batch_size):
+
+        pks = list(model.objects.filter(**{field + '__isnull': False}).
+                   values_list('pk', flat=True).order_by('pk'))
+
+        count = 0
+
+        for i in range(0, len(pks), batch_size):
+            rows = model.objects.filter(pk__in=pks[i:i + batch_size]).\
+                values_list('pk', field)
+
+            for pk, raw in rows:
+                if is_legacy_json(raw):
+                    model.objects.filter(pk=pk).\
+                        update(**{field: load_json(raw)})
+                    count += 1
+
+        return count
@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.blobstore import get_blob_store, is_durable, store_blobs
+from api.cache import bump_generation
+from api.models import Job
+from api.utils import load_json
+
+
+class Command(BaseCommand):
+    help = ('Move the data blobs stored inline in the jobs table to the '
+            'blob store and report the space savings.')
+
+    def handle(self, *args, **options):
+
+        # the inline data is the only copy once the jobs are rewritten
+        if not is_durable():
+            raise CommandError(
+                'The blob store at {} is not declared durable. Mount a '
+                'persistent volume there and set '
+                'SQUASH_BLOB_STORE_DURABLE=true first.'.format(
+                    settings.SQUASH_BLOB_ROOT))
+
+        store = get_blob_store()
+
+        jobs = Job.objects.filter(blobs__isnull=False).\
+            values_list('id', flat=True).order_by('id')
+
+        n_jobs = 0
+        n_blobs = 0
+        inline_bytes = 0
+        refs_bytes = 0
+        stored_keys = {}
+
+        # rows are read one at a time, a single result set would hold every
+        # blob in memory
+        for job_id in list(jobs):
+            raw = Job.objects.filter(id=job_id).\
+                values_list('blobs', flat=True)[0]
+
+            blobs = load_json(raw)
+
+            if not blobs or all('data' not in x for x in blobs):
+                continue
+
+            refs = store_blobs(blobs, store)
+
+            # the inline data is dropped only once the copy is stored
+            for ref in refs:
+                if not store.exists(ref['sha256']):
+                    raise CommandError('Blob {} of job {} was not '
+                                       'stored.'.format(ref['sha256'],
+                                                        job_id))
+
+            Job.objects.filter(id=job_id).update(blobs=refs)
+
+            updated = Job.objects.filter(id=job_id).\
+                values_list('blobs', flat=True)[0]
+
+            n_jobs += 1
+            n_blobs += len(refs)
+            inline_bytes += len(raw)
+            refs_bytes += len(updated)
+            for ref in refs:
+                stored_keys[ref['sha256']] = ref['size']
+
+        bump_generation()
+
+        stored_bytes = sum(stored_keys.values())
+        saved_bytes = inline_bytes - refs_bytes - stored_bytes
+
+        self.stdout.write('Jobs migrated: {}'.format(n_jobs))
+        self.stdout.write('Blobs migrated: {} ({} unique)'.format(
+            n_blobs, len(stored_keys)))
+        self.stdout.write('Inline size: {}'.format(format_size(inline_bytes)))
+        self.stdout.write('Blob store size: {}'.format(
+            format_size(stored_bytes)))
+        self.stdout.write('References size: {}'.format(
+            format_size(refs_bytes)))
+        if inline_bytes:
+            self.stdout.write('Space saved: {} ({:.1f}%)'.format(
+                format_size(saved_bytes), 100.0 * saved_bytes / inline_bytes))
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024 or unit == 'GB':
+            break
+        size /= 1024.0
+    return '{:.1f} {}'.format(size, unit)
@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.ingest import process_batch
+from api.models import IngestTask
+
+
+class Command(BaseCommand):
+    help = ('Create the jobs queued by the jobs endpoint in asynchronous '
+            'mode.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=20,
+                            help='Number of tasks claimed at once.')
+        parser.add_argument('--max-attempts', type=int, default=5,
+                            help='Number of attempts before a task fails.')
+        parser.add_argument('--retry-delay', type=float, default=30,
+                            help='Seconds before the first retry, doubled '
+                                 'at every attempt.')
+        parser.add_argument('--stale-after', type=float, default=600,
+                            help='Seconds after which a running task is '
+                                 'considered lost and queued again.')
+        parser.add_argument('--sleep', type=float, default=5,
+                            help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty.')
+
+    def handle(self, *args, **options):
+
+        while True:
+            requeued, failed = IngestTask.objects.requeue_stale(
+                options['stale_after'], options['max_attempts'])
+            if requeued or failed:
+                self.stdout.write('{} stale tasks queued again, {} '
+                                  'failed'.format(requeued, failed))
+
+            count = process_batch(options['batch_size'],
+                                  options['max_attempts'],
+                                  options['retry_delay'])
+
+            if count:
+                depth = IngestTask.objects.get_depth()
+                self.stdout.write('{} tasks processed, {} pending, '
+                                  '{} failed'.format(count,
+                                                     depth[IngestTask.PENDING],
+                                                     depth[IngestTask.FAILED]))
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_generation
+from api.models import StatsSummary
+
+
+class Command(BaseCommand):
+    help = ('Recompute the statistics shown on the squash home page from '
+            'the full tables.')
+
+    def handle(self, *args, **options):
+
+        before = StatsSummary.objects.filter(
+            pk=StatsSummary.SUMMARY_ID).first()
+
+        after = StatsSummary.objects.reconcile()
+        bump_generation()
+
+        for field in ('number_of_metrics', 'number_of_packages',
+                      'number_of_jobs', 'number_of_measurements',
+                      'datasets', 'latest_job_date'):
+            value = getattr(after, field)
+            if before is not None and getattr(before, field) != value:
+                self.stdout.write('{}: {} -> {}'.format(
+                    field, getattr(before, field), value))
+            else:
+                self.stdout.write('{}: {}'.format(field, value))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from api.app_payloads import get_payload
+from api.models import Job, Measurement
+
+
+class Command(BaseCommand):
+    help = ('Build the cached payloads of the apps endpoint for the '
+            'measurements of the latest jobs, e.g. after a deployment or '
+            'a cache flush.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=10,
+                            help='Number of latest jobs.')
+
+    def handle(self, *args, **options):
+
+        jobs = Job.objects.order_by('-id').\
+            values_list('id', flat=True)[:options['jobs']]
+
+        rows = Measurement.objects.\
+            filter(job__in=list(jobs), metadata__isnull=False).\
+            values_list('job__ci_id', 'job__ci_dataset', 'metric').\
+            distinct()
+
+        # payloads already cached are not built again
+        count = sum(get_payload(ci_id, ci_dataset, metric) is not None
+                    for ci_id, ci_dataset, metric in rows)
+
+        self.stdout.write('{} app payloads cached'.format(count))
@@ -0,0 +1,29 @@
+"""Digests identifying package versions and job manifests.
+
+The package versions used by the jobs are stored once in a catalog, and the
+jobs using the same set of versions share a manifest, see
+`models.PackageVersion` and `models.Manifest`. Both are looked up by the
+digests computed here, which do not depend on Django so that migrations
+can use them.
+"""
+import hashlib
+import json
+
+# fields identifying a package version
+VERSION_FIELDS = ('name', 'git_url', 'git_commit', 'git_branch',
+                  'build_version')
+
+
+def version_digest(package):
+    """Return the SHA-256 of the fields of a package version, a dict"""
+
+    values = [package[field] for field in VERSION_FIELDS]
+    return hashlib.sha256(json.dumps(values).encode('utf-8')).hexdigest()
+
+
+def manifest_digest(version_digests):
+    """Return the SHA-256 of a manifest, given the digests of its package
+    versions in any order"""
+
+    content = '\n'.join(sorted(set(version_digests)))
+    return hashlib.sha256(content.encode('ascii')).hexdigest()
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+import json_field.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodeChange',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('ci_dataset', models.CharField(help_text='Name of the dataset, e.g cfht', max_length=16)),
+                ('date', models.DateTimeField(help_text='Datetime when job was registered', db_index=True)),
+                ('added', json_field.fields.JSONField(help_text='Packages added in this job', null=True, default=None, blank=True)),
+                ('removed', json_field.fields.JSONField(help_text='Packages removed in this job', null=True, default=None, blank=True)),
+                ('changed', json_field.fields.JSONField(help_text='Packages whose git commit changed', null=True, default=None, blank=True)),
+                ('count', models.PositiveIntegerField(help_text='Number of differences', default=0)),
+                ('job', models.OneToOneField(to='api.Job', related_name='code_change')),
+                ('previous_job', models.ForeignKey(to='api.Job', null=True, blank=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='codechange',
+            index_together=set([('ci_dataset', 'date')]),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_codechange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementRollup',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('ci_dataset', models.CharField(help_text='Name of the dataset, e.g cfht', max_length=16)),
+                ('ci_label', models.CharField(help_text='Name of the platform, eg. centos-7', max_length=16)),
+                ('resolution', models.CharField(help_text='Aggregation period', max_length=4, choices=[('day', 'Day'), ('week', 'Week')])),
+                ('period_start', models.DateTimeField(help_text='Start of the aggregation period')),
+                ('count', models.PositiveIntegerField(help_text='Number of measurements', default=0)),
+                ('min', models.FloatField(help_text='Minimum measurement value')),
+                ('max', models.FloatField(help_text='Maximum measurement value')),
+                ('total', models.FloatField(help_text='Sum of the measurement values')),
+                ('mean', models.FloatField(help_text='Mean measurement value')),
+                ('last', models.FloatField(help_text='Value of the latest measurement')),
+                ('last_date', models.DateTimeField(help_text='Datetime of the latest job')),
+                ('metric', models.ForeignKey(to='api.Metric')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='measurementrollup',
+            unique_together=set([('metric', 'ci_dataset', 'ci_label', 'resolution', 'period_start')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='measurementrollup',
+            index_together=set([('metric', 'resolution', 'ci_dataset', 'period_start')]),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import json_field.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_measurementrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatsSummary',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('number_of_metrics', models.PositiveIntegerField(default=0)),
+                ('number_of_packages', models.PositiveIntegerField(help_text='Number of packages in the latest job', default=0)),
+                ('number_of_jobs', models.PositiveIntegerField(default=0)),
+                ('number_of_measurements', models.PositiveIntegerField(default=0)),
+                ('datasets', json_field.fields.JSONField(help_text='Names of the datasets', null=True, default=None, blank=True)),
+                ('latest_job_date', models.DateTimeField(null=True, blank=True)),
+            ],
+        ),
+    ]
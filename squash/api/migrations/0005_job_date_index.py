@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_statssummary'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='job',
+            index_together=set([('date', 'id')]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_job_date_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='job',
+            index_together=set([('date', 'id'), ('ci_dataset', 'date'), ('ci_id', 'ci_dataset')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='measurement',
+            index_together=set([('metric', 'job')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='versionedpackage',
+            index_together=set([('job', 'name')]),
+        ),
+    ]
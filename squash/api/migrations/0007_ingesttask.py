@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+import django.utils.timezone
+import json_field.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestTask',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('payload', json_field.fields.JSONField(help_text='Job data as posted', default='null')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=8)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(help_text='Error of the last attempt', blank=True, default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(help_text='Start of the last attempt', null=True, blank=True)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('job', models.ForeignKey(to='api.Job', null=True, blank=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', help_text='Job created by the task')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='ingesttask',
+            index_together=set([('status', 'next_attempt')]),
+        ),
+    ]
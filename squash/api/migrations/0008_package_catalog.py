@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_ingesttask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackageVersion',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('name', models.SlugField(help_text='EUPS package name', max_length=64)),
+                ('git_url', models.URLField(help_text='Git repo URL for package', max_length=128)),
+                ('git_commit', models.CharField(help_text='SHA1 hash of the git commit', max_length=40)),
+                ('git_branch', models.TextField(help_text='Resolved git branch that the commit resides on')),
+                ('build_version', models.TextField(help_text='EUPS build version')),
+                ('digest', models.CharField(help_text='SHA-256 of the other fields, identifies the version', max_length=64, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Manifest',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('digest', models.CharField(help_text='SHA-256 of the digests of the versions', max_length=64, unique=True)),
+                ('size', models.PositiveIntegerField(help_text='Number of packages', default=0)),
+                ('versions', models.ManyToManyField(to='api.PackageVersion', related_name='manifests')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='manifest',
+            field=models.ForeignKey(to='api.Manifest', null=True, blank=True, on_delete=django.db.models.deletion.PROTECT, related_name='jobs', help_text='Package versions used by the job'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import itertools
+
+from django.db import models, migrations
+
+from api.manifests import VERSION_FIELDS, manifest_digest, version_digest
+
+
+def build_manifests(apps, schema_editor):
+    """Move the packages of every job to the catalog and to a manifest
+    shared with the jobs using the same versions"""
+
+    Job = apps.get_model('api', 'Job')
+    VersionedPackage = apps.get_model('api', 'VersionedPackage')
+    PackageVersion = apps.get_model('api', 'PackageVersion')
+    Manifest = apps.get_model('api', 'Manifest')
+    through = Manifest.versions.through
+
+    version_ids = {}
+    manifest_ids = {}
+
+    rows = VersionedPackage.objects.order_by('job', 'id').\
+        values_list('job', *VERSION_FIELDS).iterator()
+
+    for job_id, group in itertools.groupby(rows, key=lambda row: row[0]):
+        packages = [dict(zip(VERSION_FIELDS, row[1:])) for row in group]
+        digests = [version_digest(x) for x in packages]
+        digest = manifest_digest(digests)
+
+        if digest not in manifest_ids:
+            for package, version in zip(packages, digests):
+                if version not in version_ids:
+                    version_ids[version] = PackageVersion.objects.create(
+                        digest=version, **package).id
+
+            manifest = Manifest.objects.create(digest=digest,
+                                               size=len(set(digests)))
+            through.objects.bulk_create(
+                [through(manifest_id=manifest.id,
+                         packageversion_id=version_ids[x])
+                 for x in set(digests)])
+
+            manifest_ids[digest] = manifest.id
+
+        Job.objects.filter(pk=job_id).update(manifest=manifest_ids[digest])
+
+
+def restore_packages(apps, schema_editor):
+    """Copy the versions of the manifest of every job to its packages"""
+
+    Job = apps.get_model('api', 'Job')
+    VersionedPackage = apps.get_model('api', 'VersionedPackage')
+    PackageVersion = apps.get_model('api', 'PackageVersion')
+
+    jobs = Job.objects.exclude(manifest=None).\
+        values_list('id', 'manifest').iterator()
+
+    for job_id, manifest_id in jobs:
+        VersionedPackage.objects.bulk_create(
+            [VersionedPackage(job_id=job_id, **version)
+             for version in PackageVersion.objects.
+             filter(manifests=manifest_id).values(*VERSION_FIELDS)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_package_catalog'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_manifests, restore_packages),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_package_catalog_data'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='versionedpackage',
+            index_together=set([]),
+        ),
+        migrations.RemoveField(
+            model_name='versionedpackage',
+            name='job',
+        ),
+        migrations.DeleteModel(
+            name='VersionedPackage',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_remove_versionedpackage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpecVerdict',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('spec', models.CharField(help_text='Name of the specification, e.g. design', max_length=32)),
+                ('operator', models.CharField(help_text='Operator of the metric', max_length=2)),
+                ('threshold', models.FloatField(help_text='Value of the specification')),
+                ('value', models.FloatField(help_text='Measured value')),
+                ('passed', models.BooleanField(default=False)),
+                ('job', models.ForeignKey(to='api.Job', related_name='verdicts')),
+                ('metric', models.ForeignKey(to='api.Metric')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='specverdict',
+            index_together=set([('passed', 'spec', 'job')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_specverdict'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Regression',
+            fields=[
+                ('id', models.AutoField(serialize=False, auto_created=True, verbose_name='ID', primary_key=True)),
+                ('ci_dataset', models.CharField(help_text='Name of the dataset, e.g cfht', max_length=16)),
+                ('date', models.DateTimeField(help_text='Datetime when job was registered', db_index=True)),
+                ('value', models.FloatField(help_text='Measured value')),
+                ('baseline', models.FloatField(help_text='Mean of the previous measurements')),
+                ('spread', models.FloatField(help_text='Standard deviation of the previous measurements')),
+                ('direction', models.CharField(help_text='Direction of the change wrt the operator of the metric', max_length=8, choices=[('worse', 'Worse'), ('better', 'Better'), ('changed', 'Changed')])),
+                ('job', models.ForeignKey(to='api.Job', related_name='regressions')),
+                ('metric', models.ForeignKey(to='api.Metric')),
+            ],
+        ),
+        migrations.AlterIndexTogether(
+            name='regression',
+            index_together=set([('ci_dataset', 'date'), ('metric', 'ci_dataset', 'date')]),
+        ),
+    ]
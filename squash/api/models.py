@@ -1,7 +1,18 @@
+import datetime
 import json
-from django.db import models
+
+import pandas as pd
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
 from json_field import JSONField
 
+from .code_changes import code_change_entry, diff_manifests
+from .manifests import VERSION_FIELDS, manifest_digest, version_digest
+from .regressions import BETTER, CHANGED, WORSE, detect_jumps
+from .verdicts import evaluate_specs, get_spec_frame
+
 
 class Job(models.Model):
     """Job information"""
@@ -25,13 +36,76 @@ class Job(models.Model):
     blobs = JSONField(null=True, blank=True, default=None,
                       help_text='Data blobs produced by the job.',
                       decoder=None)
+    manifest = models.ForeignKey('Manifest', null=True, blank=True,
+                                 on_delete=models.PROTECT,
+                                 related_name='jobs',
+                                 help_text='Package versions used by the job')
+
+    class Meta:
+        # (date, id) is the key of the keyset pagination of the jobs, see
+        # api/pagination.py, (ci_dataset, date) serves the dataset filters
+        # and (ci_id, ci_dataset) the job lookup of the apps endpoint
+        index_together = (('date', 'id'), ('ci_dataset', 'date'),
+                          ('ci_id', 'ci_dataset'))
 
     def __str__(self):
         return self.ci_id
 
+    @property
+    def packages(self):
+        """The package versions used by the job, sorted by name"""
+
+        if self.manifest_id is None:
+            return []
+
+        return sorted(self.manifest.versions.all(), key=lambda x: x.name)
+
+
+class PackageVersionManager(models.Manager):
+
+    def get_ids(self, packages):
+        """Return the ids of package versions, dicts with the
+        `VERSION_FIELDS`, by digest. Missing versions are added to the
+        catalog."""
+
+        versions = {version_digest(x): x for x in packages}
+
+        ids = dict(self.filter(digest__in=list(versions)).
+                   values_list('digest', 'id'))
+
+        missing = [PackageVersion(digest=digest,
+                                  **{x: package[x] for x in VERSION_FIELDS})
+                   for digest, package in versions.items()
+                   if digest not in ids]
+
+        if missing:
+            try:
+                with transaction.atomic():
+                    self.bulk_create(missing)
+            except IntegrityError:
+                # some versions were added by a concurrent ingestion
+                for version in missing:
+                    try:
+                        with transaction.atomic():
+                            version.save()
+                    except IntegrityError:
+                        pass
+
+            # a locking read sees the versions committed by other
+            # transactions
+            ids.update(self.select_for_update().
+                       filter(digest__in=[x.digest for x in missing]).
+                       values_list('digest', 'id'))
 
-class VersionedPackage(models.Model):
-    """A specific version of an Eups Product used in a Job."""
+        return ids
+
+
+class PackageVersion(models.Model):
+    """A specific version of an Eups Product used in a Job.
+
+    Versions are stored once, jobs reference them through their
+    `Manifest`.
+    """
     name = models.SlugField(
         max_length=64, null=False,
         help_text='EUPS package name')
@@ -45,12 +119,14 @@ class VersionedPackage(models.Model):
         help_text='Resolved git branch that the commit resides on')
     build_version = models.TextField(
         help_text='EUPS build version')
+    digest = models.CharField(
+        max_length=64, unique=True,
+        help_text='SHA-256 of the other fields, identifies the version')
 
-    job = models.ForeignKey(Job, null=False, related_name='packages')
+    objects = PackageVersionManager()
 
     def __str__(self):
-        return json.dumps({'_class': 'VersionedPackage',
-                           'job.ci_id': self.job.ci_id,
+        return json.dumps({'_class': 'PackageVersion',
                            'name': self.name,
                            'git_url': self.git_url,
                            'git_commit': self.git_commit,
@@ -59,6 +135,96 @@ class VersionedPackage(models.Model):
                           indent=2, sort_keys=True)
 
 
+class ManifestManager(models.Manager):
+
+    def get_for_packages(self, packages):
+        """Return the manifest of a job using `packages`, dicts with the
+        `VERSION_FIELDS`, or None if the job uses no package.
+
+        The manifest is created, and the missing versions added to the
+        catalog, only if no job used the same versions before.
+        """
+        if not packages:
+            return None
+
+        digest = manifest_digest(version_digest(x) for x in packages)
+
+        with transaction.atomic():
+            manifest = self.filter(digest=digest).first()
+            if manifest is not None:
+                return manifest
+
+            version_ids = PackageVersion.objects.get_ids(packages)
+
+            try:
+                with transaction.atomic():
+                    manifest = self.create(digest=digest,
+                                           size=len(version_ids))
+            except IntegrityError:
+                # created by a concurrent ingestion
+                return self.select_for_update().get(digest=digest)
+
+            through = Manifest.versions.through
+            through.objects.bulk_create(
+                [through(manifest_id=manifest.id, packageversion_id=x)
+                 for x in version_ids.values()])
+
+        return manifest
+
+    def diff(self, prev_id, curr_id):
+        """Compare the manifests of two jobs, either can be None for a job
+        without packages. See `code_changes.diff_manifests`.
+
+        Manifests are compared as sets of version ids, only the versions
+        used by one of the jobs are read.
+        """
+        if prev_id == curr_id:
+            return [], [], []
+
+        version_ids = {prev_id: set(), curr_id: set()}
+
+        rows = Manifest.versions.through.objects.\
+            filter(manifest__in=[x for x in (prev_id, curr_id)
+                                 if x is not None]).\
+            values_list('manifest', 'packageversion')
+
+        for manifest_id, version_id in rows:
+            version_ids[manifest_id].add(version_id)
+
+        prev_ids = version_ids[prev_id]
+        curr_ids = version_ids[curr_id]
+
+        versions = {}
+        if prev_ids ^ curr_ids:
+            for version_id, name, git_commit, git_url in \
+                    PackageVersion.objects.filter(id__in=prev_ids ^ curr_ids).\
+                    values_list('id', 'name', 'git_commit', 'git_url'):
+                versions[version_id] = (name, (git_commit, git_url))
+
+        return diff_manifests(dict(versions[x] for x in prev_ids - curr_ids),
+                              dict(versions[x] for x in curr_ids - prev_ids))
+
+
+class Manifest(models.Model):
+    """The set of package versions used by a Job.
+
+    Jobs using the same versions, most consecutive jobs, share the manifest
+    so that it is stored once.
+    """
+    digest = models.CharField(
+        max_length=64, unique=True,
+        help_text='SHA-256 of the digests of the versions')
+    size = models.PositiveIntegerField(default=0,
+                                       help_text='Number of packages')
+    versions = models.ManyToManyField(PackageVersion,
+                                      related_name='manifests')
+
+    objects = ManifestManager()
+
+    def __str__(self):
+        return self.digest
+
+
 class Metric(models.Model):
     """Metric definition.
     """
@@ -95,5 +261,619 @@ class Measurement(models.Model):
                          help_text='Measurement metadata',
                          decoder=None)
 
+    class Meta:
+        # measurements are selected by metric and joined to their job
+        index_together = (('metric', 'job'),)
+
     def __float__(self):
         return self.value
+
+
+class SpecVerdictManager(models.Manager):
+
+    def evaluate(self, rows, metrics):
+        """Evaluate measurements against the specifications of their
+        metric, return the unsaved verdicts.
+
+        Parameters
+        ----------
+        rows : iterable
+            ``(job_id, metric_id, value)`` of the measurements.
+        metrics : iterable
+            The `Metric` objects of the measurements.
+        """
+        measurements = pd.DataFrame(list(rows),
+                                    columns=['job', 'metric', 'value'])
+        frame = evaluate_specs(measurements, get_spec_frame(metrics))
+
+        return [SpecVerdict(job_id=int(job_id), metric_id=metric_id,
+                            spec=spec, operator=operator,
+                            threshold=float(threshold), value=float(value),
+                            passed=bool(passed))
+                for job_id, metric_id, spec, operator, threshold, value,
+                passed in zip(frame['job'], frame['metric'], frame['spec'],
+                              frame['operator'], frame['threshold'],
+                              frame['value'], frame['passed'])]
+
+    def create_for_job(self, job, measurements):
+        """Evaluate the measurements of a newly ingested job"""
+
+        metrics = {x.metric_id: x.metric for x in measurements}
+        verdicts = self.evaluate(
+            [(job.id, x.metric_id, x.value) for x in measurements],
+            metrics.values())
+
+        self.bulk_create(verdicts)
+
+        return verdicts
+
+    def get_failing_jobs(self, spec=None):
+        """Return the ids of the jobs with a measurement failing the `spec`
+        specification of its metric, or any specification"""
+
+        verdicts = self.filter(passed=False)
+
+        if spec is not None:
+            verdicts = verdicts.filter(spec=spec)
+
+        return verdicts.values('job')
+
+
+class SpecVerdict(models.Model):
+    """Evaluation of a measurement against a specification of its metric,
+    see api/verdicts.py.
+
+    Rows are created when a job is ingested, or rebuilt with the
+    `build_verdicts` command, e.g. after the specifications of a metric
+    changed.
+    """
+    job = models.ForeignKey(Job, related_name='verdicts')
+    metric = models.ForeignKey(Metric)
+    spec = models.CharField(max_length=32,
+                            help_text='Name of the specification, '
+                                      'e.g. design')
+    operator = models.CharField(max_length=2,
+                                help_text='Operator of the metric')
+    threshold = models.FloatField(help_text='Value of the specification')
+    value = models.FloatField(help_text='Measured value')
+    passed = models.BooleanField(default=False)
+
+    objects = SpecVerdictManager()
+
+    class Meta:
+        # the failing jobs are selected by spec
+        index_together = (('passed', 'spec', 'job'),)
+
+
+class CodeChangeManager(models.Manager):
+
+    def make(self, added, removed, changed, **kwargs):
+        """Return an unsaved delta, the ``(name, git_commit, git_url)``
+        tuples of `Manifest.objects.diff` are stored as JSON lists, as they
+        are read back"""
+
+        added, removed, changed = ([list(x) for x in entries]
+                                   for entries in (added, removed, changed))
+
+        return self.model(added=added, removed=removed, changed=changed,
+                          count=len(added) + len(removed) + len(changed),
+                          **kwargs)
+
+    def create_for_job(self, job):
+        """Compute and store the package delta of a newly ingested job wrt
+        the previous job of the same dataset.
+        """
+        previous_job = Job.objects.\
+            filter(ci_dataset=job.ci_dataset).\
+            filter(Q(date__lt=job.date) | Q(date=job.date, id__lt=job.id)).\
+            order_by('-date', '-id').first()
+
+        added, removed, changed = [], [], []
+
+        if previous_job is not None:
+            added, removed, changed = Manifest.objects.diff(
+                previous_job.manifest_id, job.manifest_id)
+
+        code_change = self.make(added, removed, changed, job=job,
+                                previous_job=previous_job,
+                                ci_dataset=job.ci_dataset, date=job.date)
+        code_change.save(force_insert=True, using=self.db)
+
+        return code_change
+
+
+class CodeChange(models.Model):
+    """Packages that changed in a Job wrt the previous Job of the same
+    dataset.
+
+    Rows are created when a job is ingested, or rebuilt from the job
+    manifests with the `build_code_changes` command.
+    """
+    job = models.OneToOneField(Job, related_name='code_change')
+    previous_job = models.ForeignKey(Job, null=True, blank=True,
+                                     on_delete=models.SET_NULL,
+                                     related_name='+')
+    # denormalized from job so that listing code changes is a single
+    # indexed read
+    ci_dataset = models.CharField(max_length=16, blank=False,
+                                  help_text='Name of the dataset, e.g cfht')
+    date = models.DateTimeField(db_index=True,
+                                help_text='Datetime when job was registered')
+    added = JSONField(null=True, blank=True, default=None,
+                      help_text='Packages added in this job',
+                      decoder=None)
+    removed = JSONField(null=True, blank=True, default=None,
+                        help_text='Packages removed in this job',
+                        decoder=None)
+    changed = JSONField(null=True, blank=True, default=None,
+                        help_text='Packages whose git commit changed',
+                        decoder=None)
+    count = models.PositiveIntegerField(default=0,
+                                        help_text='Number of differences')
+
+    objects = CodeChangeManager()
+
+    class Meta:
+        index_together = (('ci_dataset', 'date'),)
+
+    def __str__(self):
+        return self.job.ci_id
+
+    def as_entry(self):
+        """Format the delta as returned by the code changes endpoint"""
+
+        return code_change_entry(self.job.ci_id,
+                                 [tuple(x) for x in self.added or []],
+                                 [tuple(x) for x in self.removed or []],
+                                 [tuple(x) for x in self.changed or []])
+
+
+class RegressionManager(models.Manager):
+
+    def detect(self, rows, operators, window, threshold):
+        """Detect the jumps of measurement series, return the unsaved
+        regressions.
+
+        Parameters
+        ----------
+        rows : iterable
+            ``(job_id, date, metric_id, ci_dataset, value)`` of the
+            measurements.
+        operators : dict
+            The operators of the metrics by id.
+        window, threshold
+            See `regressions.detect_jumps`.
+        """
+        frame = pd.DataFrame(list(rows), columns=['job', 'date', 'metric',
+                                                  'ci_dataset', 'value'])
+        frame['operator'] = frame['metric'].map(operators)
+
+        jumps = detect_jumps(frame, window, threshold)
+
+        return [Regression(job_id=int(job_id), date=date,
+                           metric_id=metric_id, ci_dataset=ci_dataset,
+                           value=float(value), baseline=float(baseline),
+                           spread=float(spread), direction=direction)
+                for job_id, date, metric_id, ci_dataset, value, baseline,
+                spread, direction in zip(
+                    jumps['job'], jumps['date'], jumps['metric'],
+                    jumps['ci_dataset'], jumps['value'], jumps['baseline'],
+                    jumps['spread'], jumps['direction'])]
+
+    def create_for_job(self, job, measurements):
+        """Detect the jumps of the measurements of a newly ingested job wrt
+        the previous measurements of their series.
+
+        Only the last `SQUASH_REGRESSION_WINDOW` measurements of every
+        series are read, with one query per metric.
+        """
+        window = settings.SQUASH_REGRESSION_WINDOW
+
+        operators = {x.metric_id: x.metric.operator for x in measurements}
+        rows = [(job.id, job.date, x.metric_id, job.ci_dataset, x.value)
+                for x in measurements]
+
+        for metric_id in operators:
+            previous = Measurement.objects.\
+                filter(metric=metric_id, job__ci_dataset=job.ci_dataset).\
+                exclude(job=job).order_by('-job__date', '-job__id').\
+                values_list('job', 'job__date', 'value')[:window]
+
+            rows.extend((job_id, date, metric_id, job.ci_dataset, value)
+                        for job_id, date, value in previous)
+
+        regressions = [x for x in self.detect(
+            rows, operators, window, settings.SQUASH_REGRESSION_THRESHOLD)
+            if x.job_id == job.id]
+
+        self.bulk_create(regressions)
+
+        return regressions
+
+
+class Regression(models.Model):
+    """Jump of the measurements of a metric for a dataset, see
+    api/regressions.py.
+
+    Rows are created when a job is ingested, or rebuilt from the
+    measurements with the `build_regressions` command.
+    """
+    DIRECTION_CHOICES = ((WORSE, 'Worse'), (BETTER, 'Better'),
+                         (CHANGED, 'Changed'))
+
+    job = models.ForeignKey(Job, related_name='regressions')
+    metric = models.ForeignKey(Metric)
+    # denormalized from job so that listing regressions is a single
+    # indexed read
+    ci_dataset = models.CharField(max_length=16, blank=False,
+                                  help_text='Name of the dataset, e.g cfht')
+    date = models.DateTimeField(db_index=True,
+                                help_text='Datetime when job was registered')
+    value = models.FloatField(help_text='Measured value')
+    baseline = models.FloatField(help_text='Mean of the previous '
+                                           'measurements')
+    spread = models.FloatField(help_text='Standard deviation of the '
+                                         'previous measurements')
+    direction = models.CharField(max_length=8, choices=DIRECTION_CHOICES,
+                                 help_text='Direction of the change wrt '
+                                           'the operator of the metric')
+
+    objects = RegressionManager()
+
+    class Meta:
+        index_together = (('ci_dataset', 'date'),
+                          ('metric', 'ci_dataset', 'date'))
+
+    def __str__(self):
+        return '{} {}'.format(self.metric_id, self.job.ci_id)
+
+
+def get_period_start(date, resolution):
+    """Start of the day or of the week (Monday) of a datetime"""
+
+    start = date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if resolution == MeasurementRollup.WEEK:
+        start -= datetime.timedelta(days=start.weekday())
+
+    return start
+
+
+def get_period_end(start, resolution):
+    """End, excluded, of the period starting at `start`"""
+
+    days = 7 if resolution == MeasurementRollup.WEEK else 1
+
+    return start + datetime.timedelta(days=days)
+
+
+class MeasurementRollupManager(models.Manager):
+
+    def update_for_job(self, job, measurements):
+        """Add the measurements of a newly ingested job to the daily and
+        weekly rollups.
+
+        Parameters
+        ----------
+        job : `Job`
+        measurements : iterable
+            `Measurement` objects of the job.
+        """
+        stats = {}
+        for measurement in measurements:
+            value = measurement.value
+            s = stats.setdefault(measurement.metric_id,
+                                 {'count': 0, 'min': value, 'max': value,
+                                  'total': 0.0})
+            s['count'] += 1
+            s['min'] = min(s['min'], value)
+            s['max'] = max(s['max'], value)
+            s['total'] += value
+            s['last'] = value
+
+        for resolution, _ in MeasurementRollup.RESOLUTION_CHOICES:
+            period_start = get_period_start(job.date, resolution)
+
+            for metric_id, s in stats.items():
+                rollup, created = self.select_for_update().get_or_create(
+                    metric_id=metric_id, ci_dataset=job.ci_dataset,
+                    ci_label=job.ci_label, resolution=resolution,
+                    period_start=period_start,
+                    defaults={'count': s['count'], 'min': s['min'],
+                              'max': s['max'], 'total': s['total'],
+                              'mean': s['total'] / s['count'],
+                              'last': s['last'], 'last_date': job.date})
+
+                if not created:
+                    rollup.add(s['count'], s['min'], s['max'], s['total'],
+                               s['last'], job.date)
+                    rollup.save()
+
+    def rebuild_for_measurement(self, metric_id, job):
+        """Compute again the rollups holding a measurement of a job from
+        the measurements, after the measurement was changed or deleted
+        outside the ingestion path, e.g. in the admin interface.
+
+        Minimum and maximum can not be updated incrementally when a value is
+        removed, so the periods are aggregated again.
+        """
+        for resolution, _ in MeasurementRollup.RESOLUTION_CHOICES:
+            period_start = get_period_start(job.date, resolution)
+            key = {'metric_id': metric_id, 'ci_dataset': job.ci_dataset,
+                   'ci_label': job.ci_label, 'resolution': resolution,
+                   'period_start': period_start}
+
+            measurements = Measurement.objects.filter(
+                metric=metric_id, job__ci_dataset=job.ci_dataset,
+                job__ci_label=job.ci_label, job__date__gte=period_start,
+                job__date__lt=get_period_end(period_start, resolution))
+
+            stats = measurements.aggregate(count=Count('id'),
+                                           min=Min('value'),
+                                           max=Max('value'),
+                                           total=Sum('value'))
+
+            if not stats['count']:
+                self.filter(**key).delete()
+                continue
+
+            last, last_date = measurements.\
+                order_by('-job__date', '-job__id').\
+                values_list('value', 'job__date')[0]
+
+            self.update_or_create(
+                defaults={'count': stats['count'], 'min': stats['min'],
+                          'max': stats['max'], 'total': stats['total'],
+                          'mean': stats['total'] / stats['count'],
+                          'last': last, 'last_date': last_date},
+                **key)
+
+
+class MeasurementRollup(models.Model):
+    """Daily or weekly aggregate of the measurements of a metric for a
+    dataset and platform.
+
+    Rollups are updated when a job is ingested, when a measurement is
+    changed or deleted, see api/signals.py, or rebuilt from the measurements
+    with the `build_rollups` command. Changing the date, dataset or
+    platform of a job does not update them, run `build_rollups` then.
+    """
+    DAY = 'day'
+    WEEK = 'week'
+    RESOLUTION_CHOICES = ((DAY, 'Day'), (WEEK, 'Week'))
+
+    metric = models.ForeignKey(Metric, null=False)
+    ci_dataset = models.CharField(max_length=16, blank=False,
+                                  help_text='Name of the dataset, e.g cfht')
+    ci_label = models.CharField(max_length=16, blank=False,
+                                help_text='Name of the platform, eg. centos-7')
+    resolution = models.CharField(max_length=4, choices=RESOLUTION_CHOICES,
+                                  help_text='Aggregation period')
+    period_start = models.DateTimeField(help_text='Start of the aggregation '
+                                                  'period')
+    count = models.PositiveIntegerField(default=0,
+                                        help_text='Number of measurements')
+    min = models.FloatField(help_text='Minimum measurement value')
+    max = models.FloatField(help_text='Maximum measurement value')
+    total = models.FloatField(help_text='Sum of the measurement values')
+    mean = models.FloatField(help_text='Mean measurement value')
+    last = models.FloatField(help_text='Value of the latest measurement')
+    last_date = models.DateTimeField(help_text='Datetime of the latest job')
+
+    objects = MeasurementRollupManager()
+
+    class Meta:
+        unique_together = (('metric', 'ci_dataset', 'ci_label',
+                            'resolution', 'period_start'),)
+        index_together = (('metric', 'resolution', 'ci_dataset',
+                           'period_start'),)
+
+    def add(self, count, min_value, max_value, total, last, date):
+        """Merge the aggregate of new measurements"""
+
+        self.count += count
+        self.min = min(self.min, min_value)
+        self.max = max(self.max, max_value)
+        self.total += total
+        self.mean = self.total / self.count
+
+        if date >= self.last_date:
+            self.last = last
+            self.last_date = date
+
+
+class StatsSummaryManager(models.Manager):
+
+    def get_summary(self):
+        """Return the summary, computing it if it does not exist yet"""
+
+        summary = self.filter(pk=StatsSummary.SUMMARY_ID).first()
+
+        if summary is None:
+            summary = self.reconcile()
+
+        return summary
+
+    def reconcile(self):
+        """Recompute the summary from the full tables"""
+
+        summary = StatsSummary(pk=StatsSummary.SUMMARY_ID)
+
+        latest_job = Job.objects.order_by('-pk').first()
+
+        summary.number_of_metrics = Metric.objects.count()
+        summary.number_of_jobs = Job.objects.count()
+        summary.number_of_measurements = Measurement.objects.count()
+        summary.datasets = sorted(
+            Job.objects.values_list('ci_dataset', flat=True).distinct())
+
+        if latest_job is not None:
+            if latest_job.manifest_id is not None:
+                summary.number_of_packages = latest_job.manifest.size
+            summary.latest_job_date = latest_job.date
+
+        summary.save()
+
+        return summary
+
+    def update_for_job(self, job, number_of_measurements,
+                       number_of_packages):
+        """Account for a newly ingested job"""
+
+        summary = self.select_for_update().\
+            filter(pk=StatsSummary.SUMMARY_ID).first()
+
+        if summary is None:
+            # the new job is already counted
+            return self.reconcile()
+
+        summary.number_of_jobs += 1
+        summary.number_of_measurements += number_of_measurements
+        summary.number_of_packages = number_of_packages
+        summary.latest_job_date = job.date
+
+        if job.ci_dataset not in summary.datasets:
+            summary.datasets = sorted(summary.datasets + [job.ci_dataset])
+
+        summary.save()
+
+        return summary
+
+    def update_for_metric(self):
+        """Account for a newly created metric"""
+
+        self.filter(pk=StatsSummary.SUMMARY_ID).\
+            update(number_of_metrics=F('number_of_metrics') + 1)
+
+
+class StatsSummary(models.Model):
+    """Counters shown on the squash home page.
+
+    A single row maintained when jobs and metrics are created through the
+    API, so that reading the statistics does not scan the tables. Use the
+    `reconcile_stats` command to repair it, e.g. after deleting objects in
+    the admin interface.
+    """
+    SUMMARY_ID = 1
+
+    number_of_metrics = models.PositiveIntegerField(default=0)
+    number_of_packages = models.PositiveIntegerField(
+        default=0, help_text='Number of packages in the latest job')
+    number_of_jobs = models.PositiveIntegerField(default=0)
+    number_of_measurements = models.PositiveIntegerField(default=0)
+    datasets = JSONField(null=True, blank=True, default=None,
+                         help_text='Names of the datasets',
+                         decoder=None)
+    latest_job_date = models.DateTimeField(null=True, blank=True)
+
+    objects = StatsSummaryManager()
+
+
+class IngestTaskManager(models.Manager):
+
+    def claim(self, batch_size):
+        """Mark the next pending tasks as running and return them, the
+        rows are locked while claimed so that workers do not share tasks"""
+
+        now = timezone.now()
+
+        with transaction.atomic():
+            ids = list(self.select_for_update().
+                       filter(status=IngestTask.PENDING,
+                              next_attempt__lte=now).
+                       order_by('id').
+                       values_list('id', flat=True)[:batch_size])
+
+            self.filter(pk__in=ids).update(status=IngestTask.RUNNING,
+                                           started=now,
+                                           attempts=F('attempts') + 1)
+
+        return list(self.filter(pk__in=ids).order_by('id'))
+
+    def requeue_stale(self, timeout, max_attempts):
+        """Return to the queue the tasks running for more than `timeout`
+        seconds, their worker died. The tasks attempted `max_attempts` times
+        fail, e.g. a payload crashing the worker.
+
+        Return the number of tasks queued again and of failed tasks.
+        """
+
+        started = timezone.now() - datetime.timedelta(seconds=timeout)
+        stale = self.filter(status=IngestTask.RUNNING, started__lt=started)
+
+        failed = stale.filter(attempts__gte=max_attempts).update(
+            status=IngestTask.FAILED,
+            error='The worker stopped while processing the task.')
+        requeued = stale.update(status=IngestTask.PENDING)
+
+        return requeued, failed
+
+    def get_depth(self):
+        """Return the number of tasks in each status"""
+
+        depth = dict.fromkeys(dict(IngestTask.STATUS_CHOICES), 0)
+
+        for row in self.values('status').annotate(count=Count('id')).\
+                order_by():
+            depth[row['status']] = row['count']
+
+        return depth
+
+
+class IngestTask(models.Model):
+    """A job waiting to be ingested by the `process_ingest_queue` command.
+
+    Jobs posted in asynchronous mode are validated and queued, with their
+    blobs already in the blob store, and created later by the worker with
+    `JobSerializer` as if they had been posted synchronously.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = ((PENDING, 'Pending'), (RUNNING, 'Running'),
+                      (DONE, 'Done'), (FAILED, 'Failed'))
+
+    payload = JSONField(help_text='Job data as posted', decoder=None)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default='',
+                             help_text='Error of the last attempt')
+    job = models.ForeignKey(Job, null=True, blank=True,
+                            on_delete=models.SET_NULL, related_name='+',
+                            help_text='Job created by the task')
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True,
+                                   help_text='Start of the last attempt')
+    next_attempt = models.DateTimeField(default=timezone.now)
+
+    objects = IngestTaskManager()
+
+    class Meta:
+        # pending tasks are claimed in order
+        index_together = (('status', 'next_attempt'),)
+
+    def finish(self, job):
+        self.status = IngestTask.DONE
+        self.job = job
+        self.error = ''
+        self.save()
+
+    def fail(self, error):
+        self.status = IngestTask.FAILED
+        # the job may have been rolled back
+        self.job = None
+        self.error = error
+        self.save()
+
+    def retry(self, error, delay):
+        """Queue the task again in `delay` seconds"""
+
+        self.status = IngestTask.PENDING
+        self.job = None
+        self.error = error
+        self.next_attempt = timezone.now() + \
+            datetime.timedelta(seconds=delay)
+        self.save()
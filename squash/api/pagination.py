@@ -0,0 +1,215 @@
+"""Keyset pagination.
+
+Pages are selected with a condition on the sort key of the last row of the
+previous page instead of an OFFSET, so reading a page costs the same
+wherever it is in the history, and rows inserted while a client pages
+through the results do not shift the following pages.
+"""
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.template import Context, loader
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(reverse, position):
+    """Return an opaque cursor for a position in the sort order"""
+
+    data = json.dumps({'r': int(reverse), 'p': position},
+                      separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """Return ``(reverse, position)`` from a cursor, or ``None`` if the
+    cursor is invalid"""
+
+    try:
+        data = json.loads(base64.urlsafe_b64decode(
+            encoded.encode('ascii')).decode('utf-8'))
+        reverse = bool(data['r'])
+        position = data['p']
+    except (binascii.Error, KeyError, TypeError, ValueError):
+        return None
+
+    if not isinstance(position, list):
+        return None
+
+    return reverse, position
+
+
+def reverse_ordering(ordering):
+    return tuple(x[1:] if x.startswith('-') else '-' + x for x in ordering)
+
+
+def get_position_filter(ordering, position, reverse=False):
+    """Return the condition selecting the rows after ``position`` in the
+    ``ordering``, or before it if ``reverse`` is true.
+
+    For the ordering ``('date', 'id')`` it is equivalent to the row value
+    comparison ``(date, id) > (d, i)``, which not every database can match
+    against an index, written as
+    ``date >= d AND (date > d OR (date = d AND id > i))``.
+    """
+    condition = None
+    equal = {}
+
+    for order, value in zip(ordering, position):
+        name = order.lstrip('-')
+        descending = order.startswith('-') != reverse
+
+        lookup = '{}__{}'.format(name, 'lt' if descending else 'gt')
+        term = Q(**dict(equal, **{lookup: value}))
+        condition = term if condition is None else condition | term
+
+        equal[name] = value
+
+    first = ordering[0]
+    lookup = '{}__{}'.format(first.lstrip('-'),
+                             'lte' if first.startswith('-') != reverse
+                             else 'gte')
+
+    return Q(**{lookup: position[0]}) & condition
+
+
+class KeysetPagination(BasePagination):
+    """Paginate a queryset by keyset on `ordering`.
+
+    The last field of `ordering` must be unique. An ordering requested with
+    the `OrderingFilter` of the view is used instead, and completed with the
+    fields of `ordering` so that the sort key stays unique.
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+    ordering = ('id',)
+    page_size = 25
+    template = 'rest_framework/pagination/previous_and_next.html'
+
+    def get_page_size(self, view):
+        return getattr(view, 'paginate_by', None) or self.page_size
+
+    def get_ordering(self, request, queryset, view):
+
+        ordering = None
+        for backend in getattr(view, 'filter_backends', []):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+
+        if not ordering:
+            return tuple(self.ordering)
+
+        names = [x.lstrip('-') for x in ordering]
+        prefix = '-' if ordering[0].startswith('-') else ''
+
+        return tuple(ordering) + tuple(prefix + x.lstrip('-')
+                                       for x in self.ordering
+                                       if x.lstrip('-') not in names)
+
+    def get_position(self, instance):
+        """Return the sort key of a row, as strings so that the cursor
+        can be encoded as JSON"""
+
+        opts = instance._meta
+        return [opts.get_field(x.lstrip('-')).value_to_string(instance)
+                for x in self.ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+
+        self.page_size = self.get_page_size(view)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        encoded = request.query_params.get(self.cursor_query_param)
+
+        if encoded is None:
+            reverse, position = False, None
+        else:
+            cursor = decode_cursor(encoded)
+            if cursor is None or len(cursor[1]) != len(self.ordering):
+                raise NotFound(self.invalid_cursor_message)
+            reverse, position = cursor
+
+        if reverse:
+            queryset = queryset.order_by(*reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        try:
+            if position is not None:
+                queryset = queryset.filter(
+                    get_position_filter(self.ordering, position, reverse))
+
+            # an extra row tells if there is a page following this one
+            results = list(queryset[:self.page_size + 1])
+        except (ValidationError, ValueError):
+            # the cursor position does not match the field types
+            raise NotFound(self.invalid_cursor_message)
+
+        self.page = results[:self.page_size]
+        has_following = len(results) > self.page_size
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None and bool(self.page)
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None and bool(self.page)
+
+        if (self.has_previous or self.has_next) and \
+                self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        cursor = encode_cursor(False, self.get_position(self.page[-1]))
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+
+        cursor = encode_cursor(True, self.get_position(self.page[0]))
+        return replace_query_param(self.base_url, self.cursor_query_param,
+                                   cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link()
+        }
+
+    def to_html(self):
+        template = loader.get_template(self.template)
+        context = Context(self.get_html_context())
+        return template.render(context)
+
+
+class JobPagination(KeysetPagination):
+    ordering = ('date', 'id')
+
+
+class MetricPagination(KeysetPagination):
+    ordering = ('metric',)
@@ -0,0 +1,91 @@
+"""Capture the SQL run by a request and inspect its query plans.
+
+Used by the query plan regression tests in api/tests.py to detect the
+endpoints that read a whole table. MySQL and SQLite plans are supported.
+"""
+import re
+
+from django.test.utils import CaptureQueriesContext
+
+# SQLite plan detail of a full table scan, a scan using an index reads the
+# rows in index order and is not reported
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+
+# statement reading the first rows of a table in primary key order, without
+# filter: SQLite reports a scan but stops after LIMIT rows
+SQLITE_PK_RANGE = re.compile(r'^SELECT .+ FROM "(\w+)" ORDER BY "\1"\."id" '
+                             r'(?:ASC|DESC) LIMIT \d+(?: OFFSET \d+)?$',
+                             re.DOTALL)
+
+
+class CaptureStatements(CaptureQueriesContext):
+    """Capture the statements run on a connection with their parameters.
+
+    ``captured_queries`` has the parameters interpolated for display only,
+    ``statements`` is the list of ``(sql, params)`` that can be run again.
+    """
+
+    def __enter__(self):
+        self.statements = []
+
+        ops = self.connection.ops
+        last_executed_query = ops.last_executed_query
+
+        def record(cursor, sql, params):
+            self.statements.append((sql, params))
+            return last_executed_query(cursor, sql, params)
+
+        ops.last_executed_query = record
+
+        return super(CaptureStatements, self).__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        del self.connection.ops.last_executed_query
+        super(CaptureStatements, self).__exit__(exc_type, exc_value,
+                                                traceback)
+
+    @property
+    def selects(self):
+        return [(sql, params) for sql, params in self.statements
+                if sql.lstrip().upper().startswith('SELECT')]
+
+
+def is_supported(connection):
+    return connection.vendor in ('mysql', 'sqlite')
+
+
+def explain(connection, sql, params=None):
+    """Return the query plan of a statement as a list of dicts"""
+
+    if connection.vendor == 'sqlite':
+        sql = 'EXPLAIN QUERY PLAN ' + sql
+    else:
+        sql = 'EXPLAIN ' + sql
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [x[0] for x in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def get_full_scans(connection, plan, sql=None):
+    """Return the tables read with a full table scan in the query plan of a
+    statement, `sql` is needed to tell the bounded SQLite scans"""
+
+    tables = set()
+
+    bounded = None
+    if sql is not None and connection.vendor == 'sqlite':
+        match = SQLITE_PK_RANGE.match(sql.strip())
+        if match is not None:
+            bounded = match.group(1)
+
+    for row in plan:
+        if connection.vendor == 'sqlite':
+            match = SQLITE_SCAN.match(row['detail'])
+            if match is not None and match.group(1) != bounded:
+                tables.add(match.group(1))
+        elif row['type'] == 'ALL':
+            tables.add(row['table'])
+
+    return tables
@@ -0,0 +1,86 @@
+"""Detection of the jumps of the measurement series.
+
+A series holds the measurements of a metric for a dataset, in job order. A
+measurement is a jump if it differs from the mean of the previous
+``window`` measurements of its series, the baseline, by more than
+``threshold`` times their standard deviation, the spread. A series that was
+constant jumps at its first different value.
+
+Jumps are detected for the measurements of every job when it is ingested,
+and stored as `models.Regression` rows with the direction of the change: a
+jump is ``worse`` if the new value moves against the operator of the metric,
+e.g. up for a metric that must be ``<`` its specifications.
+"""
+import numpy as np
+
+WORSE = 'worse'
+BETTER = 'better'
+CHANGED = 'changed'
+
+SERIES_COLUMNS = ['metric', 'ci_dataset']
+
+# operators of the metrics whose values are better lower or higher
+LOWER_IS_BETTER = ('<', '<=')
+HIGHER_IS_BETTER = ('>', '>=')
+
+
+def get_directions(operators, changes):
+    """Return the directions of changes of the values of metrics with the
+    given operators, both arrays"""
+
+    lower = np.in1d(operators, LOWER_IS_BETTER)
+    higher = np.in1d(operators, HIGHER_IS_BETTER)
+
+    worse = (lower & (changes > 0)) | (higher & (changes < 0))
+    better = (lower & (changes < 0)) | (higher & (changes > 0))
+
+    return np.select([worse, better], [WORSE, BETTER], CHANGED)
+
+
+def detect_jumps(frame, window, threshold):
+    """Detect the jumps of measurement series.
+
+    Parameters
+    ----------
+    frame : pandas.DataFrame
+        Measurements with the ``metric``, ``ci_dataset``, ``operator``,
+        ``value``, ``job`` and ``date`` columns, in any order.
+    window : int
+        Number of previous measurements of the series the baseline is
+        computed from. Measurements with fewer previous measurements are
+        not evaluated.
+    threshold : float
+        Number of standard deviations a jump is away from the baseline.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The jumps, with the columns of `frame` and the ``baseline``,
+        ``spread`` and ``direction`` columns.
+    """
+    frame = frame.sort_values(SERIES_COLUMNS + ['date', 'job'])
+
+    if frame.empty:
+        return frame.assign(baseline=[], spread=[], direction=[])
+
+    # statistics of the `window` previous values, in every series
+    previous = frame.groupby(SERIES_COLUMNS, sort=False)['value'].shift(1)
+    grouped = previous.groupby([frame['metric'], frame['ci_dataset']],
+                               sort=False)
+    baseline = grouped.transform(
+        lambda x: x.rolling(window, min_periods=window).mean())
+    spread = grouped.transform(
+        lambda x: x.rolling(window, min_periods=window).std())
+
+    values = frame['value'].values
+    changes = values - baseline.values
+
+    # comparisons with the NaN of the first values of a series are false
+    with np.errstate(invalid='ignore'):
+        jumps = (np.abs(changes) > threshold * spread.values) & \
+            ~np.isclose(values, baseline.values)
+
+    frame = frame.assign(baseline=baseline, spread=spread,
+                         direction=get_directions(frame['operator'].values,
+                                                  changes))
+    return frame[jumps]
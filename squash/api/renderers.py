@@ -0,0 +1,79 @@
+"""Columnar renderers for the endpoints returning pandas data frames.
+
+These renderers require pyarrow. Clients select them with the ``format``
+query parameter (``?format=arrow``, ``?format=parquet``) or the ``Accept``
+header, and can load the response without parsing JSON.
+"""
+import pandas as pd
+
+from rest_framework import renderers
+
+from .instrumentation import timer
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+
+class DataFrameRenderer(renderers.BaseRenderer):
+    """Base class for renderers writing a pandas data frame as an Arrow
+    table"""
+
+    charset = None
+    render_style = 'binary'
+
+    def get_table(self, data):
+        if pa is None:
+            raise RuntimeError('pyarrow is required to render '
+                               '{}'.format(self.format))
+
+        if isinstance(data, dict):
+            # e.g. error details
+            data = pd.DataFrame([data])
+        elif not isinstance(data, pd.DataFrame):
+            data = pd.DataFrame(data)
+
+        with timer('pandas'):
+            return pa.Table.from_pandas(data, preserve_index=False)
+
+    def write(self, table, sink):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return bytes()
+
+        table = self.get_table(data)
+
+        sink = pa.BufferOutputStream()
+        self.write(table, sink)
+
+        # BufferOutputStream.get_result was renamed getvalue in pyarrow 0.11
+        if hasattr(sink, 'getvalue'):
+            return sink.getvalue().to_pybytes()
+        return sink.get_result().to_pybytes()
+
+
+class ArrowRenderer(DataFrameRenderer):
+    """Render a data frame in the Arrow IPC stream format"""
+
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+
+    def write(self, table, sink):
+        writer = pa.RecordBatchStreamWriter(sink, table.schema)
+        writer.write_table(table)
+        writer.close()
+
+
+class ParquetRenderer(DataFrameRenderer):
+    """Render a data frame in the Parquet format"""
+
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+
+    def write(self, table, sink):
+        pq.write_table(table, sink)
@@ -1,20 +1,66 @@
 from rest_framework import serializers
 from rest_framework.reverse import reverse
-from .models import Job, Metric, Measurement, VersionedPackage
+from .models import Job, Metric, Measurement, PackageVersion, Manifest, \
+    CodeChange, MeasurementRollup, StatsSummary, IngestTask, SpecVerdict, \
+    Regression
 from django.db import transaction
 
+from .blobstore import get_blob_store, is_blob_key, is_durable, \
+    store_blobs
+from .cache import bump_generation
+from .instrumentation import timer
 
-class MetricSerializer(serializers.ModelSerializer):
+# Maximum number of rows inserted by a single INSERT statement when
+# creating the nested objects of a job
+BULK_CREATE_BATCH_SIZE = 500
+
+
+class JSONField(serializers.Field):
+    """Serializer field for `json_field.JSONField` model fields.
+
+    The data is passed through unchanged, rather than converted to the
+    string representation used by the default `CharField` mapping.
+    """
+
+    def to_internal_value(self, data):
+        return data
+
+    def to_representation(self, value):
+        return value
+
+
+class TimedSerializerMixin(object):
+    """Count the serialization in the `serializer` timer of the request
+    instrumentation, see api/instrumentation.py"""
+
+    def to_representation(self, instance):
+        with timer('serializer'):
+            return super(TimedSerializerMixin, self).to_representation(
+                instance)
+
+
+class MetricSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Serializer for `models.Metric` objects.
     """
 
     links = serializers.SerializerMethodField()
 
+    parameters = JSONField(required=False, allow_null=True)
+    specs = JSONField(required=False, allow_null=True)
+    reference = JSONField(required=False, allow_null=True)
+
     class Meta:
         model = Metric
         fields = ('metric', 'unit', 'description', 'operator',
                   'parameters', 'specs', 'reference', 'links',)
 
+    def create(self, validated_data):
+        with transaction.atomic():
+            metric = super(MetricSerializer, self).create(validated_data)
+            StatsSummary.objects.update_for_metric()
+        bump_generation()
+        return metric
+
     def get_links(self, obj):
 
         request = self.context['request']
@@ -34,31 +80,87 @@ class MeasurementSerializer(serializers.ModelSerializer):
     `measurements` field.
     """
 
+    metadata = JSONField(required=False, allow_null=True)
+
     class Meta:
         model = Measurement
         fields = ('metric', 'value', 'metadata',)
 
 
-class VersionedPackageSerializer(serializers.ModelSerializer):
-    """Serializer for `models.VersionedPackage` objects.
+class SpecVerdictSerializer(serializers.ModelSerializer):
+    """Serializer for `models.SpecVerdict` objects.
+    """
+
+    class Meta:
+        model = SpecVerdict
+        fields = ('metric', 'spec', 'value', 'operator', 'threshold',
+                  'passed')
+
+
+class RegressionSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
+    """Serializer for `models.Regression` objects.
+
+    ``code_change`` is the package delta of the job wrt the previous job of
+    the dataset, as returned by the code changes endpoint, or None if it is
+    not known.
+    """
+
+    ci_id = serializers.CharField(source='job.ci_id', read_only=True)
+    code_change = serializers.SerializerMethodField()
+    links = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Regression
+        fields = ('ci_id', 'ci_dataset', 'metric', 'date', 'value',
+                  'baseline', 'spread', 'direction', 'code_change', 'links')
+
+    def get_code_change(self, obj):
+        try:
+            return obj.job.code_change.as_entry()
+        except CodeChange.DoesNotExist:
+            return None
+
+    def get_links(self, obj):
+
+        request = self.context['request']
+        return {
+            'job': reverse('job-detail', kwargs={'pk': obj.job_id},
+                           request=request),
+        }
+
+
+class PackageVersionSerializer(serializers.ModelSerializer):
+    """Serializer for `models.PackageVersion` objects.
 
     This serializer is intended to be nested inside the JobSerializer; the
-    `packages` in Jobs includes a list of VersionedPackages for all packages
+    `packages` in Jobs includes a list of PackageVersions for all packages
     used in a Job.
     """
 
     class Meta:
-        model = VersionedPackage
+        model = PackageVersion
         fields = ('name', 'git_url', 'git_commit', 'git_branch',
                   'build_version')
 
 
-class JobSerializer(serializers.ModelSerializer):
+class JobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Serializer for `models.Job` objects.
+
+    The optional ``fields`` argument restricts the serialized fields, it is
+    used by the read views to return sparse fieldsets.
+    """
+
+    # fields only returned on request, they hold most of the job data
+    EXPANDABLE_FIELDS = ('blobs', 'measurements', 'packages')
 
     links = serializers.SerializerMethodField()
 
     measurements = MeasurementSerializer(many=True)
-    packages = VersionedPackageSerializer(many=True)
+    packages = PackageVersionSerializer(many=True)
+
+    # references to the blobs in the blob store, see api/blobstore.py
+    blobs = JSONField(required=False, allow_null=True)
 
     class Meta:
         model = Job
@@ -66,19 +168,70 @@ class JobSerializer(serializers.ModelSerializer):
                   'ci_url', 'status', 'blobs', 'measurements', 'packages',
                   'links')
 
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+
+        super(JobSerializer, self).__init__(*args, **kwargs)
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def validate_blobs(self, value):
+
+        if value is None:
+            return value
+
+        if not isinstance(value, list) or \
+                not all(isinstance(x, dict) for x in value):
+            raise serializers.ValidationError('Expected a list of blobs.')
+
+        store = get_blob_store()
+        for blob in value:
+            if 'data' in blob:
+                continue
+            key = blob.get('sha256')
+            if not is_blob_key(key) or not store.exists(key):
+                raise serializers.ValidationError(
+                    'Blob {} has no data and does not reference a stored '
+                    'blob.'.format(blob.get('identifier')))
+        return value
+
     # Override the create method to create nested objects from request data
     def create(self, data):
         measurements = data.pop('measurements')
         packages = data.pop('packages')
 
+        # blob data goes to the blob store, the job keeps the references.
+        # Files can not be part of the transaction, the blobs of a job that
+        # fails are deleted by the collect_blobs command
+        if data.get('blobs') and is_durable():
+            data['blobs'] = store_blobs(data['blobs'])
+
         # Use transactions, so that if one of the measurement objects isn't
         # valid that we will rollback even the parent Job object creation
         with transaction.atomic():
-            job = Job.objects.create(**data)
-            for measurement in measurements:
-                Measurement.objects.create(job=job, **measurement)
-            for package in packages:
-                VersionedPackage.objects.create(job=job, **package)
+            # jobs using the same package versions share the manifest
+            manifest = Manifest.objects.get_for_packages(packages)
+            job = Job.objects.create(manifest=manifest, **data)
+
+            # nested objects are inserted in batches rather than with one
+            # INSERT per row
+            measurements = [Measurement(job=job, **measurement)
+                            for measurement in measurements]
+            Measurement.objects.bulk_create(
+                measurements, batch_size=BULK_CREATE_BATCH_SIZE)
+
+            CodeChange.objects.create_for_job(job)
+            MeasurementRollup.objects.update_for_job(job, measurements)
+            SpecVerdict.objects.create_for_job(job, measurements)
+            Regression.objects.create_for_job(job, measurements)
+            StatsSummary.objects.update_for_job(
+                job, len(measurements),
+                manifest.size if manifest is not None else 0)
+
+        # cached responses are invalidated once the job is committed
+        bump_generation()
 
         return job
 
@@ -89,3 +242,27 @@ class JobSerializer(serializers.ModelSerializer):
             'self': reverse('job-detail', kwargs={'pk': obj.pk},
                             request=request),
         }
+
+
+class IngestTaskSerializer(serializers.ModelSerializer):
+    """Serializer for the status of `models.IngestTask` objects.
+    """
+
+    links = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestTask
+        fields = ('id', 'status', 'attempts', 'error', 'created', 'links')
+
+    def get_links(self, obj):
+
+        request = self.context['request']
+        links = {
+            'self': reverse('ingest-detail', kwargs={'pk': obj.pk},
+                            request=request),
+        }
+
+        if obj.job_id is not None:
+            links['job'] = reverse('job-detail', kwargs={'pk': obj.job_id},
+                                   request=request)
+        return links
@@ -0,0 +1,65 @@
+from django.db.models.signals import m2m_changed, post_save, post_delete
+from django.dispatch import receiver
+
+from .app_payloads import delete_payloads
+from .cache import bump_generation
+from .models import Job, Metric, Measurement, PackageVersion, Manifest, \
+    MeasurementRollup
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_save, sender=Metric)
+@receiver(post_save, sender=Measurement)
+@receiver(post_save, sender=PackageVersion)
+@receiver(post_delete, sender=Job)
+@receiver(post_delete, sender=Metric)
+@receiver(post_delete, sender=Measurement)
+@receiver(post_delete, sender=PackageVersion)
+@receiver(m2m_changed, sender=Manifest.versions.through)
+def invalidate_cached_responses(sender, **kwargs):
+    """Start a new data generation when objects are saved or deleted
+    outside the ingestion path, e.g. in the admin interface"""
+
+    bump_generation()
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def invalidate_job_app_payloads(sender, instance, **kwargs):
+    """Delete the app payloads of a job, they do not depend on the data
+    generation, see api/app_payloads.py"""
+
+    delete_payloads(instance.ci_id, instance.ci_dataset,
+                    Metric.objects.values_list('metric', flat=True))
+
+
+@receiver(post_save, sender=Measurement)
+@receiver(post_delete, sender=Measurement)
+def update_measurement_rollups(sender, instance, raw=False, **kwargs):
+    """Aggregate again the rollups of a measurement changed or deleted
+    outside the ingestion path, which does not send signals"""
+
+    # fixtures are loaded before the rollups are built
+    if raw:
+        return
+
+    try:
+        job = instance.job
+    except Job.DoesNotExist:
+        return
+
+    MeasurementRollup.objects.rebuild_for_measurement(instance.metric_id,
+                                                      job)
+
+
+@receiver(post_save, sender=Measurement)
+@receiver(post_delete, sender=Measurement)
+def invalidate_measurement_app_payload(sender, instance, **kwargs):
+
+    try:
+        job = instance.job
+    except Job.DoesNotExist:
+        # deleted along with its job
+        return
+
+    delete_payloads(job.ci_id, job.ci_dataset, [instance.metric_id])
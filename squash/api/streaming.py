@@ -0,0 +1,345 @@
+"""Incremental parser for the newline-delimited JSON (NDJSON) job upload.
+
+The request body is a sequence of JSON records, one per line, each with a
+``type`` key:
+
+``job``
+    A job, with the same fields as accepted by the jobs endpoint except
+    ``blobs``. It is followed by the blobs of the job.
+``blob``
+    A complete blob: ``identifier``, ``name`` and ``data``.
+``blob_start``
+    Starts a chunked blob: ``identifier`` and ``name``.
+``blob_chunk``
+    A fragment of the JSON document of the current chunked blob in
+    ``data``. Fragments are concatenated in order.
+``blob_end``
+    Ends the current chunked blob. The concatenated fragments must be a
+    JSON document.
+
+The body is read in fixed size chunks and no record may exceed
+``SQUASH_NDJSON_MAX_RECORD_SIZE`` bytes, so the memory used to parse the
+upload is bounded regardless of the size of the payload. Chunked blobs are
+checked by `JSONValidator` as the fragments are received, they are never
+held in memory as a whole.
+"""
+import json
+import re
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+
+READ_CHUNK_SIZE = 64 * 1024
+
+# longest number or literal accepted by JSONValidator
+MAX_SCALAR_SIZE = 1024
+
+# states of JSONValidator: the tokens expected next
+VALUE, VALUE_OR_CLOSE, KEY, KEY_OR_CLOSE, COLON, COMMA_OR_CLOSE, END = \
+    range(7)
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRING_CHARS = re.compile(r'[^"\\\x00-\x1f]*')
+SCALAR_CHARS = re.compile(r'[-+.0-9a-zA-Z]*')
+HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+NUMBER = re.compile(r'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?$')
+LITERALS = frozenset(['true', 'false', 'null'])
+
+
+class JSONValidator(object):
+    """Check that text fragments fed in order form a JSON document.
+
+    Only the nesting of the arrays and objects and the current number or
+    literal are kept, the memory used does not depend on the size of the
+    document. `feed` and `close` raise ValueError at the first syntax error.
+    """
+
+    def __init__(self):
+        self.expect = VALUE
+        # '[' or '{' of the open arrays and objects
+        self.stack = []
+        self.scalar = None
+        self.in_string = False
+        self.string_is_key = False
+        # characters of the escape sequence being read in a string
+        self.escape = None
+        self.offset = 0
+
+    def error(self, message, pos=0):
+        raise ValueError('{} at character {}'.format(message,
+                                                     self.offset + pos))
+
+    def end_value(self):
+        if not self.stack:
+            self.expect = END
+        else:
+            self.expect = COMMA_OR_CLOSE
+
+    def end_scalar(self):
+        if self.scalar not in LITERALS and not NUMBER.match(self.scalar):
+            self.error('Invalid value {!r}'.format(self.scalar[:20]))
+        self.scalar = None
+        self.end_value()
+
+    def feed_string(self, text, pos):
+        """Read the characters of a string, return the position after
+        them"""
+
+        end = len(text)
+
+        while pos < end:
+            if self.escape is not None:
+                char = text[pos]
+                if not self.escape:
+                    if char == 'u':
+                        self.escape = 'u'
+                    elif char in '"\\/bfnrt':
+                        self.escape = None
+                    else:
+                        self.error('Invalid escape', pos)
+                elif char in HEX_DIGITS:
+                    self.escape += char
+                    if len(self.escape) == 5:
+                        self.escape = None
+                else:
+                    self.error('Invalid \\u escape', pos)
+                pos += 1
+                continue
+
+            pos = STRING_CHARS.match(text, pos).end()
+            if pos == end:
+                break
+
+            char = text[pos]
+            pos += 1
+            if char == '"':
+                self.in_string = False
+                if self.string_is_key:
+                    self.expect = COLON
+                else:
+                    self.end_value()
+                break
+            elif char == '\\':
+                self.escape = ''
+            else:
+                self.error('Invalid control character', pos - 1)
+
+        return pos
+
+    def feed(self, text):
+
+        pos = 0
+        end = len(text)
+
+        while pos < end:
+            if self.in_string:
+                pos = self.feed_string(text, pos)
+                continue
+
+            if self.scalar is not None:
+                match = SCALAR_CHARS.match(text, pos)
+                self.scalar += match.group()
+                if len(self.scalar) > MAX_SCALAR_SIZE:
+                    self.error('Value too long', pos)
+                pos = match.end()
+                if pos == end:
+                    break
+                self.end_scalar()
+
+            pos = WHITESPACE.match(text, pos).end()
+            if pos == end:
+                break
+
+            char = text[pos]
+            expect = self.expect
+
+            if char == '"' and expect in (VALUE, VALUE_OR_CLOSE, KEY,
+                                          KEY_OR_CLOSE):
+                self.in_string = True
+                self.string_is_key = expect in (KEY, KEY_OR_CLOSE)
+            elif char in '[{' and expect in (VALUE, VALUE_OR_CLOSE):
+                self.stack.append(char)
+                self.expect = VALUE_OR_CLOSE if char == '[' else KEY_OR_CLOSE
+            elif char == ']' and self.stack[-1:] == ['['] and \
+                    expect in (VALUE_OR_CLOSE, COMMA_OR_CLOSE):
+                self.stack.pop()
+                self.end_value()
+            elif char == '}' and self.stack[-1:] == ['{'] and \
+                    expect in (KEY_OR_CLOSE, COMMA_OR_CLOSE):
+                self.stack.pop()
+                self.end_value()
+            elif char == ',' and expect == COMMA_OR_CLOSE:
+                self.expect = VALUE if self.stack[-1] == '[' else KEY
+            elif char == ':' and expect == COLON:
+                self.expect = VALUE
+            elif SCALAR_CHARS.match(char).end() and \
+                    expect in (VALUE, VALUE_OR_CLOSE):
+                self.scalar = ''
+                continue
+            else:
+                self.error('Unexpected {!r}'.format(char), pos)
+
+            pos += 1
+
+        self.offset += end
+
+    def close(self):
+        """Raise ValueError if the text fed is not a complete document"""
+
+        if self.scalar is not None:
+            self.end_scalar()
+        if self.expect != END:
+            self.error('Unexpected end of document')
+
+
+def iter_lines(stream, max_line_size, chunk_size=READ_CHUNK_SIZE):
+    """Yield the non empty lines of a binary stream"""
+
+    buffer = bytearray()
+
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+
+        start = len(buffer)
+        buffer.extend(chunk)
+
+        # only the new data needs to be scanned for line breaks
+        pos = buffer.find(b'\n', start)
+        begin = 0
+        while pos != -1:
+            line = bytes(buffer[begin:pos]).strip()
+            if line:
+                yield line
+            begin = pos + 1
+            pos = buffer.find(b'\n', begin)
+        del buffer[:begin]
+
+        if len(buffer) > max_line_size:
+            raise ParseError('NDJSON record exceeds the maximum size of '
+                             '{} bytes.'.format(max_line_size))
+
+    line = bytes(buffer).strip()
+    if line:
+        yield line
+
+
+def iter_records(stream, max_line_size=None):
+    """Yield the records of an NDJSON stream"""
+
+    if max_line_size is None:
+        max_line_size = settings.SQUASH_NDJSON_MAX_RECORD_SIZE
+
+    for lineno, line in enumerate(iter_lines(stream, max_line_size), 1):
+        try:
+            record = json.loads(line.decode('utf-8'))
+        except ValueError as e:
+            raise ParseError('Invalid NDJSON record at line {}: '
+                             '{}'.format(lineno, e))
+
+        if not isinstance(record, dict) or 'type' not in record:
+            raise ParseError('NDJSON record at line {} has no '
+                             'type.'.format(lineno))
+        yield lineno, record
+
+
+def iter_jobs(stream, blob_store, max_line_size=None):
+    """Parse an NDJSON job upload.
+
+    Blobs are written to ``blob_store`` as they are received.
+
+    Yields
+    ------
+    tuple
+        ``(job, blobs)``, the job record and the references to its blobs
+        in the blob store.
+    """
+    job = None
+    blobs = []
+    # writer, record and validator of the current chunked blob
+    writer = None
+    blob_record = None
+    validator = None
+
+    try:
+        for lineno, record in iter_records(stream, max_line_size):
+            record_type = record.pop('type')
+
+            if record_type == 'job':
+                if writer is not None:
+                    raise ParseError('Unterminated blob before line '
+                                     '{}.'.format(lineno))
+                if job is not None:
+                    yield job, blobs
+                job = record
+                blobs = []
+                continue
+
+            if job is None:
+                raise ParseError('NDJSON record at line {} does not follow '
+                                 'a job record.'.format(lineno))
+
+            if record_type == 'blob':
+                with blob_store.open_writer() as blob_writer:
+                    blob_writer.write(json.dumps(record.get('data')))
+                    blobs.append(blob_reference(record, blob_writer))
+
+            elif record_type == 'blob_start':
+                if writer is not None:
+                    raise ParseError('Unterminated blob before line '
+                                     '{}.'.format(lineno))
+                writer = blob_store.open_writer()
+                blob_record = record
+                validator = JSONValidator()
+
+            elif record_type == 'blob_chunk' and writer is not None:
+                data = record.get('data', '')
+                if not isinstance(data, str):
+                    raise ParseError('Blob chunk at line {} is not a '
+                                     'string.'.format(lineno))
+                try:
+                    validator.feed(data)
+                except ValueError as e:
+                    raise ParseError('Blob {} at line {} is not a JSON '
+                                     'document: {}'.format(
+                                         blob_record.get('identifier'),
+                                         lineno, e))
+                writer.write(data)
+
+            elif record_type == 'blob_end' and writer is not None:
+                try:
+                    validator.close()
+                except ValueError as e:
+                    raise ParseError('Blob {} ending at line {} is not a '
+                                     'JSON document: {}'.format(
+                                         blob_record.get('identifier'),
+                                         lineno, e))
+
+                blobs.append(blob_reference(blob_record, writer))
+                writer = None
+                blob_record = None
+                validator = None
+
+            else:
+                raise ParseError('Unexpected {} record at line '
+                                 '{}.'.format(record_type, lineno))
+
+        if writer is not None:
+            raise ParseError('Unterminated blob at the end of the upload.')
+    finally:
+        # also when the consumer stops iterating, with GeneratorExit
+        if writer is not None:
+            writer.abort()
+
+    if job is not None:
+        yield job, blobs
+
+
+def blob_reference(record, writer):
+    """Commit a blob and return its reference, stored in `Job.blobs`"""
+
+    return {'identifier': record.get('identifier'),
+            'name': record.get('name'),
+            'sha256': writer.commit(),
+            'size': writer.size}
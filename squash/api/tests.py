@@ -1,5 +1,72 @@
-from django.test import TestCase
-from .models import Job, Metric, Measurement
+import datetime
+import gzip
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock, skipIf
+
+import numpy as np
+import pandas as pd
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import resolve
+from django.db import connection, connections, DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+from django.test import TestCase as DjangoTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.six import StringIO
+from prometheus_client import REGISTRY
+from rest_framework.test import APITestCase as DRFAPITestCase
+
+from .blobstore import get_blob_store, load_blob_data
+from .cache import LAST_WRITE_KEY, bump_generation, get_cache, \
+    get_generation
+from .renderers import pa
+from .code_changes import code_change_entry, diff_manifests
+from .db_pool import PooledDatabaseWrapperMixin
+from .db_router import PIN_COOKIE, ReplicaRouter, \
+    ReplicaRoutingMiddleware, set_replica
+from .downsampling import lttb_indices, minmax_indices
+from .instrumentation import get_query_budget, remove_dead_processes
+from .manifests import VERSION_FIELDS
+from .models import Job, Metric, Measurement, PackageVersion, Manifest, \
+    CodeChange, MeasurementRollup, StatsSummary, IngestTask, SpecVerdict, \
+    Regression, get_period_start
+from .pagination import encode_cursor
+from .regressions import detect_jumps
+from .query_plans import CaptureStatements, explain, get_full_scans, \
+    is_supported
+from .serializers import JobSerializer
+from .streaming import JSONValidator
+from .utils import is_legacy_json, load_json
+from .verdicts import evaluate_specs
+from .views import JobViewSet
+
+
+class ClearCacheMixin(object):
+    """ Clear the cache before each test, cached responses and the data
+    generation are not rolled back along with the database
+    """
+
+    def setUp(self):
+        super().setUp()
+        get_cache().clear()
+
+
+class TestCase(ClearCacheMixin, DjangoTestCase):
+    pass
+
+
+class APITestCase(ClearCacheMixin, DRFAPITestCase):
+    pass
 
 
 class JSONFieldTests(TestCase):
@@ -9,6 +76,7 @@ class JSONFieldTests(TestCase):
     fixtures = ['test_data']
 
     def setUp(self):
+        super().setUp()
         self.job = Job.objects.latest('id')
         self.metric = Metric.objects.latest('metric')
 
@@ -88,3 +156,2042 @@ class JSONFieldTests(TestCase):
         actual = Measurement.objects.latest('id').metadata
 
         self.assertEqual(actual, expected)
+
+
+def get_manifest(job):
+    """ Package versions of a job as compared by `diff_manifests`
+    """
+    if job.manifest is None:
+        return {}
+    return {name: (git_commit, git_url)
+            for name, git_commit, git_url in job.manifest.versions.
+            values_list('name', 'git_commit', 'git_url')}
+
+
+def build_code_changes(ci_dataset):
+    """ Code changes of a dataset rebuilt from the job manifests
+    """
+    call_command('build_code_changes', ci_datasets=[ci_dataset],
+                 stdout=StringIO())
+    return [x.as_entry() for x in
+            CodeChange.objects.filter(ci_dataset=ci_dataset, count__gt=0).
+            order_by('date', 'id')]
+
+
+def make_job_data(ci_id, ci_dataset='cfht', git_commit='1' * 40):
+    """ Payload for a job with one measurement and one package
+    """
+    return {'ci_id': ci_id, 'ci_name': 'validate_drp',
+            'ci_dataset': ci_dataset, 'ci_label': 'centos-7',
+            'ci_url': 'https://ci.lsst.codes/job/ci_cfht/{}/'.format(ci_id),
+            'status': 0, 'blobs': None,
+            'measurements': [{'metric': 'AM1', 'value': 1.0,
+                              'metadata': None}],
+            'packages': [{'name': 'afw',
+                          'git_url': 'https://github.com/lsst/afw.git',
+                          'git_commit': git_commit,
+                          'git_branch': 'master',
+                          'build_version': 'b2001'}]}
+
+
+def ingest_job(data):
+    """ Create a job as posted to the jobs endpoint
+    """
+    serializer = JobSerializer(data=data)
+    if not serializer.is_valid():
+        raise AssertionError(serializer.errors)
+    return serializer.save()
+
+
+class CodeChangesTests(TestCase):
+    """ Test the package diff engine used by the code changes endpoint
+    """
+    fixtures = ['test_data']
+
+    def test_changed_packages(self):
+
+        code_changes = build_code_changes('cfht')
+
+        self.assertEqual([x['ci_id'] for x in code_changes], ['2', '5', '7'])
+        self.assertEqual([x['changed'][0][0] for x in code_changes],
+                         ['afw', 'afw', 'cfitsio'])
+        self.assertEqual(code_changes[0]['packages'],
+                         code_changes[0]['changed'])
+        self.assertEqual(code_changes[0]['count'], 1)
+
+    def test_added_and_removed_packages(self):
+
+        job = Job.objects.get(ci_dataset='cfht', ci_id='7')
+        packages = list(job.manifest.versions.exclude(name='afw').
+                        values(*VERSION_FIELDS))
+        packages.append({'name': 'meas_base',
+                         'git_url': 'https://github.com/lsst/meas_base.git',
+                         'git_commit': '0' * 40,
+                         'git_branch': 'master',
+                         'build_version': 'b2000'})
+        job.manifest = Manifest.objects.get_for_packages(packages)
+        job.save()
+
+        code_changes = build_code_changes('cfht')
+        latest = code_changes[-1]
+
+        self.assertEqual([x[0] for x in latest['added']], ['meas_base'])
+        self.assertEqual([x[0] for x in latest['removed']], ['afw'])
+        self.assertEqual([x[0] for x in latest['changed']], ['cfitsio'])
+        self.assertEqual(latest['count'], 3)
+
+    def test_diff(self):
+
+        job = Job.objects.get(ci_dataset='cfht', ci_id='7')
+        packages = sorted((name,) + version
+                          for name, version in get_manifest(job).items())
+
+        self.assertEqual(Manifest.objects.diff(None, job.manifest_id),
+                         (packages, [], []))
+        self.assertEqual(Manifest.objects.diff(job.manifest_id, None),
+                         ([], packages, []))
+        self.assertEqual(Manifest.objects.diff(job.manifest_id,
+                                               job.manifest_id),
+                         ([], [], []))
+
+
+class ManifestTests(TestCase):
+    """ Test the package version catalog and the job manifests
+    """
+    fixtures = ['test_data']
+
+    def make_packages(self, afw_commit):
+        data = make_job_data('8', git_commit=afw_commit)
+        data['packages'].append({'name': 'meas_base',
+                                 'git_url': 'https://github.com/lsst/'
+                                            'meas_base.git',
+                                 'git_commit': '2' * 40,
+                                 'git_branch': 'master',
+                                 'build_version': 'b2001'})
+        return data
+
+    def test_shared_manifest(self):
+
+        job = ingest_job(self.make_packages('1' * 40))
+        versions = PackageVersion.objects.count()
+
+        same = ingest_job(self.make_packages('1' * 40))
+
+        self.assertEqual(same.manifest_id, job.manifest_id)
+        self.assertEqual(PackageVersion.objects.count(), versions)
+
+        changed = ingest_job(self.make_packages('3' * 40))
+
+        self.assertNotEqual(changed.manifest_id, job.manifest_id)
+        self.assertEqual(changed.manifest.size, 2)
+        # meas_base is shared
+        self.assertEqual(PackageVersion.objects.count(), versions + 1)
+
+        self.assertEqual(same.code_change.count, 0)
+        self.assertEqual(changed.code_change.changed,
+                         [['afw', '3' * 40,
+                           'https://github.com/lsst/afw.git']])
+
+    def test_packages(self):
+
+        job = ingest_job(self.make_packages('1' * 40))
+
+        response = self.client.get('/jobs/{}/'.format(job.pk))
+
+        self.assertEqual([x['name'] for x in response.data['packages']],
+                         ['afw', 'meas_base'])
+        self.assertEqual(set(response.data['packages'][0]),
+                         set(VERSION_FIELDS))
+
+    def test_no_packages(self):
+
+        data = make_job_data('8')
+        data['packages'] = []
+        job = ingest_job(data)
+
+        self.assertIsNone(job.manifest)
+        self.assertEqual(job.packages, [])
+
+    def test_diff(self):
+
+        manifest = Job.objects.get(pk=1).manifest_id
+
+        with self.assertNumQueries(0):
+            self.assertEqual(Manifest.objects.diff(manifest, manifest),
+                             ([], [], []))
+
+        added, removed, changed = Manifest.objects.diff(None, manifest)
+
+        self.assertEqual([x[0] for x in added], ['afw', 'cfitsio'])
+        self.assertEqual(removed, [])
+        self.assertEqual(changed, [])
+
+
+class SpecVerdictTests(TestCase):
+    """ Test the evaluation of measurements against the metric specs
+    """
+    fixtures = ['test_data']
+
+    def ingest(self, ci_id, value):
+        data = make_job_data(ci_id)
+        data['measurements'][0]['value'] = value
+
+        return ingest_job(data)
+
+    def test_evaluate_specs(self):
+
+        measurements = pd.DataFrame({'metric': ['a', 'a', 'b'],
+                                     'value': [1.0, 3.0, 3.0]})
+        specs = pd.DataFrame([('a', 'design', '<', 2.0),
+                              ('b', 'design', '>=', 3.0),
+                              ('b', 'stretch', '>=', 4.0)],
+                             columns=['metric', 'spec', 'operator',
+                                      'threshold'])
+
+        frame = evaluate_specs(measurements, specs)
+
+        self.assertEqual(
+            sorted(zip(frame['metric'], frame['value'], frame['spec'],
+                       frame['passed'])),
+            [('a', 1.0, 'design', True), ('a', 3.0, 'design', False),
+             ('b', 3.0, 'design', True), ('b', 3.0, 'stretch', False)])
+
+    def test_ingest(self):
+
+        # AM1 specs: stretch 5, design 10, minimum 20
+        job = self.ingest('8', 15.0)
+
+        verdicts = SpecVerdict.objects.filter(job=job).order_by('spec')
+
+        self.assertEqual([(x.spec, x.passed) for x in verdicts],
+                         [('design', False), ('minimum', True),
+                          ('stretch', False)])
+
+    def test_endpoint(self):
+
+        job = self.ingest('8', 15.0)
+
+        response = self.client.get('/jobs/{}/verdicts/'.format(job.pk))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['passed'])
+        self.assertEqual([x['spec'] for x in response.data['verdicts']],
+                         ['design', 'minimum', 'stretch'])
+        self.assertEqual(response.data['verdicts'][0]['threshold'], 10.0)
+
+        response = self.client.get('/jobs/999/verdicts/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_failing(self):
+
+        failing = self.ingest('8', 15.0)
+        passing = self.ingest('9', 1.0)
+
+        response = self.client.get('/jobs/', {'failing': 'design',
+                                              'ci_dataset': 'cfht'})
+        ci_ids = [x['ci_id'] for x in response.data['results']]
+
+        self.assertIn(failing.ci_id, ci_ids)
+        self.assertNotIn(passing.ci_id, ci_ids)
+
+        response = self.client.get('/jobs/', {'failing': 'minimum'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_build_verdicts(self):
+
+        call_command('build_verdicts', stdout=StringIO())
+
+        # 3 specs for each of the 36 measurements
+        self.assertEqual(SpecVerdict.objects.count(), 108)
+
+        # PA1 is 7.0 in every job, the design spec is 5.0
+        self.assertEqual(Job.objects.filter(
+            pk__in=SpecVerdict.objects.get_failing_jobs('design')).count(),
+            12)
+        self.assertFalse(SpecVerdict.objects.get_failing_jobs('minimum'))
+
+
+@override_settings(SQUASH_REGRESSION_WINDOW=5, SQUASH_REGRESSION_THRESHOLD=3)
+class RegressionTests(TestCase):
+    """ Test the detection of the jumps of the measurement series
+    """
+    fixtures = ['test_data']
+
+    def ingest(self, ci_id, value, git_commit='1' * 40):
+        data = make_job_data(ci_id, ci_dataset='hsc', git_commit=git_commit)
+        data['measurements'][0]['value'] = value
+
+        return ingest_job(data)
+
+    def ingest_series(self):
+        """ Noisy AM1 measurements, then a jump with a new afw version
+        """
+        for i, value in enumerate([1.0, 1.1, 0.9, 1.0, 1.05, 1.0]):
+            self.ingest(str(i + 1), value)
+
+        return self.ingest('7', 2.0, git_commit='2' * 40)
+
+    def test_detect_jumps(self):
+
+        series = [('a', 'x', '<', [1.0, 1.0, 1.0, 1.0, 0.5]),
+                  ('b', 'x', '>=', [2.0, 2.1, 1.9, 2.0, 1.0]),
+                  ('a', 'y', '<', [1.0, 1.1, 0.9, 1.0, 1.05])]
+        rows = [(metric, ci_dataset, operator, value)
+                for metric, ci_dataset, operator, values in series
+                for value in values]
+
+        frame = pd.DataFrame(rows, columns=['metric', 'ci_dataset',
+                                            'operator', 'value'])
+        frame['job'] = np.arange(len(frame)) + 1
+        frame['date'] = np.tile(np.arange(5), 3)
+
+        # the detection does not depend on the order of the rows
+        jumps = detect_jumps(frame.iloc[::-1], 4, 3.0)
+
+        self.assertEqual(list(zip(jumps['job'], jumps['direction'])),
+                         [(5, 'better'), (10, 'worse')])
+        np.testing.assert_allclose(jumps['baseline'], [1.0, 2.0])
+        self.assertEqual(jumps['spread'].iloc[0], 0.0)
+
+    def test_ingest(self):
+
+        job = self.ingest_series()
+
+        regression = Regression.objects.get()
+
+        self.assertEqual(regression.job, job)
+        self.assertEqual(regression.metric_id, 'AM1')
+        self.assertEqual(regression.direction, 'worse')
+        self.assertAlmostEqual(regression.baseline, 1.01)
+
+        # the fixture series are too short
+        self.assertFalse(Regression.objects.exclude(ci_dataset='hsc'))
+
+    def test_endpoint(self):
+
+        job = self.ingest_series()
+
+        response = self.client.get('/regressions/', {'ci_dataset': 'hsc'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+
+        regression = response.data[0]
+
+        self.assertEqual(regression['ci_id'], job.ci_id)
+        self.assertEqual(regression['metric'], 'AM1')
+        self.assertEqual(regression['direction'], 'worse')
+        self.assertEqual(regression['code_change']['count'], 1)
+        self.assertEqual(regression['code_change']['changed'][0][0], 'afw')
+        self.assertIn('/jobs/{}/'.format(job.pk), regression['links']['job'])
+
+    def test_filters(self):
+
+        self.ingest_series()
+
+        for params, count in (({'direction': 'worse'}, 1),
+                              ({'direction': 'better'}, 0),
+                              ({'metric': 'AM2'}, 0),
+                              ({'limit': 1}, 1)):
+            response = self.client.get('/regressions/', params)
+            self.assertEqual(len(response.data), count, params)
+
+        response = self.client.get('/regressions/', {'direction': 'up'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_build_regressions(self):
+
+        job = self.ingest_series()
+        Regression.objects.all().delete()
+
+        call_command('build_regressions', stdout=StringIO())
+        self.assertEqual([x.job for x in Regression.objects.all()], [job])
+
+        # the series have fewer measurements than the window
+        call_command('build_regressions', window=10, stdout=StringIO())
+        self.assertFalse(Regression.objects.exists())
+
+
+class CodeChangeTableTests(TestCase):
+    """ Test the code changes table maintained at ingestion
+    """
+    fixtures = ['test_data']
+
+    def test_build_code_changes(self):
+
+        call_command('build_code_changes', stdout=StringIO())
+
+        self.assertEqual(CodeChange.objects.count(), Job.objects.count())
+
+        code_changes = CodeChange.objects.filter(ci_dataset='cfht',
+                                                 count__gt=0).\
+            order_by('date', 'id')
+
+        # compare the whole manifests of consecutive jobs
+        jobs = list(Job.objects.filter(ci_dataset='cfht').
+                    order_by('date', 'id'))
+        expected = []
+        for prev, curr in zip(jobs, jobs[1:]):
+            added, removed, changed = diff_manifests(get_manifest(prev),
+                                                     get_manifest(curr))
+            if added or removed or changed:
+                expected.append(code_change_entry(curr.ci_id, added,
+                                                  removed, changed))
+
+        self.assertEqual([x.as_entry() for x in code_changes], expected)
+
+    def test_create_for_job(self):
+
+        call_command('build_code_changes', stdout=StringIO())
+
+        latest = Job.objects.filter(ci_dataset='cfht').latest('id')
+        data = make_job_data('8')
+
+        job = ingest_job(data)
+
+        code_change = CodeChange.objects.get(job=job)
+
+        self.assertEqual(code_change.previous_job, latest)
+        self.assertEqual([x[0] for x in code_change.changed], ['afw'])
+        self.assertEqual([x[0] for x in code_change.removed], ['cfitsio'])
+        self.assertEqual(code_change.count, 2)
+
+
+class JobBatchTests(APITestCase):
+    """ Test the batch job ingestion endpoint
+    """
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('testuser', password='testpasswd')
+        self.client.force_authenticate(user=user)
+
+    def test_batch(self):
+
+        data = [make_job_data('8'), make_job_data('9')]
+        response = self.client.post('/jobs/batch/', data, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(Job.objects.filter(ci_dataset='cfht',
+                                            ci_id__in=['8', '9']).count(), 2)
+        jobs = Job.objects.filter(ci_dataset='cfht', ci_id__in=['8', '9'])
+        self.assertEqual([len(job.packages) for job in jobs], [1, 1])
+
+    def test_batch_partial_failure(self):
+
+        invalid = make_job_data('9')
+        invalid['measurements'][0]['metric'] = 'unknown'
+
+        data = [make_job_data('8'), invalid]
+        response = self.client.post('/jobs/batch/', data, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([x['status'] for x in response.data['results']],
+                         [201, 400])
+        self.assertFalse(Job.objects.filter(ci_id='9').exists())
+
+    def test_database_error(self):
+
+        error = DatabaseError('Duplicate entry for key api_job.PRIMARY')
+
+        with mock.patch('api.views.JobSerializer.save', side_effect=error), \
+                self.assertLogs('api.views', 'ERROR'):
+            response = self.client.post('/jobs/batch/', [make_job_data('8')],
+                                        format='json')
+
+        errors = response.data['results'][0]['errors']['non_field_errors']
+
+        self.assertEqual(response.data['failed'], 1)
+        self.assertNotIn('api_job', errors[0])
+
+
+class BlobStoreMixin(object):
+    """ Use a temporary blob store
+    """
+
+    def use_blob_store(self, durable=True):
+        blob_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, blob_root)
+        blob_settings = override_settings(SQUASH_BLOB_ROOT=blob_root,
+                                          SQUASH_BLOB_STORE_DURABLE=durable)
+        blob_settings.enable()
+        self.addCleanup(blob_settings.disable)
+
+
+class JobStreamTests(BlobStoreMixin, APITestCase):
+    """ Test the NDJSON job upload endpoint
+    """
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('testuser', password='testpasswd')
+        self.client.force_authenticate(user=user)
+
+        self.use_blob_store()
+
+    def post(self, records):
+        body = '\n'.join(json.dumps(x) for x in records)
+        return self.client.post('/jobs/stream/', body.encode('utf-8'),
+                                content_type='application/x-ndjson')
+
+    def test_stream(self):
+
+        job = make_job_data('8')
+        job['type'] = 'job'
+
+        records = [job,
+                   {'type': 'blob', 'identifier': 'a', 'name': 'photomModel',
+                    'data': {'x': [1, 2, 3]}},
+                   {'type': 'blob_start', 'identifier': 'b',
+                    'name': 'matchedDataset'},
+                   {'type': 'blob_chunk', 'data': '{"y": '},
+                   {'type': 'blob_chunk', 'data': '[4, 5, 6]}'},
+                   {'type': 'blob_end'}]
+
+        response = self.post(records)
+
+        self.assertEqual(response.status_code, 201)
+
+        blobs = Job.objects.get(ci_dataset='cfht', ci_id='8').blobs
+
+        self.assertEqual([x['identifier'] for x in blobs], ['a', 'b'])
+        self.assertEqual(load_blob_data(blobs[0]), {'x': [1, 2, 3]})
+        self.assertEqual(load_blob_data(blobs[1]), {'y': [4, 5, 6]})
+
+    def test_record_size_limit(self):
+
+        job = make_job_data('8')
+        job['type'] = 'job'
+
+        with override_settings(SQUASH_NDJSON_MAX_RECORD_SIZE=100):
+            response = self.post([job])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.filter(ci_id='8').exists())
+
+    def test_invalid_chunked_blob(self):
+
+        jobs = [make_job_data('8'), make_job_data('9')]
+        for job in jobs:
+            job['type'] = 'job'
+
+        records = [jobs[0], jobs[1],
+                   {'type': 'blob_start', 'identifier': 'b',
+                    'name': 'matchedDataset'},
+                   {'type': 'blob_chunk', 'data': '{"y": [4, 5'},
+                   {'type': 'blob_end'}]
+
+        response = self.post(records)
+
+        # the job before the error is created and reported
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not a JSON document', response.data['error'])
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([x['ci_id'] for x in response.data['results']],
+                         ['8'])
+        self.assertFalse(Job.objects.filter(ci_id='9').exists())
+
+        # the temporary file of the blob is removed
+        self.assertEqual(os.listdir(get_blob_store().tmp_dir), [])
+
+    def test_invalid_chunk(self):
+
+        job = make_job_data('8')
+        job['type'] = 'job'
+
+        records = [job,
+                   {'type': 'blob_start', 'identifier': 'b',
+                    'name': 'matchedDataset'},
+                   {'type': 'blob_chunk', 'data': '{"y": [4, 5'},
+                   {'type': 'blob_chunk', 'data': '}'},
+                   {'type': 'blob_chunk', 'data': ']}'},
+                   {'type': 'blob_end'}]
+
+        response = self.post(records)
+
+        # reported at the chunk, before the end of the blob
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Blob b at line 4', response.data['error'])
+        self.assertFalse(Job.objects.filter(ci_id='8').exists())
+
+    def test_volatile_blob_store(self):
+
+        self.use_blob_store(durable=False)
+
+        job = make_job_data('8')
+        job['type'] = 'job'
+
+        response = self.post([job])
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(Job.objects.filter(ci_id='8').exists())
+
+    def test_json_validator(self):
+
+        valid = ['{"a": [1, -2.5e3, true, false, null, "\\"\\u00e9"]}',
+                 ' [ ] ', '0', '"x"', '{"a": {"b": [[]]}}']
+        invalid = ['', '[1,]', '{"a"}', '{"a": 1,}', '[1 2]', '[01]',
+                   'NaN', '[1.]', '{"a": 1}}', '[', '"\\x"', '"a\tb"',
+                   '{1: 2}', '[1] 2']
+
+        for document in valid + invalid:
+            # every split of the document in two fragments
+            for i in range(len(document) + 1):
+                validator = JSONValidator()
+                try:
+                    validator.feed(document[:i])
+                    validator.feed(document[i:])
+                    validator.close()
+                except ValueError:
+                    self.assertIn(document, invalid)
+                else:
+                    self.assertIn(document, valid)
+
+
+class IngestQueueTests(BlobStoreMixin, APITestCase):
+    """ Test the asynchronous ingestion of jobs
+    """
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('testuser', password='testpasswd')
+        self.client.force_authenticate(user=user)
+
+        self.use_blob_store()
+
+    def post(self, data):
+        return self.client.post('/jobs/', data, format='json',
+                                HTTP_PREFER='respond-async')
+
+    def process(self, **options):
+        call_command('process_ingest_queue', once=True, stdout=StringIO(),
+                     **options)
+
+    def test_accepted(self):
+
+        data = make_job_data('8')
+        data['blobs'] = [{'identifier': 'a', 'name': 'photomModel',
+                          'data': {'x': [1, 2, 3]}}]
+
+        response = self.post(data)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], IngestTask.PENDING)
+        self.assertEqual(response['Location'],
+                         response.data['links']['self'])
+        self.assertFalse(Job.objects.filter(ci_id='8').exists())
+
+        # blob data is stored before queueing
+        task = IngestTask.objects.get(pk=response.data['id'])
+        self.assertNotIn('data', task.payload['blobs'][0])
+
+        self.process()
+
+        job = Job.objects.get(ci_dataset='cfht', ci_id='8')
+        self.assertEqual(load_blob_data(job.blobs[0]), {'x': [1, 2, 3]})
+
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.data['status'], IngestTask.DONE)
+        self.assertIn('/jobs/{}/'.format(job.pk),
+                      response.data['links']['job'])
+
+    def test_invalid(self):
+
+        data = make_job_data('8')
+        data['measurements'][0]['metric'] = 'unknown'
+
+        response = self.post(data)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IngestTask.objects.exists())
+
+    def test_setting(self):
+
+        with override_settings(SQUASH_ASYNC_INGESTION=True):
+            response = self.client.post('/jobs/', make_job_data('8'),
+                                        format='json')
+        self.assertEqual(response.status_code, 202)
+
+        response = self.client.post('/jobs/', make_job_data('9'),
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_retry(self):
+
+        response = self.post(make_job_data('8'))
+
+        with mock.patch('api.ingest.JobSerializer.save',
+                        side_effect=DatabaseError('deadlock')):
+            with self.assertLogs('api.ingest', 'ERROR') as logs:
+                self.process(retry_delay=0, max_attempts=2)
+
+        task = IngestTask.objects.get(pk=response.data['id'])
+        self.assertEqual(task.status, IngestTask.FAILED)
+        self.assertEqual(task.attempts, 2)
+        self.assertIn('deadlock', logs.output[-1])
+
+        # the database error is not returned
+        response = self.client.get(response['Location'])
+        self.assertEqual(response.data['error'],
+                         'The job could not be saved.')
+
+    def test_unexpected_error(self):
+
+        self.post(make_job_data('8'))
+
+        with mock.patch('api.ingest.JobSerializer.save',
+                        side_effect=KeyError('packages')):
+            with self.assertLogs('api.ingest', 'ERROR'):
+                self.process(retry_delay=0, max_attempts=2)
+
+        task = IngestTask.objects.get()
+        self.assertEqual(task.status, IngestTask.FAILED)
+        self.assertEqual(task.attempts, 2)
+        self.assertEqual(task.error, 'The job could not be ingested.')
+
+    def test_finish_in_job_transaction(self):
+
+        self.post(make_job_data('8'))
+
+        with mock.patch.object(IngestTask, 'finish',
+                               side_effect=DatabaseError('lost')):
+            self.process(retry_delay=60)
+
+        task = IngestTask.objects.get()
+        self.assertEqual(task.status, IngestTask.PENDING)
+        self.assertIsNone(task.job)
+        self.assertFalse(Job.objects.filter(ci_id='8').exists())
+
+    def test_retry_delay(self):
+
+        self.post(make_job_data('8'))
+
+        with mock.patch('api.ingest.JobSerializer.save',
+                        side_effect=DatabaseError('deadlock')):
+            self.process(retry_delay=60)
+
+        task = IngestTask.objects.get()
+        self.assertEqual(task.status, IngestTask.PENDING)
+        self.assertGreater(task.next_attempt, timezone.now())
+
+        # not due yet
+        self.process()
+        self.assertFalse(Job.objects.filter(ci_id='8').exists())
+
+        IngestTask.objects.update(next_attempt=timezone.now())
+        self.process()
+        self.assertTrue(Job.objects.filter(ci_id='8').exists())
+
+    def test_stale(self):
+
+        self.post(make_job_data('8'))
+        IngestTask.objects.update(
+            status=IngestTask.RUNNING,
+            started=timezone.now() - datetime.timedelta(hours=1))
+
+        self.process(stale_after=600)
+
+        self.assertEqual(IngestTask.objects.get().status, IngestTask.DONE)
+
+    def test_stale_max_attempts(self):
+
+        self.post(make_job_data('8'))
+        IngestTask.objects.update(
+            status=IngestTask.RUNNING, attempts=2,
+            started=timezone.now() - datetime.timedelta(hours=1))
+
+        self.process(stale_after=600, max_attempts=2)
+
+        task = IngestTask.objects.get()
+        self.assertEqual(task.status, IngestTask.FAILED)
+        self.assertEqual(task.attempts, 2)
+        self.assertFalse(Job.objects.filter(ci_id='8').exists())
+
+    def test_depth(self):
+
+        self.post(make_job_data('8'))
+        self.post(make_job_data('9'))
+
+        response = self.client.get('/ingest/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[IngestTask.PENDING], 2)
+        self.assertEqual(response.data[IngestTask.DONE], 0)
+
+        self.process()
+
+        response = self.client.get('/ingest/')
+        self.assertEqual(response.data[IngestTask.PENDING], 0)
+        self.assertEqual(response.data[IngestTask.DONE], 2)
+
+
+class BlobStoreTests(BlobStoreMixin, TestCase):
+    """ Test that job blobs are stored in the blob store
+    """
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super().setUp()
+        self.use_blob_store()
+        self.blobs = [{'identifier': 'a', 'name': 'photomModel',
+                       'data': {'x': [1, 2, 3]}},
+                      {'identifier': 'b', 'name': 'matchedDataset',
+                       'data': {'x': [1, 2, 3]}}]
+
+    def test_create_job(self):
+
+        data = make_job_data('8')
+        data['blobs'] = self.blobs
+
+        job = Job.objects.get(pk=ingest_job(data).pk)
+
+        self.assertEqual([x['identifier'] for x in job.blobs], ['a', 'b'])
+        self.assertTrue(all('data' not in x for x in job.blobs))
+        # identical blobs are stored once
+        self.assertEqual(job.blobs[0]['sha256'], job.blobs[1]['sha256'])
+        self.assertEqual(load_blob_data(job.blobs[0]), {'x': [1, 2, 3]})
+
+    def test_unknown_reference(self):
+
+        data = make_job_data('8')
+        data['blobs'] = [{'identifier': 'a', 'sha256': '0' * 64}]
+
+        serializer = JobSerializer(data=data)
+        self.assertFalse(serializer.is_valid())
+
+    def test_externalize_blobs(self):
+
+        # blobs posted before the blob store are stored as their repr
+        Job.objects.filter(pk=1).update(blobs=repr(self.blobs))
+
+        call_command('externalize_blobs', stdout=StringIO())
+
+        job = Job.objects.get(pk=1)
+
+        self.assertEqual(len(job.blobs), 2)
+        self.assertEqual(load_blob_data(job.blobs[1]), {'x': [1, 2, 3]})
+
+    def test_collect_blobs(self):
+
+        data = make_job_data('8')
+        data['blobs'] = self.blobs
+
+        key = ingest_job(data).blobs[0]['sha256']
+
+        # left by a job whose transaction failed
+        store = get_blob_store()
+        with store.open_writer() as writer:
+            writer.write(json.dumps({'y': 1}))
+            orphan = writer.commit()
+
+        out = StringIO()
+        call_command('collect_blobs', min_age=0, stdout=out)
+
+        self.assertIn('1 unreferenced blobs deleted', out.getvalue())
+        self.assertTrue(store.exists(key))
+        self.assertFalse(store.exists(orphan))
+
+        # recent blobs may belong to jobs being created
+        with store.open_writer() as writer:
+            writer.write(json.dumps({'y': 1}))
+            writer.commit()
+
+        call_command('collect_blobs', stdout=StringIO())
+        self.assertTrue(store.exists(orphan))
+
+
+class VolatileBlobStoreTests(BlobStoreMixin, TestCase):
+    """ Test that jobs keep their blob data while the blob store is not
+        durable
+    """
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super().setUp()
+        self.use_blob_store(durable=False)
+
+    def test_create_job(self):
+
+        data = make_job_data('8')
+        data['blobs'] = [{'identifier': 'a', 'name': 'photomModel',
+                          'data': {'x': [1, 2, 3]}}]
+
+        job = Job.objects.get(pk=ingest_job(data).pk)
+
+        self.assertEqual(job.blobs[0]['data'], {'x': [1, 2, 3]})
+
+    def test_externalize_blobs(self):
+
+        with self.assertRaises(CommandError):
+            call_command('externalize_blobs', stdout=StringIO())
+
+
+class NativeJSONTests(TestCase):
+    """ Test that JSON fields are stored as native JSON
+    """
+    fixtures = ['test_data']
+
+    def get_raw_metadata(self, job):
+        return Measurement.objects.filter(job=job).\
+            values_list('metadata', flat=True)[0]
+
+    def test_create_job(self):
+
+        metadata = {'blobs': {'matchedDataset': 'a'}, 'filter_name': 'r'}
+
+        data = make_job_data('8')
+        data['measurements'][0]['metadata'] = metadata
+
+        job = ingest_job(data)
+
+        raw = self.get_raw_metadata(job)
+
+        self.assertFalse(is_legacy_json(raw))
+        self.assertEqual(json.loads(raw), metadata)
+
+    def test_convert_json_fields(self):
+
+        metadata = {'blobs': {'matchedDataset': 'a'}, 'filter_name': 'r'}
+
+        job = Job.objects.get(pk=1)
+        Measurement.objects.filter(job=job).update(metadata=repr(metadata))
+
+        self.assertTrue(is_legacy_json(self.get_raw_metadata(job)))
+
+        call_command('convert_json_fields', stdout=StringIO())
+
+        raw = self.get_raw_metadata(job)
+
+        self.assertFalse(is_legacy_json(raw))
+        self.assertEqual(json.loads(raw), metadata)
+
+    def test_load_json(self):
+
+        legacy = json.dumps(repr({'filter_name': 'r'}))
+
+        self.assertTrue(is_legacy_json(legacy))
+        self.assertEqual(load_json(legacy), {'filter_name': 'r'})
+
+        # strings that are not a Python repr are returned as is
+        for value in ('[x', '{not a dict}', '[1, 2'):
+            raw = json.dumps(value)
+            self.assertFalse(is_legacy_json(raw))
+            self.assertEqual(load_json(raw), value)
+
+
+@skipIf(pa is None, 'pyarrow is not installed')
+class ColumnarFormatTests(TestCase):
+    """ Test the columnar output formats of the measurements endpoint
+    """
+    fixtures = ['test_data']
+
+    def test_arrow(self):
+
+        response = self.client.get('/measurements/',
+                                   {'metric': 'AM1', 'format': 'arrow'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'],
+                         'application/vnd.apache.arrow.stream')
+
+        reader = pa.RecordBatchStreamReader(pa.BufferReader(response.content))
+        df = reader.read_all().to_pandas()
+
+        self.assertEqual(len(df),
+                         Measurement.objects.filter(metric='AM1').count())
+        self.assertIn('value', df.columns)
+
+    def test_accept_header(self):
+
+        response = self.client.get(
+            '/measurements/', {'metric': 'AM1'},
+            HTTP_ACCEPT='application/vnd.apache.arrow.stream')
+
+        self.assertEqual(response['Content-Type'],
+                         'application/vnd.apache.arrow.stream')
+
+
+class DownsamplingTests(TestCase):
+    """ Test the server-side downsampling of measurement series
+    """
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super().setUp()
+        self.x = np.arange(10000, dtype=float)
+        self.y = np.sin(self.x / 100.0)
+        self.y[1234] = 100.0
+        self.y[8765] = -100.0
+
+    def test_lttb(self):
+
+        indices = lttb_indices(self.x, self.y, 100)
+
+        self.assertEqual(len(indices), 100)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], len(self.x) - 1)
+        self.assertIn(1234, indices)
+        self.assertIn(8765, indices)
+
+    def test_minmax(self):
+
+        indices = minmax_indices(self.x, self.y, 100)
+
+        self.assertLessEqual(len(indices), 100)
+        self.assertIn(1234, indices)
+        self.assertIn(8765, indices)
+
+    def test_max_points(self):
+
+        response = self.client.get('/measurements/',
+                                   {'metric': 'AM1', 'ci_dataset': 'cfht',
+                                    'max_points': 4})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+
+    def test_invalid_method(self):
+
+        response = self.client.get('/measurements/',
+                                   {'metric': 'AM1', 'downsample': 'mean'})
+
+        self.assertEqual(response.status_code, 400)
+
+
+class MeasurementRollupTests(TestCase):
+    """ Test the daily and weekly measurement rollups
+    """
+    fixtures = ['test_data']
+
+    def setUp(self):
+        super().setUp()
+        call_command('build_rollups', stdout=StringIO())
+        call_command('reconcile_stats', stdout=StringIO())
+
+    def test_build_rollups(self):
+
+        # cfht jobs on 2016-09-15 are jobs 1, 3 and 5
+        values = Measurement.objects.filter(metric='AM1',
+                                            job__in=[1, 3, 5]).\
+            order_by('job__id').values_list('value', flat=True)
+
+        rollup = MeasurementRollup.objects.get(
+            metric='AM1', ci_dataset='cfht', resolution='day',
+            period_start=datetime.datetime(2016, 9, 15, tzinfo=timezone.utc))
+
+        self.assertEqual(rollup.count, len(values))
+        self.assertEqual(rollup.min, min(values))
+        self.assertEqual(rollup.max, max(values))
+        self.assertAlmostEqual(rollup.mean, sum(values) / len(values))
+        self.assertEqual(rollup.last, values[len(values) - 1])
+
+    def test_update_for_job(self):
+
+        job = ingest_job(make_job_data('8'))
+
+        for resolution in ('day', 'week'):
+            rollup = MeasurementRollup.objects.get(
+                metric='AM1', ci_dataset='cfht', resolution=resolution,
+                period_start=get_period_start(job.date, resolution))
+
+            self.assertEqual(rollup.last, 1.0)
+            self.assertEqual(rollup.last_date, job.date)
+
+    def test_resolution(self):
+
+        response = self.client.get('/measurements/',
+                                   {'metric': 'AM1', 'ci_dataset': 'cfht',
+                                    'resolution': 'week'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.data['count']), [6])
+
+    def test_period_start(self):
+
+        # in the first day of the last month
+        date = timezone.now() - datetime.timedelta(weeks=4, minutes=-1)
+        Job.objects.filter(pk=1).update(date=date)
+        call_command('build_rollups', stdout=StringIO())
+
+        response = self.client.get('/measurements/',
+                                   {'metric': 'AM1', 'ci_dataset': 'cfht',
+                                    'resolution': 'day',
+                                    'period': 'Last month'})
+
+        self.assertEqual(list(response.data['count']), [1])
+
+    def test_delete(self):
+
+        period_start = datetime.datetime(2016, 9, 15, tzinfo=timezone.utc)
+
+        Job.objects.get(pk=1).delete()
+
+        rollup = MeasurementRollup.objects.get(
+            metric='AM1', ci_dataset='cfht', resolution='day',
+            period_start=period_start)
+
+        # as if rebuilt from the remaining measurements
+        values = Measurement.objects.filter(metric='AM1', job__in=[3, 5]).\
+            order_by('job__id').values_list('value', flat=True)
+
+        self.assertEqual(rollup.count, 2)
+        self.assertEqual(rollup.min, min(values))
+        self.assertEqual(rollup.max, max(values))
+        self.assertEqual(rollup.last, values[1])
+
+        for job in Job.objects.filter(pk__in=[3, 5]):
+            job.delete()
+
+        self.assertFalse(MeasurementRollup.objects.filter(
+            metric='AM1', ci_dataset='cfht', resolution='day',
+            period_start=period_start).exists())
+
+
+class StatsSummaryTests(TestCase):
+    """ Test the statistics maintained at ingestion
+    """
+    fixtures = ['test_data']
+
+    def test_get_summary(self):
+
+        response = self.client.get('/stats/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['number_of_jobs'], 12)
+        self.assertEqual(response.data['number_of_measurements'], 36)
+        self.assertEqual(response.data['number_of_metrics'], 3)
+        self.assertEqual(response.data['number_of_packages'], 2)
+        self.assertEqual(response.data['datasets'], 'cfht, decam')
+
+    def test_update_for_job(self):
+
+        StatsSummary.objects.get_summary()
+
+        data = make_job_data('1', ci_dataset='hsc')
+        ingest_job(data)
+
+        with self.assertNumQueries(1):
+            summary = StatsSummary.objects.get_summary()
+
+        self.assertEqual(summary.number_of_jobs, 13)
+        self.assertEqual(summary.number_of_measurements, 37)
+        self.assertEqual(summary.number_of_packages, 1)
+        self.assertEqual(summary.datasets, ['cfht', 'decam', 'hsc'])
+
+    def test_reconcile_stats(self):
+
+        StatsSummary.objects.get_summary()
+        Job.objects.filter(ci_dataset='decam').delete()
+
+        call_command('reconcile_stats', stdout=StringIO())
+
+        summary = StatsSummary.objects.get_summary()
+
+        self.assertEqual(summary.number_of_jobs, 6)
+        self.assertEqual(summary.datasets, ['cfht'])
+
+
+class AppPayloadTests(BlobStoreMixin, TestCase):
+    """ Test the pre-rendered payloads of the apps endpoint
+    """
+    fixtures = ['test_data']
+
+    params = {'ci_id': '1', 'ci_dataset': 'hsc', 'metric': 'AM1'}
+
+    blob_names = {'a': 'matchedDataset', 'b': 'photomModel',
+                  'c': 'astromModel'}
+
+    def setUp(self):
+        super().setUp()
+        self.use_blob_store()
+
+    def ingest(self, ci_id):
+        data = make_job_data(ci_id, ci_dataset='hsc')
+        data['measurements'][0]['metadata'] = {
+            'filter': 'r',
+            'blobs': {name: x for x, name in self.blob_names.items()}}
+        data['blobs'] = [{'identifier': x, 'name': name,
+                          'data': {'name': name}}
+                         for x, name in self.blob_names.items()]
+
+        return ingest_job(data)
+
+    def get_app_data(self, params=None, **extra):
+        response = self.client.get('/apps/', params or self.params, **extra)
+        self.assertEqual(response.status_code, 200)
+
+        content = response.content
+        if response.get('Content-Encoding') == 'gzip':
+            content = gzip.decompress(content)
+
+        return json.loads(content.decode('utf-8'))
+
+    def test_payload(self):
+
+        self.ingest('1')
+
+        expected = {'metadata': {'filter': 'r'},
+                    'matchedDataset': {'name': 'matchedDataset'},
+                    'photomModel': {'name': 'photomModel'},
+                    'astromModel': {'name': 'astromModel'}}
+
+        self.assertEqual(self.get_app_data(), expected)
+
+        # warm reads are a cache lookup, the payload is stored compressed
+        with self.assertNumQueries(0):
+            response = self.client.get('/apps/', self.params,
+                                       HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept,', response['Vary'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(
+            json.loads(gzip.decompress(response.content).decode('utf-8')),
+            expected)
+
+        response = self.client.get('/apps/', dict(self.params, format='api'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, expected)
+
+    def test_etag(self):
+
+        self.ingest('1')
+
+        compressed = self.client.get('/apps/', self.params,
+                                     HTTP_ACCEPT_ENCODING='gzip')
+        identity = self.client.get('/apps/', self.params)
+
+        self.assertNotIn('Content-Encoding', identity)
+        self.assertNotEqual(compressed['ETag'], identity['ETag'])
+
+        # the identity representation is not the compressed one
+        response = self.client.get('/apps/', self.params,
+                                   HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=identity['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/apps/', self.params,
+                                   HTTP_ACCEPT_ENCODING='gzip',
+                                   HTTP_IF_NONE_MATCH=compressed['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_not_ingested(self):
+
+        self.assertEqual(self.get_app_data(), {})
+
+        # empty payloads are not cached
+        self.ingest('1')
+        self.assertEqual(self.get_app_data()['metadata'], {'filter': 'r'})
+
+    def test_invalidation(self):
+
+        job = self.ingest('1')
+        self.get_app_data()
+
+        measurement = job.measurements.get()
+        measurement.metadata = {'filter': 'i', 'blobs': {
+            name: x for x, name in self.blob_names.items()}}
+        measurement.save()
+
+        self.assertEqual(self.get_app_data()['metadata'], {'filter': 'i'})
+
+        job.delete()
+        self.assertEqual(self.get_app_data(), {})
+
+    def test_warm_app_cache(self):
+
+        self.ingest('1')
+        self.ingest('2')
+
+        out = StringIO()
+        call_command('warm_app_cache', jobs=1, stdout=out)
+        self.assertIn('1 app payloads cached', out.getvalue())
+
+        with self.assertNumQueries(0):
+            self.get_app_data(dict(self.params, ci_id='2'))
+
+
+class CacheInvalidationTests(TestCase):
+    """ Test that cached responses are invalidated by writes
+    """
+    fixtures = ['test_data']
+
+    def get_code_changes(self):
+        response = self.client.get('/code_changes/', {'ci_dataset': 'cfht'})
+        self.assertEqual(response.status_code, 200)
+        return list(response.data['ci_id'])
+
+    def test_cached_until_write(self):
+
+        call_command('build_code_changes', stdout=StringIO())
+
+        self.assertEqual(self.get_code_changes(), ['2', '5', '7'])
+
+        # not a write through the API, the cached response is returned
+        CodeChange.objects.filter(job__ci_id='7').delete()
+        self.assertEqual(self.get_code_changes(), ['2', '5', '7'])
+
+        ingest_job(make_job_data('8'))
+
+        self.assertEqual(self.get_code_changes(), ['2', '5', '8'])
+
+    def test_query_params(self):
+
+        generation = get_generation()
+
+        response = self.client.get('/measurements/', {'metric': 'AM1'})
+        self.assertEqual(len(response.data), 12)
+
+        response = self.client.get('/measurements/', {'metric': 'AM1',
+                                                      'ci_dataset': 'cfht'})
+        self.assertEqual(len(response.data), 6)
+
+        self.assertEqual(get_generation(), generation)
+
+    def test_bump_generation(self):
+
+        generation = get_generation()
+        Metric.objects.get(metric='AM1').save()
+
+        self.assertNotEqual(get_generation(), generation)
+
+
+class ConditionalRequestTests(BlobStoreMixin, TestCase):
+    """ Test ETags and conditional GETs on the read API
+    """
+    fixtures = ['test_data']
+
+    def test_not_modified(self):
+
+        for url in ('/stats/', '/defaults/', '/datasets/', '/code_changes/',
+                    '/measurements/', '/metrics/', '/jobs/', '/jobs/1/'):
+
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            etag = response['ETag']
+
+            # answered without touching the database
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_query_params(self):
+
+        response = self.client.get('/measurements/', {'metric': 'AM1'})
+        etag = response['ETag']
+
+        response = self.client.get('/measurements/', {'metric': 'AM2'},
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_modified_after_write(self):
+
+        response = self.client.get('/stats/')
+        etag = response['ETag']
+
+        ingest_job(make_job_data('8'))
+
+        response = self.client.get('/stats/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['number_of_jobs'], 13)
+
+    def test_blob(self):
+
+        self.use_blob_store()
+
+        data = make_job_data('8')
+        data['blobs'] = [{'identifier': 'a', 'name': 'photomModel',
+                          'data': {'x': [1, 2, 3]}}]
+
+        sha256 = ingest_job(data).blobs[0]['sha256']
+
+        response = self.client.get('/blobs/{}/'.format(sha256))
+        self.assertEqual(response['ETag'], '"{}"'.format(sha256))
+
+        response = self.client.get('/blobs/{}/'.format(sha256),
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class JobFieldsTests(TestCase):
+    """ Test sparse fieldsets and expansion on the jobs endpoint
+    """
+    fixtures = ['test_data']
+
+    def test_list(self):
+
+        # nothing is prefetched
+        with self.assertNumQueries(1):
+            response = self.client.get('/jobs/')
+        job = response.data['results'][0]
+
+        self.assertIn('ci_id', job)
+        self.assertNotIn('blobs', job)
+        self.assertNotIn('measurements', job)
+        self.assertNotIn('packages', job)
+
+    def test_blobs_deferred(self):
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/jobs/')
+
+        self.assertFalse(any('blobs' in query['sql']
+                             for query in context.captured_queries))
+
+    def test_expand(self):
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/jobs/', {'expand': 'packages'})
+        job = response.data['results'][0]
+
+        self.assertEqual(len(job['packages']), 2)
+        self.assertNotIn('measurements', job)
+
+    def test_fields(self):
+
+        response = self.client.get('/jobs/', {'fields': 'ci_id,links',
+                                              'expand': 'measurements'})
+        job = response.data['results'][0]
+
+        self.assertEqual(set(job), {'ci_id', 'links', 'measurements'})
+        self.assertEqual(len(job['measurements']), 3)
+
+    def test_retrieve(self):
+
+        response = self.client.get('/jobs/1/')
+        self.assertEqual(len(response.data['measurements']), 3)
+
+        response = self.client.get('/jobs/1/', {'fields': 'ci_id'})
+        self.assertEqual(set(response.data), {'ci_id'})
+
+    def test_unknown_field(self):
+
+        response = self.client.get('/jobs/', {'fields': 'ci_id,foo'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/jobs/', {'expand': 'ci_id'})
+        self.assertEqual(response.status_code, 400)
+
+
+@mock.patch.object(JobViewSet, 'paginate_by', 5)
+class KeysetPaginationTests(TestCase):
+    """ Test cursor pagination of the jobs endpoint
+    """
+    fixtures = ['test_data']
+
+    def get_pages(self, url, **params):
+        pages = []
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            pages.append([x['links']['self'] for x in
+                          response.data['results']])
+            url = response.data['next']
+            params = {}
+        return pages
+
+    def get_job_ids(self, pages):
+        return [int(x.rstrip('/').split('/')[-1])
+                for page in pages for x in page]
+
+    def test_pages(self):
+
+        pages = self.get_pages('/jobs/')
+
+        self.assertEqual([len(x) for x in pages], [5, 5, 2])
+
+        job_ids = Job.objects.order_by('date', 'id').\
+            values_list('id', flat=True)
+        self.assertEqual(self.get_job_ids(pages), list(job_ids))
+
+    def test_ordering(self):
+
+        pages = self.get_pages('/jobs/', ordering='-date')
+
+        job_ids = Job.objects.order_by('-date', '-id').\
+            values_list('id', flat=True)
+        self.assertEqual(self.get_job_ids(pages), list(job_ids))
+
+    def test_insert_while_paging(self):
+
+        response = self.client.get('/jobs/')
+        first_page = response.data['results']
+
+        # a job inserted while paging does not shift the next page
+        ingest_job(make_job_data('8'))
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertNotIn(response.data['results'][0], first_page)
+
+        response = self.client.get(response.data['previous'])
+        self.assertEqual(response.data['results'], first_page)
+
+    def test_same_cost(self):
+
+        response = self.client.get('/jobs/')
+        response = self.client.get(response.data['next'])
+
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(response.data['next'])
+
+        sql = context.captured_queries[0]['sql']
+        self.assertNotIn('OFFSET', sql.upper())
+
+    def test_invalid_cursor(self):
+
+        response = self.client.get('/jobs/', {'cursor': 'foo'})
+        self.assertEqual(response.status_code, 404)
+
+        cursor = encode_cursor(False, ['foo', '1'])
+        response = self.client.get('/jobs/', {'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+
+
+def seed_jobs(n_jobs, ci_datasets=('cfht', 'decam', 'hsc', 'ci_hsc'),
+              n_packages=10):
+    """ Insert jobs with a measurement of every metric and a few packages
+    each, so that query plans are those of a populated database
+    """
+    metrics = list(Metric.objects.values_list('metric', flat=True))
+
+    Job.objects.bulk_create(
+        [Job(ci_id=str(1000 + i), ci_name='synthetic',
+             ci_dataset=ci_datasets[i % len(ci_datasets)],
+             ci_label='centos-7', ci_url='https://ci.lsst.codes/',
+             status=0)
+         for i in range(n_jobs)])
+
+    job_ids = Job.objects.filter(ci_name='synthetic').\
+        values_list('id', flat=True)
+
+    Measurement.objects.bulk_create(
+        [Measurement(job_id=job_id, metric_id=metric, value=float(job_id))
+         for job_id in job_ids for metric in metrics])
+
+    # the packages change every 10 jobs
+    for key, group in itertools.groupby(sorted(job_ids),
+                                        key=lambda x: x // 10):
+        manifest = Manifest.objects.get_for_packages(
+            [{'name': 'pkg{}'.format(i),
+              'git_url': 'https://github.com/lsst/pkg.git',
+              'git_commit': '{:040x}'.format(key + i),
+              'git_branch': 'master', 'build_version': 'b1'}
+             for i in range(n_packages)])
+        Job.objects.filter(pk__in=list(group)).update(manifest=manifest)
+
+
+@skipIf(not is_supported(connection), 'EXPLAIN output not supported')
+class QueryPlanTests(TestCase):
+    """ Test that the endpoints do not read whole tables, a regression
+        usually means that a query no longer matches an index
+    """
+    fixtures = ['test_data']
+
+    # endpoints and the tables they are expected to read entirely
+    endpoints = [
+        ('/jobs/', {}, ()),
+        ('/jobs/', {'ci_dataset': 'hsc'}, ()),
+        ('/jobs/', {'expand': 'measurements,packages'}, ()),
+        ('/jobs/{job_id}/', {}, ()),
+        ('/jobs/{job_id}/verdicts/', {}, ()),
+        ('/jobs/', {'failing': 'design'}, ()),
+        ('/regressions/', {'ci_dataset': 'hsc'}, ()),
+        # a handful of metric definitions, listed entirely
+        ('/metrics/', {}, ('api_metric',)),
+        ('/metrics/AM1/', {}, ()),
+        ('/measurements/', {'metric': 'AM1', 'ci_dataset': 'hsc'}, ()),
+        ('/measurements/', {'metric': 'AM1', 'ci_dataset': 'hsc',
+                            'resolution': 'day'}, ()),
+        ('/code_changes/', {'ci_dataset': 'hsc'}, ()),
+        ('/code_changes/', {'ci_dataset': 'hsc', 'limit': 5}, ()),
+        ('/datasets/', {}, ()),
+        ('/defaults/', {}, ()),
+        ('/apps/', {'ci_id': '1001', 'ci_dataset': 'decam',
+                    'metric': 'AM1'}, ()),
+        # the data of the latest job
+        ('/apps/', {}, ()),
+        ('/stats/', {}, ()),
+        # the queue depth counts every task
+        ('/ingest/', {}, ('api_ingesttask',)),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        seed_jobs(400)
+        call_command('build_code_changes', stdout=StringIO())
+        call_command('build_rollups', stdout=StringIO())
+        call_command('reconcile_stats', stdout=StringIO())
+
+    def format_plan(self, sql, params, plan):
+        return '{}\n{}\n{}'.format(sql, params, '\n'.join(
+            str(row) for row in plan))
+
+    def test_no_full_scans(self):
+
+        job_id = Job.objects.latest('id').pk
+
+        for url, params, allowed in self.endpoints:
+            url = url.format(job_id=job_id)
+
+            with CaptureStatements(connection) as context:
+                response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200, url)
+
+            self.assertTrue(context.selects, url)
+
+            for sql, sql_params in context.selects:
+                plan = explain(connection, sql, sql_params)
+                scans = get_full_scans(connection, plan, sql) - \
+                    set(allowed)
+
+                self.assertFalse(scans, 'Full scan of {} in {}\n{}'.format(
+                    ', '.join(sorted(scans)), url,
+                    self.format_plan(sql, sql_params, plan)))
+
+    def test_full_scan_detected(self):
+
+        with CaptureStatements(connection) as context:
+            list(Measurement.objects.filter(value__gt=0))
+
+        sql, params = context.selects[0]
+        plan = explain(connection, sql, params)
+
+        self.assertEqual(get_full_scans(connection, plan, sql),
+                         {'api_measurement'})
+
+    def test_primary_key_range(self):
+
+        with CaptureStatements(connection) as context:
+            Job.objects.order_by('-id').first()
+            Job.objects.filter(ci_label='centos-7').order_by('-id').first()
+
+        plans = [(sql, explain(connection, sql, params))
+                 for sql, params in context.selects]
+
+        # only the first rows are read
+        self.assertEqual(get_full_scans(connection, plans[0][1],
+                                        plans[0][0]), set())
+
+        if connection.vendor == 'sqlite':
+            self.assertEqual(get_full_scans(connection, plans[1][1],
+                                            plans[1][0]), {'api_job'})
+
+
+class InstrumentationTests(TestCase):
+    """ Test the per-request instrumentation
+    """
+    fixtures = ['test_data']
+
+    def test_server_timing(self):
+
+        response = self.client.get('/jobs/', {'expand': 'measurements'})
+
+        timing = dict(x.strip().split(';', 1)
+                      for x in response['Server-Timing'].split(','))
+
+        self.assertEqual(set(timing),
+                         {'db', 'serializer', 'pandas', 'total'})
+        self.assertIn('desc="2 queries"', timing['db'])
+
+    # the requests are not answered from the response cache
+    @override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }
+    })
+    def test_query_count(self):
+
+        def get_queries():
+            response = self.client.get('/jobs/1/')
+            timing = response['Server-Timing'].split(',')[0]
+            return timing.split(';')[-1]
+
+        queries = get_queries()
+
+        # the query log is not reset between the requests
+        with CaptureQueriesContext(connection):
+            self.assertEqual(get_queries(), queries)
+            self.assertEqual(get_queries(), queries)
+
+        # the queries of the requests are not logged
+        default = connections['default']
+        self.assertFalse(default.force_debug_cursor)
+        self.assertNotIn('make_cursor', default.__dict__)
+
+    def test_pandas_timer(self):
+
+        response = self.client.get('/measurements/', {'metric': 'AM1'})
+
+        self.assertNotIn('pandas;dur=0.0,', response['Server-Timing'])
+
+    def test_prometheus(self):
+
+        self.client.get('/stats/')
+        response = self.client.get('/prometheus/')
+
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode('utf-8')
+        self.assertIn('squash_request_duration_seconds_bucket{', content)
+        self.assertIn('view="stats-list"', content)
+
+        # the metric definitions are still served at /metrics
+        response = self.client.get('/metrics/')
+        self.assertIn('results', response.data)
+
+    def test_remove_dead_processes(self):
+
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+
+        names = ['gauge_livesum_{}.db'.format(process.pid),
+                 'gauge_liveall_{}.db'.format(process.pid),
+                 'gauge_livesum_{}.db'.format(os.getpid()),
+                 'counter_{}.db'.format(process.pid)]
+        for name in names:
+            open(os.path.join(path, name), 'w').close()
+
+        self.assertEqual(remove_dead_processes(path), [process.pid])
+        self.assertEqual(sorted(os.listdir(path)), sorted(names[2:]))
+
+
+class QueryBudgetMixin(object):
+    """ Assert that the number of queries of read requests stays within
+        the budget of their view and does not grow with the data
+    """
+
+    def count_queries(self, url, params):
+        # the first request may fill lazily computed tables
+        self.client.get(url, params)
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, url)
+
+        return len(context.captured_queries)
+
+    def assertQueryBudget(self, url, params=None, grow=None):
+        """ Count the queries of a GET request before and after calling
+            `grow`, that adds data or changes the page size
+        """
+        budget = get_query_budget(resolve(url).func, 'GET')
+        self.assertIsNotNone(budget, 'No query budget for {}'.format(url))
+
+        before = self.count_queries(url, params)
+        if grow is not None:
+            grow()
+        after = self.count_queries(url, params)
+
+        self.assertLessEqual(after, budget, url)
+        self.assertEqual(before, after, url)
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+})
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """ Test the query budgets of the read endpoints
+    """
+    fixtures = ['test_data']
+
+    endpoints = [
+        ('/jobs/', {}),
+        ('/jobs/', {'expand': 'measurements,packages,blobs'}),
+        ('/jobs/1/', {}),
+        ('/jobs/1/verdicts/', {}),
+        ('/jobs/', {'failing': 'design'}),
+        ('/regressions/', {}),
+        ('/metrics/', {}),
+        ('/metrics/AM1/', {}),
+        ('/measurements/', {'metric': 'AM1'}),
+        ('/measurements/', {'metric': 'AM1', 'resolution': 'week'}),
+        ('/code_changes/', {'ci_dataset': 'cfht'}),
+        ('/datasets/', {}),
+        ('/defaults/', {}),
+        ('/apps/', {'ci_id': '1', 'ci_dataset': 'cfht', 'metric': 'AM1'}),
+        ('/stats/', {}),
+        ('/ingest/', {}),
+    ]
+
+    def grow(self):
+        seed_jobs(50)
+        for command in ('build_code_changes', 'build_rollups',
+                        'reconcile_stats'):
+            call_command(command, stdout=StringIO())
+
+    def test_dataset_size(self):
+        for url, params in self.endpoints:
+            self.assertQueryBudget(url, params, grow=self.grow)
+
+    def test_page_size(self):
+
+        patcher = mock.patch.object(JobViewSet, 'paginate_by', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        def grow():
+            JobViewSet.paginate_by = 12
+
+        self.assertQueryBudget('/jobs/', {'expand': 'measurements'},
+                               grow=grow)
+
+    def test_defaults(self):
+
+        # a single lookup of the latest job
+        self.assertEqual(self.count_queries('/defaults/', {}), 1)
+
+        # and the metadata of its measurement, which has none
+        self.assertEqual(self.count_queries('/apps/', {}), 2)
+
+    def test_warning(self):
+
+        with mock.patch.object(JobViewSet, 'query_budget', 0):
+            with self.assertLogs('api.instrumentation', 'WARNING'):
+                self.client.get('/jobs/')
+
+
+@override_settings(SQUASH_DB_REPLICAS=['replica1'], SQUASH_DB_PIN_SECONDS=10)
+class ReplicaRoutingTests(TestCase):
+    """ Test the routing of reads to the read replicas
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        self.middleware = ReplicaRoutingMiddleware()
+        self.router = ReplicaRouter()
+
+        get_cache().delete(LAST_WRITE_KEY)
+        self.addCleanup(set_replica, None)
+
+    def route(self, request):
+        """ Return the database of the reads of a request, outside the
+            transaction of the test case
+        """
+        self.middleware.process_request(request)
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            return self.router.db_for_read(Job)
+
+    def test_safe_methods(self):
+
+        self.assertEqual(self.route(self.factory.get('/jobs/')), 'replica1')
+        self.assertEqual(self.route(self.factory.head('/jobs/')),
+                         'replica1')
+        self.assertEqual(self.route(self.factory.post('/jobs/')), 'default')
+        self.assertEqual(self.router.db_for_write(Job), 'default')
+
+    def test_read_your_writes(self):
+
+        request = self.factory.post('/jobs/')
+        self.route(request)
+        response = self.middleware.process_response(
+            request, HttpResponse(status=201))
+
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 10)
+
+        request = self.factory.get('/jobs/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(self.route(request), 'default')
+
+    def test_failed_write(self):
+
+        request = self.factory.post('/jobs/')
+        self.route(request)
+        response = self.middleware.process_response(
+            request, HttpResponse(status=400))
+
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_recent_write(self):
+
+        # responses cached for the new generation must not be read from
+        # a replica that is behind
+        bump_generation()
+        self.assertEqual(self.route(self.factory.get('/jobs/')), 'default')
+
+        get_cache().set(LAST_WRITE_KEY, time.time() - 11)
+        self.assertEqual(self.route(self.factory.get('/jobs/')), 'replica1')
+
+    def test_outside_requests(self):
+
+        request = self.factory.get('/jobs/')
+        self.route(request)
+        self.middleware.process_response(request, HttpResponse())
+
+        with mock.patch.object(connection, 'in_atomic_block', False):
+            self.assertEqual(self.router.db_for_read(Job), 'default')
+
+    def test_transaction(self):
+
+        self.middleware.process_request(self.factory.get('/jobs/'))
+        self.assertEqual(self.router.db_for_read(Job), 'default')
+
+    def test_no_replicas(self):
+
+        with override_settings(SQUASH_DB_REPLICAS=[]):
+            request = self.factory.post('/jobs/')
+            self.assertEqual(self.route(request), 'default')
+            response = self.middleware.process_response(
+                request, HttpResponse(status=201))
+
+            self.assertEqual(self.route(self.factory.get('/jobs/')),
+                             'default')
+
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def use_replica(self):
+        """ Return a replica1 connection sharing the database connection,
+            and the transaction, of the test case
+        """
+        default = connections['default']
+        default.ensure_connection()
+
+        replica = type(default)(dict(default.settings_dict),
+                                alias='replica1')
+        replica.connection = default.connection
+
+        connections.databases['replica1'] = replica.settings_dict
+        setattr(connections._connections, 'replica1', replica)
+
+        def remove_replica():
+            # the database connection is closed with the default one
+            replica.connection = None
+            delattr(connections._connections, 'replica1')
+            del connections.databases['replica1']
+
+        self.addCleanup(remove_replica)
+
+        patcher = mock.patch.object(default, 'in_atomic_block', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        return replica
+
+    def test_measurements(self):
+
+        call_command('loaddata', 'test_data', verbosity=0)
+        get_cache().delete(LAST_WRITE_KEY)
+        replica = self.use_replica()
+
+        with CaptureQueriesContext(replica) as context:
+            response = self.client.get('/measurements/', {'metric': 'AM1'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 12)
+
+        # the pandas query of the measurements is run on the replica
+        self.assertTrue(any('api_measurement' in query['sql']
+                            for query in context.captured_queries))
+
+    def test_migrate(self):
+
+        self.assertTrue(self.router.allow_migrate('default', 'api'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'api'))
+
+
+class PooledConnectionTests(TestCase):
+    """ Test the health checks and statistics of persistent connections
+    """
+
+    def setUp(self):
+        super().setUp()
+        # a connection of its own, outside the transaction of the test
+        default = connections['default']
+        settings_dict = dict(default.settings_dict)
+
+        # connections to in-memory SQLite databases are never closed
+        if default.vendor == 'sqlite' and \
+                default.is_in_memory_db(settings_dict['NAME']):
+            fd, settings_dict['NAME'] = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+            self.addCleanup(os.remove, settings_dict['NAME'])
+
+        self.connection = type(default)(settings_dict, alias='pool-tests')
+        self.addCleanup(self.connection.close)
+
+    def get_value(self, name, **labels):
+        labels['alias'] = 'pool-tests'
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_backend(self):
+        self.assertIsInstance(connections['default'],
+                              PooledDatabaseWrapperMixin)
+
+    def test_reuse(self):
+
+        opened = self.get_value('squash_db_connections_opened_total')
+        reused = self.get_value('squash_db_connections_reused_total')
+
+        self.connection.ensure_connection()
+        self.assertEqual(self.get_value('squash_db_connections_opened_total'),
+                         opened + 1)
+        self.assertEqual(self.get_value('squash_db_connections_open'), 1)
+
+        self.connection.release()
+        self.assertEqual(self.get_value('squash_db_connections_idle'), 1)
+
+        raw_connection = self.connection.connection
+        self.connection.acquire()
+
+        self.assertIs(self.connection.connection, raw_connection)
+        self.assertEqual(self.get_value('squash_db_connections_idle'), 0)
+        self.assertEqual(self.get_value('squash_db_connections_reused_total'),
+                         reused + 1)
+
+    def test_health_check(self):
+
+        closed = self.get_value('squash_db_connections_closed_total',
+                                reason='unhealthy')
+
+        self.connection.ensure_connection()
+        self.connection.release()
+        self.connection.idle_since -= 60
+
+        with override_settings(SQUASH_DB_HEALTH_CHECK_INTERVAL=30), \
+                mock.patch.object(self.connection, 'is_usable',
+                                  return_value=False) as is_usable:
+            self.connection.acquire()
+
+        self.assertTrue(is_usable.called)
+        self.assertIsNone(self.connection.connection)
+        self.assertEqual(self.get_value('squash_db_connections_open'), 0)
+        self.assertEqual(self.get_value('squash_db_connections_idle'), 0)
+        self.assertEqual(self.get_value('squash_db_connections_closed_total',
+                                        reason='unhealthy'), closed + 1)
+
+    def test_no_health_check_when_recently_used(self):
+
+        self.connection.ensure_connection()
+        self.connection.release()
+
+        with override_settings(SQUASH_DB_HEALTH_CHECK_INTERVAL=30), \
+                mock.patch.object(self.connection, 'is_usable') as is_usable:
+            self.connection.acquire()
+
+        self.assertFalse(is_usable.called)
+        self.assertIsNotNone(self.connection.connection)
+
+    def test_recycle(self):
+
+        closed = self.get_value('squash_db_connections_closed_total',
+                                reason='recycled')
+
+        self.connection.ensure_connection()
+        self.connection.close_at = time.time() - 1
+        self.connection.close_if_unusable_or_obsolete()
+
+        self.assertIsNone(self.connection.connection)
+        self.assertEqual(self.get_value('squash_db_connections_closed_total',
+                                        reason='recycled'), closed + 1)
@@ -0,0 +1,59 @@
+from ast import literal_eval
+import json
+import re
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+
+def accepts_gzip(request):
+    """Return whether the client accepts gzip compressed responses"""
+    return bool(ACCEPTS_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING',
+                                                     '')))
+
+
+def decode_legacy_json(value):
+    """Return the data held by a legacy JSON string value, or None.
+
+    Legacy values are strings holding the Python repr of a dict or a list.
+    Other strings, even starting with a bracket, are returned unchanged by
+    `load_json`.
+    """
+    if not isinstance(value, str) or value[:1] not in ('{', '['):
+        return None
+
+    try:
+        data = literal_eval(value)
+    except (ValueError, SyntaxError):
+        return None
+
+    if not isinstance(data, (dict, list)):
+        return None
+
+    return data
+
+
+def load_json(raw):
+    """Decode the raw value of a `json_field.JSONField` column.
+
+    Values posted to the API before the serializers handled JSON data were
+    stored as a JSON string holding the Python repr of the data, these are
+    decoded with `ast.literal_eval`. Run the `convert_json_fields` command
+    to convert them, so that reading them is a single `json.loads`.
+    """
+    if raw is None:
+        return None
+
+    value = json.loads(raw)
+
+    data = decode_legacy_json(value)
+
+    return value if data is None else data
+
+
+def is_legacy_json(raw):
+    """Whether a raw JSONField value holds the Python repr of the data"""
+
+    if raw is None:
+        return False
+
+    return decode_legacy_json(json.loads(raw)) is not None
@@ -0,0 +1,82 @@
+"""Evaluation of measurements against the specifications of their metric.
+
+A metric has a comparison operator and a list of specifications, e.g. the
+design, minimum and stretch goals, each with a threshold ``value``. A
+measurement passes a specification if ``value <operator> threshold``.
+
+All the (measurement, specification) pairs of a job are evaluated at once
+when the job is ingested, and stored as `models.SpecVerdict` rows so that
+clients and the failing jobs filter do not evaluate them again.
+"""
+import numpy as np
+import pandas as pd
+
+OPERATORS = {
+    '<': np.less,
+    '<=': np.less_equal,
+    '>': np.greater,
+    '>=': np.greater_equal,
+    '==': np.equal,
+    '!=': np.not_equal,
+}
+
+SPEC_COLUMNS = ['metric', 'spec', 'operator', 'threshold']
+
+
+def get_spec_frame(metrics):
+    """Return the specifications of `metrics` as a data frame with the
+    `SPEC_COLUMNS`.
+
+    Specifications without a name or a numeric threshold, and metrics with
+    an unknown operator, can not be evaluated and are skipped.
+    """
+    rows = []
+
+    for metric in metrics:
+        if metric.operator not in OPERATORS:
+            continue
+
+        for spec in metric.specs or []:
+            if not isinstance(spec, dict) or not spec.get('name'):
+                continue
+
+            threshold = spec.get('value')
+            if isinstance(threshold, bool) or \
+                    not isinstance(threshold, (int, float)):
+                continue
+
+            rows.append((metric.metric, spec['name'], metric.operator,
+                         float(threshold)))
+
+    return pd.DataFrame(rows, columns=SPEC_COLUMNS)
+
+
+def evaluate_specs(measurements, specs):
+    """Evaluate measurements against specifications.
+
+    Parameters
+    ----------
+    measurements : pandas.DataFrame
+        Measurements with at least the ``metric`` and ``value`` columns.
+    specs : pandas.DataFrame
+        Specifications as returned by `get_spec_frame`.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per measurement and specification of its metric, with the
+        columns of both frames and the boolean ``passed`` column.
+    """
+    frame = measurements.merge(specs, on='metric')
+
+    values = frame['value'].values
+    thresholds = frame['threshold'].values
+    passed = np.zeros(len(frame), dtype=bool)
+
+    # one comparison per operator over all the rows using it
+    for operator, index in frame.groupby('operator').indices.items():
+        passed[index] = OPERATORS[operator](values[index], thresholds[index])
+
+    frame['passed'] = passed
+
+    return frame
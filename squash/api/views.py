@@ -1,18 +1,56 @@
-from ast import literal_eval
 import pandas as pd
 import datetime
-import itertools
-
-from django.db import connection
-
+import gzip
+import json
+import logging
+
+from django.conf import settings
+from django.db import connections, DatabaseError
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
+
+from prometheus_client import CONTENT_TYPE_LATEST
 from rest_framework import authentication, permissions,\
-    viewsets, filters, response, status
+    viewsets, filters, response, status, exceptions
 
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.settings import api_settings
+from rest_framework_extensions.cache.decorators import cache_response
 from rest_framework_extensions.cache.mixins import CacheResponseMixin
+from rest_framework_extensions.etag.decorators import etag
+from rest_framework_extensions.etag.mixins import ReadOnlyETAGMixin
 
+from .app_payloads import get_payload
+from .blobstore import get_blob_store, is_durable
+from .cache import app_etag_func, blob_etag_func, view_cache_key_func
+from .downsampling import downsample_frame, METHODS as DOWNSAMPLING_METHODS
 from .forms import JobFilter
-from .models import Job, Metric, Measurement, Job, VersionedPackage
-from .serializers import JobSerializer, MetricSerializer
+from .ingest import enqueue
+from .instrumentation import generate_metrics, timer
+from .models import Job, Metric, Measurement, \
+    CodeChange, MeasurementRollup, StatsSummary, IngestTask, SpecVerdict, \
+    Regression, get_period_start
+from .pagination import JobPagination, MetricPagination
+from .renderers import ArrowRenderer, ParquetRenderer
+from .serializers import JobSerializer, MetricSerializer, \
+    IngestTaskSerializer, SpecVerdictSerializer, RegressionSerializer
+from .streaming import iter_jobs
+from .utils import accepts_gzip
+
+# default number of points per series when only the downsampling method
+# is given, and the lowest accepted value
+DEFAULT_MAX_POINTS = 1000
+MIN_MAX_POINTS = 4
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStoreUnavailable(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = ('Streamed uploads need a durable blob store, post the '
+                      'jobs to the jobs or batch endpoint.')
 
 
 class DefaultsMixin(object):
@@ -32,6 +70,10 @@ class DefaultsMixin(object):
 
     paginate_by = 25
 
+    # maximum number of queries of a read request, independent of the page
+    # size and of the amount of data, see api/instrumentation.py
+    query_budget = 1
+
     # list of available filter_backends, will enable these for all ViewSets
     filter_backends = (
         filters.DjangoFilterBackend,
@@ -40,103 +82,482 @@ class DefaultsMixin(object):
     )
 
 
-class JobViewSet(DefaultsMixin, CacheResponseMixin, viewsets.ModelViewSet):
-    """API endpoint for listing and creating ci jobs"""
+class JobViewSet(DefaultsMixin, ReadOnlyETAGMixin, CacheResponseMixin,
+                 viewsets.ModelViewSet):
+    """API endpoint for listing and creating ci jobs
+
+    Job listings omit the blobs, measurements and packages, use
+    `?expand=measurements,packages` to include them or `?fields=` to select
+    the fields returned.
+    """
 
-    queryset = Job.objects.\
-        prefetch_related('packages', 'measurements').order_by('date')
+    queryset = Job.objects.order_by('date')
     serializer_class = JobSerializer
+    lookup_value_regex = '[0-9]+'
+    pagination_class = JobPagination
+    # the jobs with their manifests, their measurements and packages
+    query_budget = 3
     filter_class = JobFilter
     search_fields = ('ci_id',)
     ordering_fields = ('date',)
 
+    def get_query_param_list(self, name):
+        """Parse a comma separated list of job fields"""
 
-class CodeChangesViewSet(DefaultsMixin, CacheResponseMixin, viewsets.ViewSet):
-    """API endpoint consumed by the Monitor app. It returns the list of packages
-    that changed wrt to the previous ci job"""
+        value = self.request.query_params.get(name, None)
+
+        if value is None:
+            return None
+
+        names = [x.strip() for x in value.split(',') if x.strip()]
+
+        unknown = set(names) - set(JobSerializer.Meta.fields)
+        if unknown:
+            raise exceptions.ValidationError(
+                {name: 'Unknown fields: {}.'.format(
+                    ', '.join(sorted(unknown)))})
+
+        return names
+
+    def get_fields(self):
+        """Return the fields to serialize in a read request.
+
+        `fields` selects the fields, by default all fields except the
+        expandable `blobs`, `measurements` and `packages` which are only
+        returned by the detail view. `expand` adds expandable fields to
+        the selection.
+        """
+
+        fields = self.get_query_param_list('fields')
+
+        if fields is None:
+            if self.action == 'retrieve':
+                fields = list(JobSerializer.Meta.fields)
+            else:
+                fields = [x for x in JobSerializer.Meta.fields
+                          if x not in JobSerializer.EXPANDABLE_FIELDS]
+
+        for name in self.get_query_param_list('expand') or []:
+            if name not in JobSerializer.EXPANDABLE_FIELDS:
+                raise exceptions.ValidationError(
+                    {'expand': '{} cannot be expanded.'.format(name)})
+            if name not in fields:
+                fields.append(name)
+
+        return fields
+
+    def is_read(self):
+        return self.action in ('list', 'retrieve')
 
-    def compute_code_changes(self, queryset):
-        """ This method detects differences in the packages between two ci jobs
-        - packages present in the current ci job but not present in the
-        previous one
-        - packages present in the previous job but removed in the current one
-        - packages present in both but that have changed according to the git
-        commit sha
+    def get_queryset(self):
+        """Read only the selected fields, the blobs are deferred and the
+        measurements and packages are not prefetched unless selected"""
+
+        queryset = super(JobViewSet, self).get_queryset()
+
+        if not self.is_read():
+            return queryset
+
+        fields = self.get_fields()
+
+        relations = [x for x in ('measurements', 'packages') if x in fields]
+        # the date is the pagination key
+        columns = [x for x in fields if x not in relations + ['links']]
+
+        if 'measurements' in fields:
+            queryset = queryset.prefetch_related('measurements')
+
+        if 'packages' in fields:
+            # the manifests are joined, their versions prefetched
+            queryset = queryset.select_related('manifest').\
+                prefetch_related('manifest__versions')
+            columns.append('manifest')
+
+        return queryset.only('date', *columns)
+
+    def get_serializer(self, *args, **kwargs):
+        if self.is_read():
+            kwargs['fields'] = self.get_fields()
+        return super(JobViewSet, self).get_serializer(*args, **kwargs)
+
+    def is_async(self):
+        """Posted jobs are queued when asynchronous ingestion is enabled or
+        requested with the `Prefer: respond-async` header"""
+
+        prefer = self.request.META.get('HTTP_PREFER', '')
+        return settings.SQUASH_ASYNC_INGESTION or 'respond-async' in prefer
+
+    def create(self, request, *args, **kwargs):
+        """Create a job, or validate and queue it in asynchronous mode.
+
+        Queued jobs are created by the `process_ingest_queue` command, the
+        response is 202 Accepted with a link to the status of the task.
         """
 
-        # list of unique job id's from the queryset
-        ci_ids = []
-        for x in queryset:
-            if x[0] not in ci_ids:
-                ci_ids.append(x[0])
+        if not self.is_async():
+            return super(JobViewSet, self).create(request, *args, **kwargs)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        task = enqueue(serializer)
 
-        code_changes = []
+        data = IngestTaskSerializer(task, context={'request': request}).data
+        return response.Response(data, status=status.HTTP_202_ACCEPTED,
+                                 headers={'Location': data['links']['self']})
 
-        for prev_ci_id, curr_ci_id in self.pairwise(ci_ids):
+    def create_job(self, index, data, **kwargs):
+        """Validate and create a job, returning its status in a batch"""
 
-            # we carry on the pkg name, the git commit sha and the git url
-            prev_pkgs = set([(pkg[1], pkg[2], pkg[3])
-                             for pkg in queryset if pkg[0] == prev_ci_id])
-            curr_pkgs = set([(pkg[1], pkg[2], pkg[3])
-                             for pkg in queryset if pkg[0] == curr_ci_id])
+        serializer = self.get_serializer(data=data)
 
-            diff_pkgs = curr_pkgs.difference(prev_pkgs)
+        if not serializer.is_valid():
+            return {'index': index,
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': serializer.errors}
 
-            if diff_pkgs:
-                code_changes.append({'ci_id': curr_ci_id,
-                                     'packages': diff_pkgs,
-                                     'count': len(diff_pkgs)})
-        return code_changes
+        try:
+            job = serializer.save(**kwargs)
+        except DatabaseError:
+            # the database error may hold SQL and schema details
+            logger.exception('Failed to create job %d of a batch', index)
+            return {'index': index,
+                    'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': {'non_field_errors': [
+                        'The job could not be saved.']}}
+
+        return {'index': index,
+                'status': status.HTTP_201_CREATED,
+                'ci_id': job.ci_id,
+                'links': serializer.get_links(job)}
+
+    def batch_response(self, results, error=None):
+        """Report the status of each job of a batch, and the `error` that
+        stopped the batch if any"""
+
+        created = sum(x['status'] == status.HTTP_201_CREATED
+                      for x in results)
+
+        data = {'created': created,
+                'failed': len(results) - created,
+                'results': results}
+
+        if error is not None:
+            data['error'] = error
+            status_code = status.HTTP_400_BAD_REQUEST
+        elif results and created == len(results):
+            status_code = status.HTTP_201_CREATED
+        else:
+            status_code = status.HTTP_200_OK
+
+        return response.Response(data, status=status_code)
+
+    @detail_route()
+    def verdicts(self, request, pk=None):
+        """Return the evaluation of the measurements of a job against the
+        specifications of their metric
+
+        Verdicts are computed when the job is ingested, use the `failing`
+        filter of the job list to select the jobs failing a specification.
+        """
+        verdicts = SpecVerdict.objects.filter(job=pk).\
+            order_by('metric', 'spec')
+        data = SpecVerdictSerializer(verdicts, many=True).data
+
+        if not data and not Job.objects.filter(pk=pk).exists():
+            raise exceptions.NotFound()
+
+        return response.Response({
+            'passed': all(x['passed'] for x in data),
+            'verdicts': data,
+        })
+
+    @list_route(methods=['post'])
+    def batch(self, request):
+        """Create multiple jobs at once
+
+        The request data is a list of jobs, each job is validated and
+        created in its own transaction so that an invalid job does not
+        prevent the others from being created. The response reports the
+        status of each job in the batch.
+        """
+        if not isinstance(request.data, list):
+            raise exceptions.ValidationError(
+                {'non_field_errors': ['Expected a list of jobs.']})
+
+        results = [self.create_job(index, data)
+                   for index, data in enumerate(request.data)]
+
+        return self.batch_response(results)
+
+    @list_route(methods=['post'])
+    def stream(self, request):
+        """Create jobs from a newline-delimited JSON upload
+
+        The request body is parsed incrementally, see `api.streaming` for
+        the record format. Job blobs are written to the blob store in chunks
+        as they are received and the jobs keep references to them, so the
+        memory used does not depend on the size of the upload. The response
+        reports the status of each job like the batch endpoint. If the
+        upload is invalid the response is 400 Bad Request, with the `error`
+        and the status of the jobs before it, which are created.
+
+        The jobs would have to keep the data of their blobs inline if the
+        blob store is not durable, the upload is then refused with 503
+        Service Unavailable.
+        """
+        if not is_durable():
+            raise BlobStoreUnavailable()
+
+        if request.stream is None:
+            raise exceptions.ParseError('Empty upload.')
+
+        results = []
+        store = get_blob_store()
+
+        try:
+            for index, (data, blobs) in enumerate(
+                    iter_jobs(request.stream, store)):
+                # blobs are not part of the job record
+                data.pop('blobs', None)
 
-    def pairwise(self, iterable):
-        "s -> (s0,s1), (s1,s2), (s2, s3), ..."
-        a, b = itertools.tee(iterable)
-        next(b, None)
-        return zip(a, b)
+                results.append(self.create_job(index, data,
+                                               blobs=blobs or None))
+        except exceptions.ParseError as e:
+            return self.batch_response(results, error=e.detail)
 
+        return self.batch_response(results)
+
+
+class RecentMixin(object):
+    """Parse the `since` and `limit` query parameters of the endpoints
+    returning the most recent rows"""
+
+    def get_since(self):
+        """Parse the optional `since` query parameter, a date or datetime
+        in ISO 8601 format"""
+
+        since = self.request.query_params.get('since', None)
+
+        if since is None:
+            return None
+
+        value = parse_datetime(since)
+
+        if value is None:
+            date = parse_date(since)
+            if date is not None:
+                value = datetime.datetime.combine(date, datetime.time())
+
+        if value is None:
+            raise exceptions.ValidationError(
+                {'since': 'Enter a valid date or datetime.'})
+
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, timezone.utc)
+
+        return value
+
+    def get_limit(self):
+        """Parse the optional `limit` query parameter"""
+
+        limit = self.request.query_params.get('limit', None)
+
+        if limit is None:
+            return None
+
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+
+        if limit <= 0:
+            raise exceptions.ValidationError(
+                {'limit': 'Enter a positive integer.'})
+
+        return limit
+
+
+class CodeChangesViewSet(DefaultsMixin, RecentMixin, viewsets.ViewSet):
+    """API endpoint consumed by the Monitor app. It returns the list of packages
+    that changed wrt to the previous ci job"""
+
+    @etag(etag_func=view_cache_key_func)
+    @cache_response(key_func=view_cache_key_func)
     def list(self, request):
-        """Return the code changes as a pandas data frame"""
+        """Return the code changes as a pandas data frame
 
-        queryset = Job.objects.prefetch_related('packages')\
-            .values_list('ci_id', 'packages__name',
-                         'packages__git_commit',
-                         'packages__git_url').order_by('date')
+        The package delta of every job wrt the previous job of the same
+        dataset is computed when the job is ingested, so this is a plain
+        indexed read. Use `since` to restrict the code changes to jobs
+        registered after a given date and `limit` to return only the
+        most recent code changes.
+        """
+
+        queryset = CodeChange.objects.select_related('job').\
+            filter(count__gt=0)
 
         ci_dataset = self.request.query_params.get('ci_dataset', None)
 
         if ci_dataset is not None:
             queryset = queryset.filter(ci_dataset=ci_dataset)
 
-        code_changes = self.compute_code_changes(queryset)
+        since = self.get_since()
+
+        if since is not None:
+            queryset = queryset.filter(date__gte=since)
+
+        limit = self.get_limit()
+
+        if limit is not None:
+            queryset = reversed(queryset.order_by('-date', '-id')[:limit])
+        else:
+            queryset = queryset.order_by('date', 'id')
+
+        code_changes = [x.as_entry() for x in queryset]
+
+        with timer('pandas'):
+            df = pd.DataFrame(code_changes)
+
+        return response.Response(df)
+
+
+class RegressionViewSet(DefaultsMixin, RecentMixin, viewsets.ViewSet):
+    """API endpoint for the jumps detected in the measurements of the
+    metrics, with the package delta of the job"""
+
+    def get_direction(self):
+        """Parse the optional `direction` query parameter"""
+
+        direction = self.request.query_params.get('direction', None)
+
+        if direction is not None and \
+                direction not in dict(Regression.DIRECTION_CHOICES):
+            raise exceptions.ValidationError(
+                {'direction': 'Select one of {}.'.format(', '.join(
+                    x for x, _ in Regression.DIRECTION_CHOICES))})
+
+        return direction
+
+    @etag(etag_func=view_cache_key_func)
+    @cache_response(key_func=view_cache_key_func)
+    def list(self, request):
+        """Return the regressions
+
+        Jumps of the (metric, ci_dataset) series are detected when a job is
+        ingested, see api/regressions.py. Filter them with `metric`,
+        `ci_dataset` and `direction`, e.g. `worse`, use `since` and `limit`
+        as in the code changes endpoint.
+        """
+
+        queryset = Regression.objects.select_related('job',
+                                                     'job__code_change')
+
+        for name in ('metric', 'ci_dataset'):
+            value = self.request.query_params.get(name, None)
+
+            if value is not None:
+                queryset = queryset.filter(**{name: value})
+
+        direction = self.get_direction()
 
-        return response.Response(pd.DataFrame(code_changes))
+        if direction is not None:
+            queryset = queryset.filter(direction=direction)
 
+        since = self.get_since()
 
-class MeasurementViewSet(DefaultsMixin, CacheResponseMixin, viewsets.ViewSet):
+        if since is not None:
+            queryset = queryset.filter(date__gte=since)
+
+        limit = self.get_limit()
+
+        if limit is not None:
+            queryset = reversed(queryset.order_by('-date', '-id')[:limit])
+        else:
+            queryset = queryset.order_by('date', 'id')
+
+        serializer = RegressionSerializer(queryset, many=True,
+                                          context={'request': request})
+
+        return response.Response(serializer.data)
+
+
+class MeasurementViewSet(DefaultsMixin, viewsets.ViewSet):
     """API endpoint consumed by the monitor app. It returns measurements for the
-    selected metric and ci_dataset"""
+    selected metric and ci_dataset
+
+    Measurements are also available in columnar formats with `?format=arrow`
+    (Arrow IPC stream) or `?format=parquet`.
+    """
+
+    renderer_classes = tuple(api_settings.DEFAULT_RENDERER_CLASSES) + \
+        (ArrowRenderer, ParquetRenderer)
 
     def to_df(self, queryset):
         """ SQuaSH API optmization using Django querysets with Pandas
             https://www.iwoca.co.uk/blog/2016/09/02/using-pandas-django-faster/
         """
+        # the database chosen by the router, a replica for the reads of
+        # safe requests
+        db_connection = connections[queryset.db]
+
         try:
-            query, params = queryset.query.sql_with_params()
+            query, params = queryset.query.get_compiler(
+                connection=db_connection).as_sql()
         except EmptyResultSet: # noqa
             # Occurs when Django tries to create an expression for a
             # query which will certainly be empty
             # e.g. Book.objects.filter(author__in=[])
             return pd.DataFrame()
 
-        return pd.io.sql.read_sql_query(query, connection, params=params)
+        with timer('pandas'):
+            return pd.io.sql.read_sql_query(query, db_connection,
+                                            params=params)
+
+    def get_start(self):
+        """Start of the time period selected with the `period` query
+        parameter, or None to show all data"""
 
+        period = self.request.query_params.get('period', None)
+
+        if period is None or period == "All":
+            return None
+
+        end = datetime.datetime.today()
+
+        # by default shows last month of data
+        start = end - datetime.timedelta(weeks=4)
+
+        if period == "Last year":
+            start = end - datetime.timedelta(weeks=48)
+        elif period == "Last 6 months":
+            start = end - datetime.timedelta(weeks=24)
+        elif period == "Last 3 months":
+            start = end - datetime.timedelta(weeks=12)
+
+        return start
+
+    @etag(etag_func=view_cache_key_func)
+    @cache_response(key_func=view_cache_key_func)
     def list(self, request):
         """
         Return a pandas data frame to feed the monitor app
 
         Optionally constraints the returned measurements
         by filtering against the `metric` query parameter in the URL.
+
+        Use `resolution=day` or `resolution=week` to return the
+        pre-aggregated count, min, max, mean and last value of each period
+        instead of the individual measurements.
+
+        Use `max_points` to downsample each series to at most that many
+        points, and `downsample` to choose the method: `lttb` (default) or
+        `minmax`, see api/downsampling.py.
         """
+        resolution = self.request.query_params.get('resolution', None)
+
+        if resolution is not None:
+            return self.list_rollups(resolution)
+
         queryset = Measurement.objects.\
             prefetch_related('metric', 'job').order_by('job__date')
 
@@ -150,36 +571,107 @@ class MeasurementViewSet(DefaultsMixin, CacheResponseMixin, viewsets.ViewSet):
         if ci_dataset is not None:
             queryset = queryset.filter(job__ci_dataset=ci_dataset)
 
-        period = self.request.query_params.get('period', None)
+        start = self.get_start()
 
-        if period is not None:
-            end = datetime.datetime.today()
-
-            # by default shows last month of data
-            start = end - datetime.timedelta(weeks=4)
-
-            if period == "Last year":
-                start = end - datetime.timedelta(weeks=48)
-            elif period == "Last 6 months":
-                start = end - datetime.timedelta(weeks=24)
-            elif period == "Last 3 months":
-                start = end - datetime.timedelta(weeks=12)
-
-            if period != "All":
-                queryset = queryset.filter(job__date__gt=start)
+        if start is not None:
+            queryset = queryset.filter(job__date__gt=start)
 
         df = self.to_df(queryset.values('job__ci_dataset', 'job__ci_id',
                                         'job__date', 'job__ci_url', 'value',
                                         'metric'))
 
+        max_points, method = self.get_downsampling()
+
+        if max_points is not None:
+            with timer('pandas'):
+                df = downsample_frame(df, max_points, method, x='date',
+                                      y='value',
+                                      by=['ci_dataset', 'metric_id'])
+
+        return response.Response(df)
+
+    def list_rollups(self, resolution):
+        """Return the daily or weekly measurement rollups"""
+
+        if resolution not in dict(MeasurementRollup.RESOLUTION_CHOICES):
+            raise exceptions.ValidationError(
+                {'resolution': 'Choose one of {}.'.format(', '.join(
+                    dict(MeasurementRollup.RESOLUTION_CHOICES)))})
+
+        queryset = MeasurementRollup.objects.\
+            filter(resolution=resolution).order_by('period_start')
+
+        metric = self.request.query_params.get('metric', None)
+
+        if metric is not None:
+            queryset = queryset.filter(metric=metric)
+
+        ci_dataset = self.request.query_params.get('ci_dataset', None)
+
+        if ci_dataset is not None:
+            queryset = queryset.filter(ci_dataset=ci_dataset)
+
+        start = self.get_start()
+
+        # the period holding the start is partially selected
+        if start is not None:
+            queryset = queryset.filter(
+                period_start__gte=get_period_start(start, resolution))
+
+        df = self.to_df(queryset.values('ci_dataset', 'ci_label',
+                                        'period_start', 'count', 'min',
+                                        'max', 'mean', 'last', 'metric'))
+
+        max_points, method = self.get_downsampling()
+
+        if max_points is not None:
+            with timer('pandas'):
+                df = downsample_frame(df, max_points, method,
+                                      x='period_start', y='mean',
+                                      by=['ci_dataset', 'ci_label',
+                                          'metric_id'])
+
         return response.Response(df)
 
+    def get_downsampling(self):
+        """Parse the `max_points` and `downsample` query parameters"""
+
+        max_points = self.request.query_params.get('max_points', None)
+        method = self.request.query_params.get('downsample', None)
+
+        if max_points is None and method is None:
+            return None, None
+
+        if max_points is None:
+            max_points = DEFAULT_MAX_POINTS
+        else:
+            try:
+                max_points = int(max_points)
+            except ValueError:
+                max_points = 0
 
-class MetricViewSet(DefaultsMixin, CacheResponseMixin, viewsets.ModelViewSet):
+            if max_points < MIN_MAX_POINTS:
+                raise exceptions.ValidationError(
+                    {'max_points': 'Enter an integer greater than or equal '
+                                   'to {}.'.format(MIN_MAX_POINTS)})
+
+        if method is None:
+            method = 'lttb'
+        elif method not in DOWNSAMPLING_METHODS:
+            raise exceptions.ValidationError(
+                {'downsample': 'Choose one of {}.'.format(
+                    ', '.join(DOWNSAMPLING_METHODS))})
+
+        return max_points, method
+
+
+class MetricViewSet(DefaultsMixin, ReadOnlyETAGMixin, CacheResponseMixin,
+                    viewsets.ModelViewSet):
     """API endpoint for listing and creating metrics"""
 
     queryset = Metric.objects.order_by('metric')
     serializer_class = MetricSerializer
+    pagination_class = MetricPagination
 
     def create(self, request, *args, **kwargs):
         # many=True for adding multiple items at once
@@ -197,6 +689,7 @@ class MetricViewSet(DefaultsMixin, CacheResponseMixin, viewsets.ModelViewSet):
 class DatasetViewSet(DefaultsMixin, viewsets.ViewSet):
     """API endpoint for listing datasets"""
 
+    @etag(etag_func=view_cache_key_func)
     def list(self, request):
         datasets = Job.objects.values_list('ci_dataset', flat=True).distinct()
         return response.Response(datasets)
@@ -208,17 +701,21 @@ class DefaultsViewSet(DefaultsMixin, viewsets.ViewSet):
     the squash-bokeh apps
     """
 
+    # the latest job
+    query_budget = 1
+
     def get_defaults(self):
 
         ci_id = None
         ci_dataset = None
 
         # by default user wants to see results for the latest job
-        job = Job.objects.values('ci_id', 'ci_dataset').order_by('-id')
+        job = Job.objects.values('ci_id', 'ci_dataset').order_by('-id').\
+            first()
 
-        if job.exists():
-            ci_id = job[0]['ci_id']
-            ci_dataset = job[0]['ci_dataset']
+        if job is not None:
+            ci_id = job['ci_id']
+            ci_dataset = job['ci_dataset']
 
         # user wants to see always the same metric, pick the first
         # metrics = Metric.objects.values_list('metric', flat=True)
@@ -240,94 +737,138 @@ class DefaultsViewSet(DefaultsMixin, viewsets.ViewSet):
         return {'ci_id': ci_id, 'ci_dataset': ci_dataset,
                 'metric': metric, 'snr_cut': snr_cut, 'period': period}
 
+    @etag(etag_func=view_cache_key_func)
     def list(self, request):
         defaults = self.get_defaults()
         return response.Response(defaults)
 
 
 class AppViewSet(DefaultsMixin, viewsets.ViewSet):
-    """API endpoint for listing data consumed by the squash-bokeh apps"""
-
-    def get_app_data(self, ci_id, ci_dataset, metric):
-
-        data = {}
-        blobs = Job.objects.filter(ci_id=ci_id,
-                                   ci_dataset=ci_dataset).values('blobs')
-        metadata = Measurement.\
-            objects.filter(metric=metric, job__ci_id=ci_id,
-                           job__ci_dataset=ci_dataset).values('metadata')
-
-        if metadata.exists():
-            # workaround for getting item from queryset
-            metadata = metadata[0]['metadata']
-            if metadata:
-                metadata = literal_eval(literal_eval(metadata))
-                blob_id = metadata.pop('blobs')
-                data['metadata'] = metadata
-
-                if blobs.exists():
-                    # workaround for getting item from queryset
-                    blobs = blobs[0]['blobs']
-                    if blobs:
-                        blobs = literal_eval(literal_eval(blobs))
-                        for blob in blobs:
-                            # Look up for data blobs
-                            if blob['identifier'] == blob_id['matchedDataset']:
-                                data['matchedDataset'] = blob['data']
-
-                            elif blob['identifier'] == blob_id['photomModel']:
-                                data['photomModel'] = blob['data']
-
-                            elif blob['identifier'] == blob_id['astromModel']:
-                                data['astromModel'] = blob['data']
-        return data
+    """API endpoint for listing data consumed by the squash-bokeh apps
 
+    The data is served from the payloads pre-rendered in the cache, see
+    api/app_payloads.py.
+    """
+
+    query_budget = 3
+
+    def get_payload_response(self, request, payload):
+        """Return a compressed payload, decompressed for the clients that do
+        not accept gzip and rendered again for the other formats"""
+
+        if request.accepted_renderer.format != 'json':
+            data = json.loads(gzip.decompress(payload).decode('utf-8'))
+            return response.Response(data)
+
+        if accepts_gzip(request):
+            resp = HttpResponse(payload, content_type='application/json')
+            resp['Content-Encoding'] = 'gzip'
+        else:
+            resp = HttpResponse(gzip.decompress(payload),
+                                content_type='application/json')
+
+        return resp
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args,
+                                             **kwargs)
+
+        # after the Vary: Accept header set by DRF, which replaces the
+        # header, also for the 304 responses
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    @etag(etag_func=app_etag_func)
     def list(self, request):
 
-        defaults = DefaultsViewSet().get_defaults()
+        params = self.request.query_params
 
-        ci_id = self.request.query_params.get('ci_id',
-                                              defaults['ci_id'])
-        ci_dataset = self.request.query_params.get('ci_dataset',
-                                                   defaults['ci_dataset'])
-        metric = self.request.query_params.get('metric',
-                                               defaults['metric'])
-        data = self.get_app_data(ci_id, ci_dataset, metric)
+        # the latest job is looked up only if the request does not select
+        # the data
+        if all(x in params for x in ('ci_id', 'ci_dataset', 'metric')):
+            defaults = {}
+        else:
+            defaults = DefaultsViewSet().get_defaults()
 
-        return response.Response(data)
+        ci_id = params.get('ci_id', defaults.get('ci_id'))
+        ci_dataset = params.get('ci_dataset', defaults.get('ci_dataset'))
+        metric = params.get('metric', defaults.get('metric'))
 
-class StatisticsViewSet(DefaultsMixin, viewsets.ViewSet):
+        payload = get_payload(ci_id, ci_dataset, metric)
+
+        if payload is None:
+            return response.Response({})
+
+        return self.get_payload_response(request, payload)
+
+
+class BlobViewSet(DefaultsMixin, viewsets.ViewSet):
+    """API endpoint for retrieving job data blobs from the blob store"""
+
+    lookup_value_regex = '[0-9a-f]{64}'
+    query_budget = 0
+
+    @etag(etag_func=blob_etag_func)
+    def retrieve(self, request, pk=None):
+        store = get_blob_store()
+
+        if not store.exists(pk):
+            raise exceptions.NotFound()
+
+        return FileResponse(store.open(pk), content_type='application/json')
+
+
+class IngestViewSet(DefaultsMixin, viewsets.ViewSet):
     """
-    API endpoint for listing statistics shown on the squash
-    home page.
+    API endpoint for the status of the jobs queued in asynchronous mode,
+    listing returns the number of tasks in each status.
     """
 
-    def get_stats(self):
+    lookup_value_regex = '[0-9]+'
 
-        latest_job = Job.objects.latest('pk')
+    def list(self, request):
+        return response.Response(IngestTask.objects.get_depth())
 
-        number_of_metrics = Metric.objects.count()
+    def retrieve(self, request, pk=None):
+        try:
+            task = IngestTask.objects.get(pk=pk)
+        except IngestTask.DoesNotExist:
+            raise exceptions.NotFound()
 
-        number_of_packages = \
-            VersionedPackage.objects.filter(job=latest_job).count()
+        return response.Response(
+            IngestTaskSerializer(task, context={'request': request}).data)
 
-        number_of_jobs = Job.objects.count()
 
-        number_of_measurements = Measurement.objects.count()
+class StatisticsViewSet(DefaultsMixin, viewsets.ViewSet):
+    """
+    API endpoint for listing statistics shown on the squash
+    home page.
+    """
 
-        datasets = Job.objects.values_list('ci_dataset', flat=True).distinct()
+    def get_stats(self):
+        """Read the statistics from the summary maintained at ingestion"""
 
-        latest_job_date = latest_job.date.strftime("%b %d %Y")
+        summary = StatsSummary.objects.get_summary()
 
-        return { 'number_of_metrics': number_of_metrics,
-                'number_of_packages': number_of_packages,
-                'number_of_jobs': number_of_jobs,
-                'number_of_measurements': number_of_measurements,
-                'datasets': ', '.join(datasets),
+        latest_job_date = None
+        if summary.latest_job_date is not None:
+            latest_job_date = summary.latest_job_date.strftime("%b %d %Y")
+
+        return {'number_of_metrics': summary.number_of_metrics,
+                'number_of_packages': summary.number_of_packages,
+                'number_of_jobs': summary.number_of_jobs,
+                'number_of_measurements': summary.number_of_measurements,
+                'datasets': ', '.join(summary.datasets or []),
                 'latest_job_date': latest_job_date}
 
+    @etag(etag_func=view_cache_key_func)
     def list(self, request):
         stats = self.get_stats()
         return response.Response(stats)
 
 
+def prometheus_metrics(request):
+    """Export the request instrumentation in the Prometheus text format,
+    the `/metrics` endpoint is the metric definitions"""
+
+    return HttpResponse(generate_metrics(), content_type=CONTENT_TYPE_LATEST)
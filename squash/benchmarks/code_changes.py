@@ -0,0 +1,64 @@
+"""Benchmark for the code changes table.
+
+Run from the `squash` directory with:
+
+    python -m benchmarks.code_changes
+
+It fills a test database with an increasing number of synthetic jobs, see
+`benchmarks.synthetic`, and times the `build_code_changes` command, which
+compares the manifests of consecutive jobs with `Manifest.objects.diff`.
+The time per job should stay roughly constant, i.e. the rebuild scales
+linearly with the number of jobs.
+"""
+import argparse
+import shutil
+import timeit
+
+from .endpoints import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--jobs', type=int, nargs='+',
+                        default=[100, 200, 400, 800])
+    parser.add_argument('--packages', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--database', choices=('sqlite', 'mysql'),
+                        default='sqlite')
+    args = parser.parse_args()
+
+    setup_django(args.database, cache=False)
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test.utils import setup_test_environment, \
+        teardown_test_environment
+    from django.utils.six import StringIO
+
+    from .synthetic import generate
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                       serialize=False)
+
+    try:
+        print('{:>8} {:>12} {:>14}'.format('jobs', 'time (s)', 'us per job'))
+        for n_jobs in args.jobs:
+            call_command('flush', interactive=False, verbosity=0)
+            generate(n_jobs, args.packages, n_metrics=1, blob_sources=1)
+
+            elapsed = min(timeit.repeat(
+                lambda: call_command('build_code_changes', stdout=StringIO()),
+                number=1, repeat=args.repeat))
+            print('{:>8} {:>12.3f} {:>14.1f}'.format(
+                n_jobs, elapsed, 1e6 * elapsed / n_jobs))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(settings.SQUASH_BLOB_ROOT)
+
+
+if __name__ == '__main__':
+    main()
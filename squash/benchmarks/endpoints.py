@@ -0,0 +1,260 @@
+"""Benchmark of the API endpoints on synthetic data.
+
+Run from the `squash` directory with:
+
+    python -m benchmarks.endpoints --jobs 500 --packages 100 --metrics 10
+
+A test database is created, SQLite in memory by default or the MySQL
+database configured in `squash/settings.py` with `--database mysql`, and
+filled with synthetic jobs, see `benchmarks.synthetic`. Every endpoint
+registered in the API router is then requested with the Django test client,
+and its latency, number of queries, peak memory and response size are
+reported. The response cache is disabled unless `--cache` is given.
+
+Use `--save-baseline FILE` to store the results and `--baseline FILE` to
+compare with them. The command exits with an error if an endpoint is slower
+than the baseline by more than `--threshold`, or runs more queries.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+
+def setup_django(database, cache):
+    """Configure the settings before Django is set up"""
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'squash.settings')
+
+    import django
+    from django.conf import settings
+
+    if database == 'sqlite':
+        settings.DATABASES['default'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': ':memory:',
+        }
+
+    if not cache:
+        settings.CACHES = {'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+    # blobs are stored as in the deployment, the store outlives the
+    # benchmark database
+    settings.SQUASH_BLOB_ROOT = tempfile.mkdtemp()
+    settings.SQUASH_BLOB_STORE_DURABLE = True
+    settings.ALLOWED_HOSTS = list(settings.ALLOWED_HOSTS) + ['testserver']
+
+    django.setup()
+
+
+def get_requests(metrics):
+    """Return the ``(name, url, params)`` of the benchmarked requests"""
+
+    from api.models import Job
+
+    job = Job.objects.filter(ci_dataset='cfht').latest('date')
+    metric = metrics[0]
+
+    return [
+        ('jobs', '/jobs/', {}),
+        ('jobs expanded', '/jobs/', {'expand': 'measurements,packages'}),
+        ('job', '/jobs/{}/'.format(job.pk), {}),
+        ('job verdicts', '/jobs/{}/verdicts/'.format(job.pk), {}),
+        ('failing jobs', '/jobs/', {'failing': 'design'}),
+        ('metrics', '/metrics/', {}),
+        ('metric', '/metrics/{}/'.format(metric), {}),
+        ('datasets', '/datasets/', {}),
+        ('defaults', '/defaults/', {}),
+        ('stats', '/stats/', {}),
+        ('code_changes', '/code_changes/', {'ci_dataset': 'cfht'}),
+        ('regressions', '/regressions/', {'ci_dataset': 'cfht'}),
+        ('measurements', '/measurements/', {'metric': metric,
+                                            'ci_dataset': 'cfht'}),
+        ('measurements downsampled', '/measurements/',
+         {'metric': metric, 'ci_dataset': 'cfht', 'max_points': 100}),
+        ('measurements daily', '/measurements/',
+         {'metric': metric, 'ci_dataset': 'cfht', 'resolution': 'day'}),
+        ('apps', '/apps/', {'ci_id': job.ci_id, 'ci_dataset': 'cfht',
+                            'metric': metric}),
+        ('blob', '/blobs/{}/'.format(job.blobs[0]['sha256']), {}),
+        ('ingest', '/ingest/', {}),
+    ]
+
+
+def check_coverage(requests):
+    """Fail if an endpoint of the API router is not benchmarked"""
+
+    from squash.urls import api_router
+
+    urls = [url for _, url, _ in requests]
+    missing = [prefix for prefix, _, _ in api_router.registry
+               if not any(url.startswith('/{}/'.format(prefix))
+                          for url in urls)]
+
+    if missing:
+        raise RuntimeError('No benchmark for the endpoints: {}'.format(
+            ', '.join(missing)))
+
+
+def get(client, url, params):
+    """Request an endpoint and return the response size"""
+
+    response = client.get(url, params)
+    if response.status_code != 200:
+        raise RuntimeError('GET {} {} returned {}'.format(
+            url, params, response.status_code))
+
+    if response.streaming:
+        return sum(len(x) for x in response.streaming_content)
+    return len(response.content)
+
+
+def measure(client, url, params, repeat):
+    """Return the latency, number of queries, peak memory and response size
+    of a request"""
+
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    # warm up, and count the queries
+    with CaptureQueriesContext(connection) as context:
+        size = get(client, url, params)
+
+    # the captured queries are read from the query log of the connection,
+    # which is reset by the next requests
+    queries = len(context)
+
+    latencies = timeit.repeat(lambda: get(client, url, params),
+                              number=1, repeat=repeat)
+
+    tracemalloc.start()
+    try:
+        get(client, url, params)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+
+    return {'latency_ms': 1e3 * latencies[0],
+            'median_ms': 1e3 * latencies[len(latencies) // 2],
+            'queries': queries,
+            'peak_memory_kb': peak / 1024.0,
+            'size_kb': size / 1024.0}
+
+
+def compare(results, baseline, threshold):
+    """Return the names of the requests that regressed wrt the baseline"""
+
+    regressions = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        if result['latency_ms'] > threshold * baseline[name]['latency_ms'] \
+                or result['queries'] > baseline[name]['queries']:
+            regressions.append(name)
+
+    return regressions
+
+
+def print_results(results, baseline):
+
+    header = '{:<26} {:>10} {:>10} {:>8} {:>12} {:>10}'.format(
+        'endpoint', 'min (ms)', 'p50 (ms)', 'queries', 'memory (kB)',
+        'size (kB)')
+    if baseline:
+        header += ' {:>14}'.format('vs baseline')
+    print(header)
+
+    for name, result in results.items():
+        line = '{:<26} {latency_ms:>10.1f} {median_ms:>10.1f} ' \
+               '{queries:>8} {peak_memory_kb:>12.0f} ' \
+               '{size_kb:>10.1f}'.format(name, **result)
+        if baseline and name in baseline:
+            line += ' {:>13.2f}x'.format(result['latency_ms'] /
+                                         baseline[name]['latency_ms'])
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--packages', type=int, default=100)
+    parser.add_argument('--metrics', type=int, default=10)
+    parser.add_argument('--blob-sources', type=int, default=1000,
+                        help='Number of sources in every job blob.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database', choices=('sqlite', 'mysql'),
+                        default='sqlite')
+    parser.add_argument('--cache', action='store_true',
+                        help='Enable the response cache.')
+    parser.add_argument('--baseline', help='Compare with this baseline.')
+    parser.add_argument('--save-baseline', help='Save the results there.')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Tolerated latency ratio wrt the baseline.')
+    args = parser.parse_args()
+
+    setup_django(args.database, args.cache)
+
+    from collections import OrderedDict
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment, \
+        teardown_test_environment
+
+    from .synthetic import generate
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                       serialize=False)
+
+    try:
+        start = timeit.default_timer()
+        metrics = generate(args.jobs, args.packages, args.metrics,
+                           blob_sources=args.blob_sources)
+        print('Generated {} jobs in {:.1f} s on {}'.format(
+            args.jobs, timeit.default_timer() - start, connection.vendor))
+
+        requests = get_requests(metrics)
+        check_coverage(requests)
+
+        client = Client()
+        results = OrderedDict(
+            (name, measure(client, url, params, args.repeat))
+            for name, url, params in requests)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(settings.SQUASH_BLOB_ROOT)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    print_results(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'parameters': vars(args), 'results': results}, f,
+                      indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('Regressions: {}'.format(', '.join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
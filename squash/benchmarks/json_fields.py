@@ -0,0 +1,62 @@
+"""Benchmark for decoding the JSON fields read by the apps endpoint.
+
+Run from the `squash` directory with:
+
+    python -m benchmarks.json_fields
+
+It compares the legacy storage, a JSON string holding the Python repr of
+the data decoded with two `ast.literal_eval` calls, with native JSON decoded
+by a single `json.loads`, for blobs of increasing size.
+"""
+import argparse
+import json
+import random
+import timeit
+from ast import literal_eval
+
+
+def generate_blob(n_sources, seed=0):
+    """Return a blob shaped like the validate_drp matchedDataset blob"""
+
+    rng = random.Random(seed)
+    columns = ('ra', 'dec', 'mag', 'magerr', 'snr', 'dist')
+
+    return {'identifier': '{:032x}'.format(rng.getrandbits(128)),
+            'name': 'matchedDataset',
+            'data': {name: {'value': [rng.random() for _ in range(n_sources)],
+                            'unit': 'deg', 'label': name,
+                            'description': None}
+                     for name in columns}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sources', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print('{:>8} {:>10} {:>14} {:>14} {:>8}'.format(
+        'sources', 'size (MB)', 'legacy (s)', 'native (s)', 'speedup'))
+
+    for n_sources in args.sources:
+        blobs = [generate_blob(n_sources)]
+
+        # what is read from the database in each case
+        legacy = json.dumps(repr(blobs))
+        native = json.dumps(blobs)
+
+        legacy_time = min(timeit.repeat(
+            lambda: literal_eval(literal_eval(legacy)),
+            number=1, repeat=args.repeat))
+        native_time = min(timeit.repeat(
+            lambda: json.loads(native),
+            number=1, repeat=args.repeat))
+
+        print('{:>8} {:>10.1f} {:>14.4f} {:>14.4f} {:>7.1f}x'.format(
+            n_sources, len(native) / 1024.0 ** 2, legacy_time, native_time,
+            legacy_time / native_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Synthetic SQuaSH data for the benchmarks.
+
+Jobs are created through `JobSerializer`, the ingestion path of the jobs
+endpoint, so that the blob store, code changes, rollups and statistics are
+filled as in production. Django must be set up before importing this
+module, see `benchmarks.endpoints`.
+"""
+import datetime
+import random
+
+from django.core.management import call_command
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from api.models import Job, Metric
+from api.serializers import JobSerializer
+
+from .json_fields import generate_blob
+
+# names of the blobs produced by validate_drp, referenced by the metadata
+# of the measurements and read by the apps endpoint
+BLOB_NAMES = ('matchedDataset', 'photomModel', 'astromModel')
+
+CI_DATASETS = ('cfht', 'decam', 'hsc')
+
+
+def create_metrics(n_metrics):
+    """Create ``n_metrics`` metrics, the first ones are the metrics used
+    by default in the squash-bokeh apps"""
+
+    names = ['AM1', 'AM2', 'PA1'][:n_metrics]
+    names += ['M{:03d}'.format(i) for i in range(n_metrics - len(names))]
+
+    for name in names:
+        Metric.objects.create(
+            metric=name, unit='mmag', description='Synthetic metric',
+            operator='<=', parameters={},
+            specs=[{'name': spec, 'unit': 'mmag', 'value': value,
+                    'filter_names': ['r'], 'dependencies': {}}
+                   for spec, value in (('design', 5.0), ('minimum', 8.0),
+                                       ('stretch', 3.0))],
+            reference={'doc': 'LPM-17', 'page': 21,
+                       'url': 'http://ls.st/lpm-17'})
+
+    return names
+
+
+def generate_job(ci_id, ci_dataset, metrics, commits, blob_sources, rng):
+    """Return the payload of a job measuring every metric"""
+
+    blobs = []
+    identifiers = {}
+    for name in BLOB_NAMES:
+        blob = generate_blob(blob_sources, seed=rng.getrandbits(32))
+        blob['name'] = name
+        blobs.append(blob)
+        identifiers[name] = blob['identifier']
+
+    return {'ci_id': str(ci_id), 'ci_name': 'validate_drp',
+            'ci_dataset': ci_dataset, 'ci_label': 'centos-7',
+            'ci_url': 'https://ci.lsst.codes/job/{}/'.format(ci_id),
+            'status': 0, 'blobs': blobs,
+            'measurements': [{'metric': metric,
+                              'value': rng.gauss(5.0, 1.0),
+                              'metadata': {'blobs': identifiers}}
+                             for metric in metrics],
+            'packages': [{'name': name,
+                          'git_url': 'https://github.com/lsst/{}.git'.format(
+                              name),
+                          'git_commit': commit, 'git_branch': 'master',
+                          'build_version': 'b{}'.format(ci_id)}
+                         for name, commit in sorted(commits.items())]}
+
+
+def generate(n_jobs, n_packages, n_metrics, blob_sources=1000,
+             ci_datasets=CI_DATASETS, change_rate=0.05, days=365, seed=0):
+    """Create ``n_jobs`` jobs using ``n_packages`` packages and measuring
+    ``n_metrics`` metrics, with blobs of ``blob_sources`` sources.
+
+    A fraction ``change_rate`` of the packages changes in every job and the
+    jobs are spread over the last ``days`` days.
+    """
+
+    rng = random.Random(seed)
+
+    metrics = create_metrics(n_metrics)
+
+    commits = {'pkg{:04d}'.format(i): '{:040x}'.format(rng.getrandbits(160))
+               for i in range(n_packages)}
+
+    for i in range(n_jobs):
+        for name in commits:
+            if rng.random() < change_rate:
+                commits[name] = '{:040x}'.format(rng.getrandbits(160))
+
+        data = generate_job(i + 1, ci_datasets[i % len(ci_datasets)],
+                            metrics, commits, blob_sources, rng)
+
+        serializer = JobSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+    # jobs are registered now, spread them in time and rebuild the tables
+    # that depend on the job dates
+    start = timezone.now() - datetime.timedelta(days=days)
+    step = datetime.timedelta(days=days) / max(n_jobs, 1)
+
+    for i, job_id in enumerate(Job.objects.order_by('id').
+                               values_list('id', flat=True)):
+        Job.objects.filter(pk=job_id).update(date=start + i * step)
+
+    for command in ('build_code_changes', 'build_rollups',
+                    'reconcile_stats'):
+        call_command(command, stdout=StringIO())
+
+    return metrics
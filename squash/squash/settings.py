@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/1.8/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+import sys
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -51,11 +52,64 @@ INSTALLED_APPS = [
 # Needed by django debug toolbar, it only works locally and when DEBUG=True
 INTERNAL_IPS = '127.0.0.1'
 
+# Cached responses are keyed by the data generation, which changes on
+# every write, see api/cache.py. The cache must be shared by the uWSGI
+# workers, by default it is file based. Set SQUASH_CACHE_BACKEND and
+# SQUASH_CACHE_LOCATION to use another backend, e.g. a Redis server.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'SQUASH_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.environ.get('SQUASH_CACHE_LOCATION',
+                                   '/tmp/squash-api-cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# The tests do not share the cache with the server or with other test runs,
+# it is also cleared before each test, see api/tests.py
+if sys.argv[1:2] == ['test']:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'squash-api-tests',
+        }
+    }
+
 REST_FRAMEWORK_EXTENSIONS = {
-    'DEFAULT_CACHE_RESPONSE_TIMEOUT': 60 * 15
+    'DEFAULT_CACHE_RESPONSE_TIMEOUT': int(
+        os.environ.get('SQUASH_CACHE_TIMEOUT', 60 * 60 * 24)),
+    'DEFAULT_LIST_CACHE_KEY_FUNC': 'api.cache.list_cache_key_func',
+    'DEFAULT_OBJECT_CACHE_KEY_FUNC': 'api.cache.object_cache_key_func',
+    'DEFAULT_ETAG_FUNC': 'api.cache.view_cache_key_func',
+    'DEFAULT_LIST_ETAG_FUNC': 'api.cache.list_cache_key_func',
+    'DEFAULT_OBJECT_ETAG_FUNC': 'api.cache.object_cache_key_func',
 }
 
+# Queue the jobs posted to the jobs endpoint, they are created by the
+# process_ingest_queue command, see api/ingest.py
+SQUASH_ASYNC_INGESTION = os.environ.get(
+    'SQUASH_ASYNC_INGESTION', 'False').lower() == 'true'
+
+# A measurement is flagged as a jump if it is more than
+# SQUASH_REGRESSION_THRESHOLD standard deviations away from the mean of the
+# previous SQUASH_REGRESSION_WINDOW measurements, see api/regressions.py
+SQUASH_REGRESSION_WINDOW = int(
+    os.environ.get('SQUASH_REGRESSION_WINDOW', 10))
+SQUASH_REGRESSION_THRESHOLD = float(
+    os.environ.get('SQUASH_REGRESSION_THRESHOLD', 3))
+
+# Log the read requests running more queries than the budget of their
+# view, see api/instrumentation.py
+SQUASH_QUERY_BUDGET_WARNINGS = os.environ.get(
+    'SQUASH_QUERY_BUDGET_WARNINGS', 'True').lower() == 'true'
+
 MIDDLEWARE_CLASSES = (
+    'api.instrumentation.InstrumentationMiddleware',
+    'api.db_router.ReplicaRoutingMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -93,7 +147,7 @@ WSGI_APPLICATION = 'squash.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'api.backends.mysql',
         'NAME': 'qadb',
         'USER': 'root',
         'PORT': '3306',
@@ -112,6 +166,56 @@ DATABASES = {
 
 DATABASES['default']['HOST'] = os.environ.get('SQUASH_DB_HOST', 'localhost')
 DATABASES['default']['PASSWORD'] = os.environ.get('SQUASH_DB_PASSWORD', '')
+DATABASES['default']['NAME'] = os.environ.get('SQUASH_DB_NAME', 'qadb')
+
+# A local SQLite database file, e.g. to try the read replicas without MySQL
+if os.environ.get('SQUASH_DB_ENGINE', 'mysql') == 'sqlite':
+    DATABASES['default'] = {
+        'ENGINE': 'api.backends.sqlite3',
+        'NAME': os.environ.get('SQUASH_DB_NAME',
+                               os.path.join(BASE_DIR, 'db.sqlite3')),
+    }
+
+# Connections are kept open by the uWSGI worker threads and recycled after
+# SQUASH_DB_CONN_MAX_AGE seconds, idle connections are checked before reuse
+# after SQUASH_DB_HEALTH_CHECK_INTERVAL seconds, see api/db_pool.py
+DATABASES['default']['CONN_MAX_AGE'] = int(
+    os.environ.get('SQUASH_DB_CONN_MAX_AGE', 300))
+
+SQUASH_DB_HEALTH_CHECK_INTERVAL = int(
+    os.environ.get('SQUASH_DB_HEALTH_CHECK_INTERVAL', 30))
+
+# Read replicas of the default database, a comma separated list of hosts,
+# or of database files with SQLite. Safe requests read from a replica,
+# except for SQUASH_DB_PIN_SECONDS after a write, see api/db_router.py
+SQUASH_DB_REPLICAS = []
+
+replica_key = 'NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3') \
+    else 'HOST'
+for replica in os.environ.get('SQUASH_DB_REPLICAS', '').split(','):
+    if replica:
+        alias = 'replica{}'.format(len(SQUASH_DB_REPLICAS) + 1)
+        DATABASES[alias] = dict(DATABASES['default'],
+                                TEST={'MIRROR': 'default'},
+                                **{replica_key: replica})
+        SQUASH_DB_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+SQUASH_DB_PIN_SECONDS = int(os.environ.get('SQUASH_DB_PIN_SECONDS', 10))
+
+# Content-addressed store for the data blobs produced by the jobs, see
+# api/blobstore.py. Jobs keep the blob data inline unless the store is
+# declared durable, i.e. SQUASH_BLOB_ROOT is on a persistent volume.
+SQUASH_BLOB_ROOT = os.environ.get('SQUASH_BLOB_ROOT',
+                                  os.path.join(BASE_DIR, 'blobs'))
+SQUASH_BLOB_STORE_DURABLE = os.environ.get(
+    'SQUASH_BLOB_STORE_DURABLE', 'False').lower() == 'true'
+
+# Maximum size in bytes of a record in the NDJSON job upload, large blobs
+# must be split in blob_chunk records smaller than that
+SQUASH_NDJSON_MAX_RECORD_SIZE = int(
+    os.environ.get('SQUASH_NDJSON_MAX_RECORD_SIZE', 16 * 1024 * 1024))
 
 # set X-Forwarded-Proto header for django rest framework
 # https://docs.djangoproject.com/en/1.11/ref/settings/#secure-proxy-ssl-header
@@ -37,13 +37,24 @@ api_router.register(r'stats', views.StatisticsViewSet,
 api_router.register(r'code_changes', views.CodeChangesViewSet,
                     base_name='code_changes')
 
+api_router.register(r'regressions', views.RegressionViewSet,
+                    base_name='regressions')
+
 api_router.register(r'measurements', views.MeasurementViewSet,
                     base_name='measurements')
 
 api_router.register(r'apps', views.AppViewSet,
                     base_name='apps')
 
+api_router.register(r'blobs', views.BlobViewSet,
+                    base_name='blobs')
+
+api_router.register(r'ingest', views.IngestViewSet,
+                    base_name='ingest')
+
 urlpatterns = [
+    # /metrics is the metric definitions resource
+    url(r'^prometheus/$', views.prometheus_metrics, name='prometheus'),
     url(r'^', include(api_router.urls)),
     url(r'^admin/', admin.site.urls),
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "squash.settings")
 
 application = get_wsgi_application()
+
+# the gauges of the worker processes are removed when they exit
+from api.instrumentation import setup_worker_metrics  # noqa: E402
+
+setup_worker_metrics()